@@ -3,13 +3,24 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 import logging
+import click
 from database import db
 from models.track import Track
 from models.album import Album
 from sqlalchemy import or_
-import requests
-import base64
 from datetime import datetime
+from utils.spotify import spotify_client, SpotifyUnavailableError
+from utils.search_cache import search_cache, artist_cache, normalize_query
+from utils.bulk import insert_ignore
+from utils.write_behind import write_behind
+from utils.album_sync import sync_albums, ALBUM_SYNC_CONCURRENCY
+from utils.chord_index import chord_index
+from utils.chord_similarity import SIMILAR_CHORDS_BACKEND
+from utils.progression_index import progression_index, roman_progression_index
+from utils.progression_bktree import progression_bktree
+from utils.track_catalog import track_catalog
+from utils.track_neighbors import neighbor_table, NEIGHBOR_BATCH_SIZE
+from utils.catalog_search import search_local_catalog, local_search_enabled, SEARCH_LOCAL_MIN_RESULTS
 from flask_migrate import Migrate  # 导入 Flask-Migrate
 
 # 配置日志
@@ -66,22 +77,11 @@ logger.info(f"数据库配置: {app.config['SQLALCHEMY_DATABASE_URI']}")
 db.init_app(app)
 migrate = Migrate(app, db)  # 初始化 Flask-Migrate
 
-def get_spotify_token():
-    """获取 Spotify API 的访问令牌"""
-    auth_string = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
-    auth_base64 = base64.b64encode(auth_string.encode()).decode()
-    headers = {
-        "Authorization": f"Basic {auth_base64}",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    data = {"grant_type": "client_credentials"}
-    response = requests.post("https://accounts.spotify.com/api/token", headers=headers, data=data)
-    
-    if response.status_code != 200:
-        logger.error(f"获取 Spotify 令牌失败: {response.text}")
-        raise Exception(f"获取 Spotify 令牌失败: {response.status_code}")
-    
-    return response.json()['access_token']
+# 和弦进行评分进程池用 spawn/forkserver 启动工作进程时，会以 __mp_main__ 重新执行本文件；
+# 工作进程只需要模块定义，不连接数据库、不启动后台线程
+IS_POOL_WORKER = __name__ == '__mp_main__'
+if not IS_POOL_WORKER:
+    write_behind.init_app(app)  # 启动异步写入队列
 
 def register_blueprints():
     from routes.tracks import tracks_bp
@@ -91,64 +91,71 @@ def register_blueprints():
     app.register_blueprint(albums_bp, url_prefix='/albums')
     app.register_blueprint(midis_bp, url_prefix='/midis')
 
-# 搜索接口
-@app.route('/search', methods=['GET'])
-def search():
-    """搜索单曲、专辑和艺术家，从 Spotify API 获取并存入数据库"""
-    query = request.args.get('q', '').strip()
-    if not query:
-        return jsonify({'results': []}), 200
+def track_row_from_search(track):
+    """把 Spotify 搜索结果中的单曲转换为 tracks 表的一行"""
+    release_date = None
+    if track['album'].get('release_date'):
+        try:
+            release_date = datetime.strptime(track['album']['release_date'], '%Y-%m-%d').date()
+        except ValueError:
+            logger.warning(f"无效的发行日期格式 for track {track['id']}: {track['album']['release_date']}")
 
-    results = []
-    try:
-        # 获取 Spotify 访问令牌
-        token = get_spotify_token()
-        headers = {"Authorization": f"Bearer {token}"}
+    return {
+        'spotify_id': track['id'],
+        'name': track['name'][:255],
+        'artist_name': ', '.join(artist['name'] for artist in track['artists'])[:255],
+        'artist_id': track['artists'][0]['id'],
+        'album_name': track['album']['name'][:255],
+        'album_id': track['album']['id'],
+        'image_url': track['album']['images'][0]['url'] if track['album']['images'] else None,
+        'release_date': release_date,
+        'duration_ms': track['duration_ms'],
+        'track_number': track['track_number'],
+        'popularity': track.get('popularity'),
+        'created_at': datetime.utcnow()
+    }
+
+def album_row_from_search(album):
+    """把 Spotify 搜索结果中的专辑转换为 albums 表的一行"""
+    return {
+        'spotify_id': album['id'],
+        'name': album['name'][:255],
+        'artist_name': ', '.join(artist['name'] for artist in album['artists'])[:255],
+        'artist_id': album['artists'][0]['id'],
+        'image_url': album['images'][0]['url'] if album['images'] else None,
+        'release_date': album['release_date'],
+        'release_date_precision': album['release_date_precision'],
+        'uri': album['uri'],
+        'genres': album.get('genres', []),
+        'label': album.get('label'),
+        'popularity': album.get('popularity'),
+        'total_tracks': album['total_tracks'],
+        'album_type': album['album_type'],
+        'created_at': datetime.utcnow()
+    }
+
+def fetch_search_results(query):
+    """从 Spotify API 搜索单曲、专辑和艺术家，存入数据库并返回 results 列表"""
+    # 缓存的后台刷新线程没有应用上下文，这里显式推入
+    with app.app_context():
+        results = []
         params = {
             "q": query,
             "type": "track,album,artist",
             "limit": 10
         }
-        response = requests.get("https://api.spotify.com/v1/search", headers=headers, params=params)
-        
+        response = spotify_client.get("/search", params=params)
+
         if response.status_code != 200:
             logger.error(f"Spotify API 请求失败: {response.text}")
-            return jsonify({'error': f"Spotify API 请求失败: {response.status_code}"}), 500
-        
+            raise Exception(f"Spotify API 请求失败: {response.status_code}")
+
         spotify_results = response.json()
 
         # 处理单曲
+        track_rows = []
         for track in spotify_results['tracks']['items']:
-            existing_track = Track.query.filter_by(spotify_id=track['id']).first()
-            if not existing_track:
-                release_date = None
-                if track['album'].get('release_date'):
-                    try:
-                        release_date = datetime.strptime(track['album']['release_date'], '%Y-%m-%d').date()
-                    except ValueError:
-                        logger.warning(f"无效的发行日期格式 for track {track['id']}: {track['album']['release_date']}")
-
-                track_data = Track(
-                    spotify_id=track['id'],
-                    name=track['name'],
-                    artist_name=', '.join(artist['name'] for artist in track['artists']),
-                    artist_id=track['artists'][0]['id'],
-                    album_name=track['album']['name'],
-                    album_id=track['album']['id'],
-                    image_url=track['album']['images'][0]['url'] if track['album']['images'] else None,
-                    release_date=release_date,
-                    duration_ms=track['duration_ms'],
-                    track_number=track['track_number'],
-                    popularity=track.get('popularity')
-                )
-                db.session.add(track_data)
-                try:
-                    db.session.commit()
-                    logger.info(f"添加单曲 {track['name']} 到数据库")
-                except Exception as e:
-                    db.session.rollback()
-                    logger.error(f"添加单曲 {track['name']} 失败: {str(e)}")
-
+            track_rows.append(track_row_from_search(track))
             results.append({
                 'id': track['id'],
                 'type': 'track',
@@ -158,32 +165,9 @@ def search():
             })
 
         # 处理专辑
+        album_rows = []
         for album in spotify_results['albums']['items']:
-            existing_album = Album.query.filter_by(spotify_id=album['id']).first()
-            if not existing_album:
-                album_data = Album(
-                    spotify_id=album['id'],
-                    name=album['name'],
-                    artist_name=', '.join(artist['name'] for artist in album['artists']),
-                    artist_id=album['artists'][0]['id'],
-                    image_url=album['images'][0]['url'] if album['images'] else None,
-                    release_date=album['release_date'],
-                    release_date_precision=album['release_date_precision'],
-                    uri=album['uri'],
-                    genres=album.get('genres', []),
-                    label=album.get('label'),
-                    popularity=album.get('popularity'),
-                    total_tracks=album['total_tracks'],
-                    album_type=album['album_type']
-                )
-                db.session.add(album_data)
-                try:
-                    db.session.commit()
-                    logger.info(f"添加专辑 {album['name']} 到数据库")
-                except Exception as e:
-                    db.session.rollback()
-                    logger.error(f"添加专辑 {album['name']} 失败: {str(e)}")
-
+            album_rows.append(album_row_from_search(album))
             results.append({
                 'id': album['id'],
                 'type': 'album',
@@ -192,34 +176,149 @@ def search():
                 'path': f'/dashboard/album/{album["id"]}'
             })
 
-        # 处理艺术家（仅返回，不存入数据库）
-        artist_ids = set()
-        for artist in spotify_results['artists']['items']:
-            if artist['id'] not in artist_ids:
-                results.append({
-                    'id': artist['id'],
-                    'type': 'artist',
-                    'title': artist['name'],
-                    'path': f'/dashboard/artist/{artist["id"]}'
-                })
-                artist_ids.add(artist['id'])
+        # 优先交给异步写入队列；未启用或队列已满时，在单个事务内每张表一条 INSERT ... ON CONFLICT DO NOTHING
+        if not write_behind.enqueue([(Track, track_rows), (Album, album_rows)]):
+            try:
+                added_tracks = insert_ignore(db.session, Track, track_rows)
+                added_albums = insert_ignore(db.session, Album, album_rows)
+                db.session.commit()
+                logger.info(f"搜索 '{query}' 新增 {added_tracks} 首单曲、{added_albums} 张专辑到数据库")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"保存搜索结果失败 for '{query}': {str(e)}")
 
-        return jsonify({'results': results}), 200
+        # 处理艺术家（仅返回，不存入数据库；顺带写入艺术家缓存，供之后本地命中的搜索使用）
+        artists = artist_results(spotify_results['artists']['items'])
+        artist_cache.put(normalize_query(query), artists)
+        results.extend(artists)
+
+        return results
+
+def artist_results(artists):
+    """Spotify 艺术家对象转换为 results 条目（按 id 去重）"""
+    results = []
+    artist_ids = set()
+    for artist in artists:
+        if artist['id'] not in artist_ids:
+            results.append({
+                'id': artist['id'],
+                'type': 'artist',
+                'title': artist['name'],
+                'path': f'/dashboard/artist/{artist["id"]}'
+            })
+            artist_ids.add(artist['id'])
+    return results
+
+def fetch_artist_results(query):
+    """只向 Spotify 请求艺术家（由 artist_cache 在后台调用，失败时缓存保留旧数据）"""
+    response = spotify_client.get("/search", params={"q": query, "type": "artist", "limit": 10})
+    if response.status_code != 200:
+        raise Exception(f"Spotify 艺术家搜索失败: {response.status_code}")
+    return artist_results(response.json()['artists']['items'])
+
+def load_search_results(query):
+    """先查本地曲库，结果不足 SEARCH_LOCAL_MIN_RESULTS 条时再请求 Spotify；返回 (results, 是否来自本地曲库)"""
+    with app.app_context():
+        local_results = []
+        if local_search_enabled(db.session):
+            try:
+                local_results = search_local_catalog(db.session, query)
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"本地搜索失败，改为请求 Spotify: {str(e)}")
+    if len(local_results) >= SEARCH_LOCAL_MIN_RESULTS:
+        logger.info(f"本地命中 {len(local_results)} 条结果 for '{query}'")
+        return local_results, True
+    return fetch_search_results(query), False
 
+# 搜索接口
+@app.route('/search', methods=['GET'])
+def search():
+    """搜索单曲、专辑和艺术家：优先本地曲库，不足时从 Spotify API 获取并存入数据库（结果经进程内缓存）"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'results': []}), 200
+
+    try:
+        key = normalize_query(query)
+        results, from_local = search_cache.get_or_load(key, lambda: load_search_results(query))
+        if from_local:
+            # 本地曲库没有艺术家：取长 TTL 的艺术家缓存，未缓存时后台请求 Spotify，本次先不返回艺术家
+            results = results + (artist_cache.peek(key, lambda: fetch_artist_results(query)) or [])
+        return jsonify({'results': results}), 200
+    except SpotifyUnavailableError as e:
+        logger.warning(f"搜索被限流或熔断: {str(e)}")
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         db.session.rollback()
         logger.error(f"搜索失败: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# 运行状态统计
+@app.route('/stats', methods=['GET'])
+def stats():
+    """返回进程内缓存等组件的计数器，便于调整参数"""
+    return jsonify({
+        'search_cache': search_cache.stats(),
+        'artist_cache': artist_cache.stats(),
+        'write_behind': write_behind.stats(),
+        'spotify': spotify_client.stats(),
+        'chord_index': chord_index.stats(),
+        'progression_index': progression_index.stats(),
+        'roman_progression_index': roman_progression_index.stats(),
+        'progression_bktree': progression_bktree.stats(),
+        'track_catalog': track_catalog.stats(),
+        'track_neighbors': neighbor_table.stats()
+    }), 200
+
+# 命令行：批量同步专辑，例如 flask --app app sync-albums ID1 ID2 或 --file ids.txt
+@app.cli.command('sync-albums')
+@click.argument('album_ids', nargs=-1)
+@click.option('--file', 'id_file', type=click.File('r'), help='每行一个专辑 ID 的文本文件')
+@click.option('--concurrency', default=ALBUM_SYNC_CONCURRENCY, show_default=True, help='同时请求 Spotify 的分组数')
+def sync_albums_command(album_ids, id_file, concurrency):
+    """批量同步 Spotify 专辑数据"""
+    ids = list(album_ids)
+    if id_file:
+        ids.extend(line.strip() for line in id_file if line.strip())
+    if not ids:
+        raise click.UsageError('请提供专辑 ID')
+
+    summary = sync_albums(ids, concurrency=concurrency)
+    for result in summary['results']:
+        if result['status'] != 'ok':
+            click.echo(f"{result['spotify_id']}: {result['error']}")
+    click.echo(
+        f"成功 {summary['synced']}，失败 {summary['failed']}，"
+        f"用时 {summary['elapsed_seconds']} 秒（{summary['albums_per_second']} 张/秒）"
+    )
+
+# 命令行：全量计算 similar-* 的预计算相似歌曲，例如 flask --app app compute-neighbors
+@app.cli.command('compute-neighbors')
+@click.option('--batch-size', default=NEIGHBOR_BATCH_SIZE, show_default=True, help='每批计算并提交的歌曲数')
+def compute_neighbors_command(batch_size):
+    """全量计算每首歌各维度的相似歌曲，写入 track_neighbors 表"""
+    total = neighbor_table.compute_all(db.session, batch_size=batch_size)
+    click.echo(f"已计算 {total} 首歌曲的相似歌曲")
+
 # 注册蓝图和创建数据库表
 with app.app_context():
     register_blueprints()
-    try:
-        db.create_all()
-        logger.info("数据库表创建成功")
-    except Exception as e:
-        logger.error(f"创建数据库表失败: {str(e)}")
-        raise e
+    if not IS_POOL_WORKER:
+        try:
+            db.create_all()
+            logger.info("数据库表创建成功")
+        except Exception as e:
+            logger.error(f"创建数据库表失败: {str(e)}")
+            raise e
+if not IS_POOL_WORKER:
+    if SIMILAR_CHORDS_BACKEND == 'memory':
+        chord_index.init_app(app)  # 后台构建和弦倒排索引
+    progression_index.init_app(app)  # 后台构建和弦进行 n-gram 索引
+    roman_progression_index.init_app(app)  # 级数形式的索引，用于移调不变的搜索
+    progression_bktree.init_app(app)  # 编辑距离 BK 树，用于模糊搜索
+    track_catalog.init_app(app)  # 列式内存曲库（TRACK_CATALOG_ENABLED 开启时加载）
+    neighbor_table.init_app(app)  # 预计算相似歌曲的增量刷新（TRACK_NEIGHBORS_ENABLED 开启时启动）
 
 if __name__ == '__main__':
     logger.info("启动 Flask 应用")
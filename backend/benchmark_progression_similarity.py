@@ -0,0 +1,179 @@
+# benchmark_progression_similarity.py
+# 和弦进行相似度的微基准：在固定语料上逐一核对新旧实现的分数完全相同，并比较耗时。
+# 用法: python benchmark_progression_similarity.py [段落数] [评分进程数]
+# 指定评分进程数时，另外比较 ProgressionIndex.search 单线程与进程池模式的最慢查询耗时和并发吞吐量，
+# 并核对快照发布之后修改过的段落仍得到与单线程相同的结果（单核机器上也强制启用进程池，只用于核对结果）
+import sys
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.progression_index import ProgressionIndex
+from utils.progression_pool import shutdown_executor
+from utils.progression_similarity import ProgressionQuery, calculate_progression_similarity, weighted_similarity
+
+CHORDS = ['C', 'Cm', 'C7', 'D', 'Dm', 'D7', 'E', 'Em', 'E7', 'F', 'Fm', 'G', 'G7', 'Gsus4',
+          'A', 'Am', 'A7', 'Bb', 'B', 'Bm', 'Bdim', 'Eb', 'Ab', 'F#m']
+SEED = 20240601
+
+
+def reference_lcs(str1, str2):
+    """原实现：二维 DP 表"""
+    m, n = len(str1), len(str2)
+    dp = [[0] * (n + 1) for _ in range(m + 1)]
+    for i in range(1, m + 1):
+        for j in range(1, n + 1):
+            if str1[i-1] == str2[j-1]:
+                dp[i][j] = dp[i-1][j-1] + 1
+            else:
+                dp[i][j] = max(dp[i-1][j], dp[i][j-1])
+    return dp[m][n]
+
+
+def reference_consecutive(str1, str2):
+    """原实现：对每对起点向后延伸"""
+    m, n = len(str1), len(str2)
+    max_length = 0
+    for i in range(m):
+        for j in range(n):
+            length = 0
+            while (i + length < m and j + length < n and
+                   str1[i + length] == str2[j + length]):
+                length += 1
+            max_length = max(max_length, length)
+    return max_length
+
+
+def reference_similarity(query_chords, saved_chords):
+    if not query_chords or not saved_chords:
+        return 0.0
+    lcs_length = reference_lcs(query_chords, saved_chords)
+    consecutive_matches = reference_consecutive(query_chords, saved_chords)
+    exact_matches = sum(1 for i in range(min(len(query_chords), len(saved_chords)))
+                        if query_chords[i] == saved_chords[i])
+    contained_matches = sum(1 for chord in query_chords if chord in saved_chords)
+    return weighted_similarity(len(query_chords), lcs_length, consecutive_matches, exact_matches, contained_matches)
+
+
+def progression(rng, length):
+    """常见的流行和弦循环加随机替换，更接近真实段落"""
+    loop = rng.choice([['C', 'G', 'Am', 'F'], ['Am', 'F', 'C', 'G'], ['C', 'Am', 'F', 'G'], ['Dm', 'G7', 'C', 'C']])
+    chords = [loop[i % len(loop)] for i in range(length)]
+    for i in range(length):
+        if rng.random() < 0.3:
+            chords[i] = rng.choice(CHORDS)
+    return chords
+
+
+def build_corpus(size):
+    rng = random.Random(SEED)
+    saved = [progression(rng, rng.randint(4, 32)) for _ in range(size)]
+    queries = [progression(rng, rng.randint(1, 12)) for _ in range(20)]
+    queries.append([])
+    return queries, saved
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label}: {elapsed * 1000:.1f} ms")
+    return result, elapsed
+
+
+def throughput(index, queries, threads, rounds=3, limit=15):
+    """threads 个线程并发执行 rounds 轮全部查询，返回每秒查询数"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(lambda query: index.search(query, limit), queries * rounds))
+    return len(queries) * rounds / (time.perf_counter() - start)
+
+
+def benchmark_pool(queries, saved, workers, limit=15):
+    """返回单线程与进程池模式结果不一致的查询数"""
+    index = ProgressionIndex()
+    for i, chords in enumerate(saved):
+        index._add(i + 1, f'track{i // 3}', f'section{i}', ' '.join(chords))
+    index._built = True
+    index.pool.min_candidates = 1
+    index.pool.min_progressions = 1
+    index.pool.republish_interval = 3600
+    cpu_count = index.pool.cpu_count
+    index.pool.cpu_count = max(cpu_count, 2)
+    index.pool.publish(*index.docs_snapshot())
+
+    mismatches = 0
+    slowest = {'serial': 0.0, 'pool': 0.0}
+    for query in queries:
+        index.pool.workers = 0
+        start = time.perf_counter()
+        serial = index.search(query, limit)
+        slowest['serial'] = max(slowest['serial'], time.perf_counter() - start)
+
+        index.pool.workers = workers
+        index.search(query, limit)  # 预热：启动进程池
+        start = time.perf_counter()
+        pooled = index.search(query, limit)
+        slowest['pool'] = max(slowest['pool'], time.perf_counter() - start)
+        mismatches += serial != pooled
+    print(f"CPU 核数: {cpu_count}")
+    print(f"最慢查询 单线程: {slowest['serial'] * 1000:.1f} ms，{workers} 个进程: {slowest['pool'] * 1000:.1f} ms")
+
+    # 并发吞吐量：请求线程数与进程数相同
+    index.pool.workers = 0
+    serial_qps = throughput(index, queries, workers)
+    index.pool.workers = workers
+    pooled_qps = throughput(index, queries, workers)
+    print(f"{workers} 个并发请求的吞吐量 单线程评分: {serial_qps:.1f} 次/秒，进程池: {pooled_qps:.1f} 次/秒")
+
+    # 快照发布后修改一部分段落（不重新发布），变化的段落在请求线程内评分，结果仍须与单线程一致
+    rng = random.Random(SEED + 1)
+    for progression_id in rng.sample(range(1, len(saved) + 1), min(50, len(saved))):
+        index.update(progression_id, f'track{progression_id}', f'changed{progression_id}',
+                     ' '.join(progression(rng, rng.randint(4, 32))))
+    for query in queries:
+        index.pool.workers = 0
+        serial = index.search(query, limit)
+        index.pool.workers = workers
+        mismatches += serial != index.search(query, limit)
+
+    index.pool.shutdown()
+    shutdown_executor()
+    return mismatches
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    queries, saved = build_corpus(size)
+    print(f"{len(queries)} 个查询 × {len(saved)} 个段落")
+
+    expected, old_time = timed('原实现', lambda: [
+        [reference_similarity(query, chords) for chords in saved] for query in queries
+    ])
+    actual, new_time = timed('位并行实现', lambda: [
+        [ProgressionQuery(query).similarity(chords) for chords in saved] for query in queries
+    ])
+    # 与 ProgressionIndex.search 相同的用法：每个查询只编码一次
+    reused, reused_time = timed('位并行实现（查询只编码一次）', lambda: [
+        [prepared.similarity(chords) for chords in saved]
+        for prepared in (ProgressionQuery(query) for query in queries)
+    ])
+
+    mismatches = sum(
+        1
+        for query, old_row, new_row, reused_row in zip(queries, expected, actual, reused)
+        for chords, old, new, again in zip(saved, old_row, new_row, reused_row)
+        if not (old == new == again == calculate_progression_similarity(query, chords))
+    )
+    print(f"加速比: {old_time / new_time:.1f}x / {old_time / reused_time:.1f}x")
+    if workers:
+        mismatches += benchmark_pool(queries, saved, workers)
+    if mismatches:
+        print(f"{mismatches} 个分数与原实现不一致")
+        return 1
+    print("所有分数与原实现完全一致")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
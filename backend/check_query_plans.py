@@ -0,0 +1,189 @@
+# check_query_plans.py
+# 在临时 schema 中生成大规模模拟曲库，对各路由的查询执行 EXPLAIN，出现顺序扫描（Seq Scan）时以非零状态退出。
+# 所有操作在一个事务中完成，结束时回滚，不会留下任何数据。
+import os
+import sys
+import json
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import array
+from app import app, db
+from models.track import Track, RELEASE_YEAR, YEAR_POPULARITY_ORDER
+from models.comment import Comment
+from models.rating import Rating
+from models.score import Score
+from models.chord_progression import ChordProgression
+from models.midi import Midi
+from models.track_neighbor import TrackNeighbor
+from utils.nearest import nearest_neighbors_statement
+from utils.chord_index import ORDER_PREFIX_LENGTH
+from utils.chord_similarity import SIMILAR_CHORDS_SQL
+from utils.track_neighbors import lookup_statement
+
+# 模拟曲库规模
+CATALOG_TRACKS = int(os.getenv('PLAN_CHECK_TRACKS', '200000'))
+CATALOG_ALBUMS = max(1, CATALOG_TRACKS // 10)
+CHECK_SCHEMA = 'plan_check'
+
+SEED_SQL = [
+    # 约 5% 的歌曲有调性（上传过乐谱），发行日期分布在 1950 年起约 74 年内
+    f"""
+    INSERT INTO albums (spotify_id, name, artist_name, created_at)
+    SELECT 'alb' || g, 'Album ' || g, 'Artist ' || (g % 5000), NOW() - g * INTERVAL '1 minute'
+    FROM generate_series(0, {CATALOG_ALBUMS - 1}) AS g
+    """,
+    f"""
+    INSERT INTO tracks (spotify_id, name, artist_name, album_name, album_id, release_date,
+                        duration_ms, track_number, popularity, key, scale, sections_hash, chord_codes, created_at)
+    SELECT 'trk' || g, 'Track ' || g, 'Artist ' || (g % 5000), 'Album ' || (g % {CATALOG_ALBUMS}),
+           'alb' || (g % {CATALOG_ALBUMS}),
+           DATE '1950-01-01' + (g * 7 % 27000),
+           90000 + (g * 7919 % 360000), g % 15 + 1, g % 100,
+           CASE WHEN g % 20 = 0 THEN (ARRAY['C','C#','D','D#','E','F','F#','G','G#','A','A#','B'])[g / 20 % 12 + 1] END,
+           CASE WHEN g % 20 = 0 THEN (ARRAY['major','minor'])[g / 240 % 2 + 1] END,
+           CASE WHEN g % 20 = 0 THEN md5((g / 20 % 500)::text) || md5((g / 20 % 500)::text) END,
+           CASE WHEN g % 20 = 0 THEN ARRAY[g % 97 + 1, g % 89 + 1, g % 83 + 1, g % 79 + 1] END,
+           NOW() - g * INTERVAL '1 second'
+    FROM generate_series(0, {CATALOG_TRACKS - 1}) AS g
+    """,
+    f"""
+    INSERT INTO comments (album_id, content, "user", score, created_at)
+    SELECT 'alb' || (g % {CATALOG_ALBUMS}), 'comment', 'user' || (g % 1000), g % 5 + 1, NOW() - g * INTERVAL '1 second'
+    FROM generate_series(0, {CATALOG_TRACKS - 1}) AS g
+    """,
+    f"""
+    INSERT INTO ratings (album_id, score, review, "user", created_at)
+    SELECT 'alb' || (g % {CATALOG_ALBUMS}), g % 5 + 1, '', 'user' || (g % 1000), NOW() - g * INTERVAL '1 second'
+    FROM generate_series(0, {CATALOG_TRACKS - 1}) AS g
+    """,
+    f"""
+    INSERT INTO scores (track_id, score_data, created_at)
+    SELECT 'trk' || (g * 4), '{{}}', NOW() - g * INTERVAL '1 second'
+    FROM generate_series(0, {CATALOG_TRACKS // 4 - 1}) AS g
+    """,
+    f"""
+    INSERT INTO chord_progressions (track_id, section_name, section_index, progression, created_at)
+    SELECT 'trk' || (g / 4 * 2), 'Section', g % 4, 'C G Am F', NOW()
+    FROM generate_series(0, {CATALOG_TRACKS // 2 - 1}) AS g
+    """,
+    f"""
+    INSERT INTO midis (track_id, file_path, original_filename, file_size, created_at, updated_at)
+    SELECT 'trk' || (g * 10), '/tmp/x.mid', 'x.mid', 1, NOW(), NOW()
+    FROM generate_series(0, {CATALOG_TRACKS // 10 - 1}) AS g
+    """,
+    # 每首歌每个维度一行预计算结果
+    f"""
+    INSERT INTO track_neighbors (track_id, facet, neighbor_ids, computed_at)
+    SELECT t.id, f.facet,
+           ARRAY[t.id * 7 % {CATALOG_TRACKS} + 1, t.id * 13 % {CATALOG_TRACKS} + 1, t.id * 31 % {CATALOG_TRACKS} + 1], NOW()
+    FROM tracks t CROSS JOIN (VALUES ('key'), ('structure'), ('chords'), ('duration'), ('year')) AS f(facet)
+    """,
+]
+
+
+def route_queries():
+    """与各路由一致的查询（取中间位置的 ID，避免命中边界）"""
+    track_number = CATALOG_TRACKS // 2 // 20 * 20
+    track_id = f'trk{track_number}'
+    # 与 SEED_SQL 中这首歌的 chord_codes 相同
+    chord_codes = [track_number % 97 + 1, track_number % 89 + 1, track_number % 83 + 1, track_number % 79 + 1]
+    album_id = f'alb{CATALOG_ALBUMS // 2}'
+    return {
+        'tracks.get_track': select(Track).where(Track.spotify_id == track_id),
+        'tracks.get_tracks_batch': select(Track).where(
+            # 一页列表视图的歌曲数
+            Track.spotify_id.in_([f'trk{i}' for i in range(0, CATALOG_TRACKS, max(1, CATALOG_TRACKS // 100))])
+        ),
+        'albums.get_album_tracks': select(Track).where(Track.album_id == album_id).order_by(Track.id).limit(11),
+        'tracks.similar-structure': select(Track).where(
+            Track.sections_hash == 'a' * 64, Track.spotify_id != track_id
+        ).order_by(Track.id).limit(10),
+        # 原生 SQL 以 (语句, 参数) 给出，参数与 similar_tracks_sql 一致
+        'tracks.similar-chords': (SIMILAR_CHORDS_SQL, {
+            'codes': sorted(set(chord_codes)),
+            'major_codes': [0],
+            'prefix': chord_codes[:ORDER_PREFIX_LENGTH],
+            'spotify_id': track_id,
+            'limit': 12
+        }),
+        'tracks.similar-key': select(Track).where(
+            Track.spotify_id != track_id, Track.key == 'C', Track.scale == 'major',
+            Track.key.isnot(None), Track.scale.isnot(None)
+        ).limit(10),
+        'tracks.similar-year': select(Track).where(
+            Track.spotify_id != track_id, RELEASE_YEAR == 2000
+        ).order_by(*YEAR_POPULARITY_ORDER).limit(12),
+        'tracks.similar-duration': nearest_neighbors_statement(
+            select(Track).where(Track.spotify_id != track_id, Track.duration_ms.isnot(None)),
+            Track.duration_ms, 211000, 15, lower=181000, upper=241000
+        ),
+        'albums.get_album_comments': select(Comment).where(Comment.album_id == album_id)
+        .order_by(Comment.created_at.desc(), Comment.id.desc()).limit(51),
+        'albums.get_album_ratings': select(Rating).where(Rating.album_id == album_id)
+        .order_by(Rating.created_at.desc(), Rating.id.desc()).limit(51),
+        'tracks.get_scores': select(Score).where(Score.track_id == track_id)
+        .order_by(Score.created_at.desc()).limit(1),
+        'tracks.get_chord_progressions': select(ChordProgression).where(ChordProgression.track_id == track_id)
+        .order_by(ChordProgression.section_index),
+        'midis.get_midi_info': select(Midi).where(Midi.track_id == track_id).limit(1),
+        'track_neighbors.lookup': lookup_statement(track_id, 'year'),
+        'track_neighbors.containing': select(TrackNeighbor.track_id, TrackNeighbor.facet).where(
+            TrackNeighbor.neighbor_ids.overlap(array([CATALOG_TRACKS // 2]))
+        ),
+    }
+
+
+def seq_scans(plan):
+    """返回计划树中所有顺序扫描的表名"""
+    found = []
+    if plan.get('Node Type') == 'Seq Scan':
+        found.append(plan.get('Relation Name'))
+    for child in plan.get('Plans', []):
+        found.extend(seq_scans(child))
+    return found
+
+
+def explain(conn, query):
+    """返回查询计划；ORM 语句以字面量内联参数，原生 SQL 的参数交给驱动绑定"""
+    if isinstance(query, tuple):
+        statement, params = query
+        return conn.execute(text(f"EXPLAIN (FORMAT JSON) {statement.text}"), params).scalar()
+    sql = str(query.compile(dialect=conn.dialect, compile_kwargs={'literal_binds': True}))
+    return conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+
+
+def check():
+    failures = []
+    with app.app_context():
+        with db.engine.connect() as conn:
+            trans = conn.begin()
+            try:
+                conn.execute(text(f"CREATE SCHEMA {CHECK_SCHEMA}"))
+                conn.execute(text(f"SET LOCAL search_path TO {CHECK_SCHEMA}"))
+                db.metadata.create_all(bind=conn)
+                print(f"生成模拟曲库：{CATALOG_TRACKS} 首歌曲 ...")
+                for statement in SEED_SQL:
+                    conn.execute(text(statement))
+                conn.execute(text("ANALYZE"))
+
+                for name, query in route_queries().items():
+                    plan = explain(conn, query)
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    tables = seq_scans(plan[0]['Plan'])
+                    if tables:
+                        failures.append(name)
+                        print(f"[失败] {name}: 顺序扫描 {', '.join(tables)}")
+                    else:
+                        print(f"[通过] {name}")
+            finally:
+                trans.rollback()
+
+    if failures:
+        print(f"{len(failures)} 个查询退化为顺序扫描")
+        return 1
+    print("所有查询均使用索引")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(check())
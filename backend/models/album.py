@@ -23,6 +23,7 @@ class Album(db.Model):
     total_tracks = db.Column(db.Integer, nullable=True)
     album_type = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sync_fingerprint = db.Column(db.String(64), nullable=True)  # 上次同步的 Spotify 数据指纹
 
 
     def to_dict(self):
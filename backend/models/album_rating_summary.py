@@ -0,0 +1,61 @@
+# backend/models/album_rating_summary.py
+from datetime import datetime
+from sqlalchemy.dialects.postgresql import insert
+from database import db
+
+class AlbumRatingSummary(db.Model):
+    """每张专辑的评分汇总，与 ratings 表在同一事务中增量维护"""
+    __tablename__ = 'album_rating_summaries'
+    album_id = db.Column(db.String(100), db.ForeignKey('albums.spotify_id'), primary_key=True)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    count_1 = db.Column(db.Integer, nullable=False, default=0)
+    count_2 = db.Column(db.Integer, nullable=False, default=0)
+    count_3 = db.Column(db.Integer, nullable=False, default=0)
+    count_4 = db.Column(db.Integer, nullable=False, default=0)
+    count_5 = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @staticmethod
+    def record(session, album_id, score):
+        """累加一条 1-5 分的评分（INSERT ... ON CONFLICT DO UPDATE，并发安全）"""
+        table = AlbumRatingSummary.__table__
+        bucket = f'count_{score}'
+        stmt = insert(table).values(
+            album_id=album_id,
+            rating_count=1,
+            rating_sum=score,
+            updated_at=datetime.utcnow(),
+            **{f'count_{i}': int(i == score) for i in range(1, 6)}
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['album_id'],
+            set_={
+                'rating_count': table.c.rating_count + 1,
+                'rating_sum': table.c.rating_sum + score,
+                bucket: table.c[bucket] + 1,
+                'updated_at': stmt.excluded.updated_at
+            }
+        )
+        session.execute(stmt)
+
+    @staticmethod
+    def empty_dict():
+        return {
+            'average_rating': 0.0,
+            'rating_count': 0,
+            'histogram': {str(i): 0 for i in range(1, 6)}
+        }
+
+    def to_dict(self):
+        return {
+            'average_rating': round(self.rating_sum / self.rating_count, 1) if self.rating_count else 0.0,
+            'rating_count': self.rating_count,
+            'histogram': {
+                '1': self.count_1,
+                '2': self.count_2,
+                '3': self.count_3,
+                '4': self.count_4,
+                '5': self.count_5
+            }
+        }
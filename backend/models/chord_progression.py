@@ -4,11 +4,15 @@ from database import db
 
 class ChordProgression(db.Model):
     __tablename__ = 'chord_progressions'
+    __table_args__ = (
+        db.Index('ix_chord_progressions_track_id_section_index', 'track_id', 'section_index'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     track_id = db.Column(db.String(255), db.ForeignKey('tracks.spotify_id'), nullable=False)
     section_name = db.Column(db.String(255), nullable=False)
     section_index = db.Column(db.Integer, nullable=False)
     progression = db.Column(db.Text, nullable=False)
+    roman_progression = db.Column(db.Text, nullable=True)  # 与调无关的级数形式，例如 "I V vi IV"
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
@@ -18,5 +22,6 @@ class ChordProgression(db.Model):
             'section_name': self.section_name,
             'section_index': self.section_index,
             'progression': self.progression,
+            'roman_progression': self.roman_progression,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
\ No newline at end of file
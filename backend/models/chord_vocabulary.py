@@ -0,0 +1,27 @@
+# backend/models/chord_vocabulary.py
+from sqlalchemy.dialects.postgresql import insert
+from database import db
+
+class ChordVocabulary(db.Model):
+    """和弦符号词表：tracks.chord_codes 中保存的是这里的 id"""
+    __tablename__ = 'chord_vocabulary'
+    id = db.Column(db.Integer, primary_key=True)  # 从 1 开始，0 保留给词表中不存在的符号
+    symbol = db.Column(db.Text, nullable=False, unique=True)
+
+    @staticmethod
+    def encode(session, chords, create=True):
+        """把和弦符号列表按原顺序编码为 id 列表；create 为假时不写词表，未知符号编码为 0"""
+        symbols = [str(chord) for chord in chords]
+        distinct = list(dict.fromkeys(symbols))
+        if not distinct:
+            return []
+        if create:
+            session.execute(
+                insert(ChordVocabulary.__table__)
+                .values([{'symbol': symbol} for symbol in distinct])
+                .on_conflict_do_nothing(index_elements=['symbol'])
+            )
+        codes = dict(session.query(ChordVocabulary.symbol, ChordVocabulary.id).filter(
+            ChordVocabulary.symbol.in_(distinct)
+        ).all())
+        return [codes.get(symbol, 0) for symbol in symbols]
@@ -3,6 +3,9 @@ from database import db
 
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (
+        db.Index('ix_comments_album_id_created_at_id', 'album_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     album_id = db.Column(db.String(100), db.ForeignKey('albums.spotify_id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
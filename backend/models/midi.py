@@ -4,6 +4,9 @@ from database import db
 
 class Midi(db.Model):
     __tablename__ = 'midis'
+    __table_args__ = (
+        db.Index('ix_midis_track_id', 'track_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     track_id = db.Column(db.String(255), db.ForeignKey('tracks.spotify_id'), nullable=False)
     file_path = db.Column(db.String(512), nullable=False)  # 存储MIDI文件路径
@@ -25,4 +28,18 @@ class Midi(db.Model):
             'updated_at': self.updated_at.isoformat(),
             'description': self.description,
             'uploaded_by': self.uploaded_by
-        }
\ No newline at end of file
+        }
+
+    def info_dict(self):
+        """/midis/info 返回的信息（不含服务器上的文件路径）"""
+        return {
+            'id': self.id,
+            'track_id': self.track_id,
+            'original_filename': self.original_filename,
+            'file_size': self.file_size,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'description': self.description,
+            'uploaded_by': self.uploaded_by,
+            'midi_url': f"/midis/download/{self.track_id}"
+        }
@@ -3,6 +3,9 @@ from database import db
 
 class Rating(db.Model):
     __tablename__ = 'ratings'
+    __table_args__ = (
+        db.Index('ix_ratings_album_id_created_at_id', 'album_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     album_id = db.Column(db.String(100), db.ForeignKey('albums.spotify_id'), nullable=False)
     score = db.Column(db.Integer, nullable=False)  # 1-5
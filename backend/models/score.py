@@ -4,6 +4,9 @@ from sqlalchemy.dialects.postgresql import JSON
 
 class Score(db.Model):
     __tablename__ = 'scores'
+    __table_args__ = (
+        db.Index('ix_scores_track_id_created_at', 'track_id', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     track_id = db.Column(db.String(255), db.ForeignKey('tracks.spotify_id'), nullable=False)  # 改为 String(255)
     score_data = db.Column(JSON, nullable=False)
@@ -1,12 +1,40 @@
 # 修改 backend/models/track.py
 
 # backend/models/track.py
+import hashlib
 from datetime import datetime
 from database import db
-from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.dialects.postgresql import ARRAY, JSON
+from sqlalchemy.orm import validates
+
+
+def structure_hash(sections):
+    """歌曲结构指纹：段落名去空白、转小写后按顺序拼接取 sha256，无结构时返回 None"""
+    names = [str(name).strip().lower() for name in (sections or [])]
+    names = [name for name in names if name]
+    if not names:
+        return None
+    return hashlib.sha256('\x1f'.join(names).encode('utf-8')).hexdigest()
+
+
+# to_dict 返回的字段（chord_codes、sections_hash 为内部列，不返回）
+DICT_FIELDS = (
+    'id', 'spotify_id', 'name', 'artist_name', 'artist_id', 'album_name', 'album_id', 'image_url',
+    'release_date', 'duration_ms', 'track_number', 'popularity', 'chords', 'key', 'scale', 'sections',
+    'created_at', 'explicit', 'midi_url'
+)
+
 
 class Track(db.Model):
     __tablename__ = 'tracks'
+    __table_args__ = (
+        db.Index('ix_tracks_album_id_id', 'album_id', 'id'),
+        db.Index('ix_tracks_key_scale', 'key', 'scale'),
+        db.Index('ix_tracks_release_date_popularity', 'release_date', 'popularity'),
+        db.Index('ix_tracks_duration_ms', 'duration_ms'),
+        db.Index('ix_tracks_sections_hash', 'sections_hash'),
+        db.Index('ix_tracks_chord_codes', 'chord_codes', postgresql_using='gin'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     spotify_id = db.Column(db.String(255), nullable=False, unique=True)
     name = db.Column(db.String(255), nullable=False)
@@ -20,32 +48,46 @@ class Track(db.Model):
     track_number = db.Column(db.Integer)
     popularity = db.Column(db.Integer)
     chords = db.Column(db.Text)
+    chord_codes = db.Column(ARRAY(db.Integer), nullable=True)  # chords 按 chord_vocabulary 编码后的序列
     key = db.Column(db.String(50))
     scale = db.Column(db.String(50))
     sections = db.Column(JSON, nullable=True)
+    sections_hash = db.Column(db.String(64), nullable=True)  # structure_hash(sections)，用于相同结构查询
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     explicit = db.Column(db.Boolean, nullable=True)
     midi_url = db.Column(db.String(512), nullable=True)  # 添加midi_url字段
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'spotify_id': self.spotify_id,
-            'name': self.name,
-            'artist_name': self.artist_name,
-            'artist_id': self.artist_id,
-            'album_name': self.album_name,
-            'album_id': self.album_id,
-            'image_url': self.image_url,
-            'release_date': str(self.release_date) if self.release_date else None,
-            'duration_ms': self.duration_ms,
-            'track_number': self.track_number,
-            'popularity': self.popularity,
-            'chords': self.chords,
-            'key': self.key,
-            'scale': self.scale,
-            'sections': self.sections,
-            'created_at': str(self.created_at) if self.created_at else None,
-            'explicit': self.explicit,
-            'midi_url': self.midi_url  # 添加到返回数据中
-        }
\ No newline at end of file
+    @validates('sections')
+    def _update_sections_hash(self, key, sections):
+        # 每次设置 sections 时同步更新指纹
+        self.sections_hash = structure_hash(sections)
+        return sections
+
+    @staticmethod
+    def in_order(session, ids, column=None):
+        """一次 IN 查询取出这些歌曲，按 ids 的顺序返回（不存在的跳过）；column 默认为 spotify_id"""
+        column = Track.spotify_id if column is None else column
+        if not ids:
+            return []
+        tracks_by_id = {
+            getattr(track, column.key): track
+            for track in session.query(Track).filter(column.in_(list(ids)))
+        }
+        return [tracks_by_id[track_id] for track_id in ids if track_id in tracks_by_id]
+
+    def to_dict(self, fields=None):
+        """序列化为字典；fields 为字段名列表时只读取这些属性（配合 load_only 时不会加载其余列）"""
+        return {field: self._dict_value(field) for field in (DICT_FIELDS if fields is None else fields)}
+
+    def _dict_value(self, field):
+        value = getattr(self, field)
+        if field in ('release_date', 'created_at'):
+            return str(value) if value else None
+        return value
+
+
+# 发行年份表达式；similar-year 的查询条件必须与索引表达式一致才能使用 ix_tracks_release_year_popularity
+RELEASE_YEAR = db.extract('year', Track.release_date)
+# similar-year 的排序：同一年内按热度从高到低（与 ORDER BY popularity DESC 一致，空值在前），同热度按 id
+YEAR_POPULARITY_ORDER = (Track.popularity.desc(), Track.id)
+db.Index('ix_tracks_release_year_popularity', RELEASE_YEAR, Track.popularity.desc(), Track.id)
@@ -0,0 +1,33 @@
+# backend/models/track_neighbor.py
+from datetime import datetime
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from database import db
+
+class TrackNeighbor(db.Model):
+    """预计算的相似歌曲：每首歌每个维度（key/structure/chords/duration/year）一行"""
+    __tablename__ = 'track_neighbors'
+    __table_args__ = (
+        db.Index('ix_track_neighbors_neighbor_ids', 'neighbor_ids', postgresql_using='gin'),
+    )
+    track_id = db.Column(db.Integer, db.ForeignKey('tracks.id', ondelete='CASCADE'), primary_key=True)
+    facet = db.Column(db.String(16), primary_key=True)
+    neighbor_ids = db.Column(ARRAY(db.Integer), nullable=False)  # tracks.id，按相似度排好序
+    cutoff = db.Column(db.Float, nullable=True)  # 最后一名的排序分数，列表未满时为空
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @staticmethod
+    def store(session, rows):
+        """批量写入 [{'track_id', 'facet', 'neighbor_ids', 'cutoff'}]（INSERT ... ON CONFLICT DO UPDATE）"""
+        if not rows:
+            return
+        now = datetime.utcnow()
+        stmt = insert(TrackNeighbor.__table__).values([{**row, 'computed_at': now} for row in rows])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['track_id', 'facet'],
+            set_={
+                'neighbor_ids': stmt.excluded.neighbor_ids,
+                'cutoff': stmt.excluded.cutoff,
+                'computed_at': stmt.excluded.computed_at
+            }
+        )
+        session.execute(stmt)
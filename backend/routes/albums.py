@@ -2,60 +2,47 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 import logging
-from sqlalchemy.sql import func
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from models.album import Album
 from models.track import Track
 from models.comment import Comment
 from models.rating import Rating
+from models.album_rating_summary import AlbumRatingSummary
 from database import db
+from utils.spotify import spotify_client, SpotifyUnavailableError
+from utils.pagination import keyset_paginate, paginate_request, read_page_args, InvalidCursor
+from utils.album_sync import (
+    sync_albums, upsert_tracks, track_rows, album_values, album_fingerprint, changed_track_rows, fetch_all_tracks,
+    ALBUM_SYNC_MAX_IDS, ALBUM_KEEP_EXISTING_COLUMNS
+)
+from utils.track_catalog import track_catalog
+from utils.track_neighbors import neighbor_table
 import requests
-import os
 
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 评论、评测列表每页默认条数
+LIST_PER_PAGE = 50
+# 批量查询接口单次最多接受的 ID 数
+MAX_BATCH_IDS = 100
+
 # 创建蓝图
 albums_bp = Blueprint('albums', __name__)
 
-# 获取 Spotify 访问令牌
-def get_spotify_token():
-    client_id = os.getenv('SPOTIFY_CLIENT_ID')
-    client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
-    if not client_id or not client_secret:
-        raise ValueError("缺少 Spotify 客户端凭据")
-    auth_url = 'https://accounts.spotify.com/api/token'
-    auth_response = requests.post(auth_url, {
-        'grant_type': 'client_credentials',
-        'client_id': client_id,
-        'client_secret': client_secret
-    })
-    auth_response.raise_for_status()
-    return auth_response.json()['access_token']
-
-# 获取所有专辑（albums），支持分页
+# 获取所有专辑（albums），按 id 游标分页（带 page 参数时按页码分页）
 @albums_bp.route('/', methods=['GET'])
 def get_albums():
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        pagination = Album.query.paginate(page=page, per_page=per_page, error_out=False)
-        albums = pagination.items
+        albums, pagination = paginate_request(Album.query, [Album.id])
         response = {
             'albums': [album.to_dict() for album in albums],
-            'pagination': {
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'current_page': pagination.page,
-                'per_page': pagination.per_page,
-                'has_prev': pagination.has_prev,
-                'has_next': pagination.has_next,
-                'prev_page': pagination.prev_num,
-                'next_page': pagination.next_num
-            }
+            'pagination': pagination
         }
         return jsonify(response), 200
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"获取 albums 失败: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -80,41 +67,42 @@ def get_album_by_spotify_id(spotify_id):
         logger.error(f"获取 album spotify_id {spotify_id} 失败: {str(e)}")
         return jsonify({'error': str(e)}), 404
 
-# 获取专辑下的歌曲（通过 spotify_id），支持分页
+# 获取专辑下的歌曲（通过 spotify_id），按 id 游标分页（带 page 参数时按页码分页）
 @albums_bp.route('/spotify/<string:spotify_id>/tracks', methods=['GET'])
 def get_album_tracks(spotify_id):
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 10, type=int)
-        pagination = Track.query.filter_by(album_id=spotify_id).paginate(page=page, per_page=per_page, error_out=False)
-        tracks = pagination.items
+        tracks, pagination = paginate_request(Track.query.filter_by(album_id=spotify_id), [Track.id])
         response = {
             'tracks': [track.to_dict() for track in tracks],
-            'pagination': {
-                'total': pagination.total,
-                'pages': pagination.pages,
-                'current_page': pagination.page,
-                'per_page': pagination.per_page,
-                'has_prev': pagination.has_prev,
-                'has_next': pagination.has_next,
-                'prev_page': pagination.prev_num,
-                'next_page': pagination.next_num
-            }
+            'pagination': pagination
         }
         return jsonify(response), 200
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"获取 album {spotify_id} 的 tracks 失败: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-# 获取专辑的评论（通过 spotify_id）
+# 获取专辑的评论（通过 spotify_id），按 (created_at, id) 从新到旧游标分页
 @albums_bp.route('/spotify/<string:spotify_id>/comments', methods=['GET'])
 def get_album_comments(spotify_id):
     try:
-        comments = Comment.query.filter_by(album_id=spotify_id).all()
-        return jsonify({
-            'count': len(comments),
-            'items': [comment.to_dict() for comment in comments]
-        }), 200
+        per_page, cursor, include_total = read_page_args(LIST_PER_PAGE)
+        comments, pagination = keyset_paginate(
+            Comment.query.filter_by(album_id=spotify_id), [Comment.created_at, Comment.id], per_page, cursor,
+            descending=True, include_total=include_total
+        )
+        # page_count 为本页条数；评论总数 count 只在 include_total=true 时计算（前端只在第一页请求）
+        response = {
+            'page_count': len(comments),
+            'items': [comment.to_dict() for comment in comments],
+            'pagination': pagination
+        }
+        if include_total:
+            response['count'] = pagination['total']
+        return jsonify(response), 200
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"获取 album {spotify_id} 的 comments 失败: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -141,15 +129,29 @@ def create_album_comment(spotify_id):
         logger.error(f"创建 comment 失败: {str(e)}")
         return jsonify({'error': str(e)}), 400
 
-# 获取专辑的评测（通过 spotify_id）
+# 获取专辑的评测（通过 spotify_id），按 (created_at, id) 从新到旧游标分页
 @albums_bp.route('/spotify/<string:spotify_id>/ratings', methods=['GET'])
 def get_album_ratings(spotify_id):
     try:
-        ratings = Rating.query.filter_by(album_id=spotify_id).all()
+        per_page, cursor, include_total = read_page_args(LIST_PER_PAGE)
+        ratings, pagination = keyset_paginate(
+            Rating.query.filter_by(album_id=spotify_id), [Rating.created_at, Rating.id], per_page, cursor,
+            descending=True, include_total=include_total
+        )
+        # count 为评分总数（取自评分汇总表），page_count 为本页条数
+        if include_total:
+            total = pagination['total']
+        else:
+            summary = db.session.get(AlbumRatingSummary, spotify_id)
+            total = summary.rating_count if summary else 0
         return jsonify({
-            'count': len(ratings),
-            'items': [rating.to_dict() for rating in ratings]
+            'count': total,
+            'page_count': len(ratings),
+            'items': [rating.to_dict() for rating in ratings],
+            'pagination': pagination
         }), 200
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"获取 album {spotify_id} 的 ratings 失败: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -158,19 +160,8 @@ def get_album_ratings(spotify_id):
 @albums_bp.route('/spotify/<string:spotify_id>/average-rating', methods=['GET'])
 def get_album_average_rating(spotify_id):
     try:
-        result = db.session.query(
-            func.avg(Rating.score).label('average_rating'),
-            func.count(Rating.id).label('rating_count')
-        ).filter_by(album_id=spotify_id).first()
-
-        logger.debug(f"Average rating query result for {spotify_id}: {result}") # 调试日志
-        average_rating = float(result.average_rating) if result.average_rating else 0.0
-        rating_count = result.rating_count or 0
-
-        return jsonify({
-            'average_rating': round(average_rating, 1),
-            'rating_count': rating_count
-        }), 200
+        summary = db.session.get(AlbumRatingSummary, spotify_id)
+        return jsonify(summary.to_dict() if summary else AlbumRatingSummary.empty_dict()), 200
     except Exception as e:
         logger.error(f"获取 album {spotify_id} 的平均评分失败: {str(e)}")
         return jsonify({
@@ -178,21 +169,53 @@ def get_album_average_rating(spotify_id):
             'rating_count': 0
         }), 200
 
+# 批量获取多张专辑的平均评分，例如 /albums/average-ratings?ids=ID1,ID2
+@albums_bp.route('/average-ratings', methods=['GET'])
+def get_albums_average_ratings():
+    album_ids = [album_id for album_id in request.args.get('ids', '').split(',') if album_id]
+    if not album_ids:
+        return jsonify({'error': 'ids 为必填项'}), 400
+    if len(album_ids) > MAX_BATCH_IDS:
+        return jsonify({'error': f'单次最多查询 {MAX_BATCH_IDS} 张专辑'}), 400
+
+    try:
+        summaries = {
+            summary.album_id: summary.to_dict()
+            for summary in AlbumRatingSummary.query.filter(AlbumRatingSummary.album_id.in_(album_ids))
+        }
+        return jsonify({
+            'items': {
+                album_id: summaries.get(album_id, AlbumRatingSummary.empty_dict())
+                for album_id in album_ids
+            }
+        }), 200
+    except Exception as e:
+        logger.error(f"批量获取平均评分失败: {str(e)}")
+        return jsonify({'error': '服务器内部错误，请稍后重试'}), 500
+
 # 发布评分和评测
 @albums_bp.route('/spotify/<string:spotify_id>/ratings', methods=['POST'])
 def create_album_rating(spotify_id):
     data = request.get_json()
     if not data or not all(key in data for key in ['score', 'user']):
         return jsonify({'error': 'score 和 user 为必填项'}), 400
+    try:
+        score = int(data['score'])
+    except (TypeError, ValueError):
+        score = None
+    if score is None or not 1 <= score <= 5:
+        return jsonify({'error': 'score 必须是 1-5 的整数'}), 400
 
     try:
         rating = Rating(
             album_id=spotify_id,
-            score=data['score'],
+            score=score,
             review=data.get('review', ''),
             user=data['user']
         )
         db.session.add(rating)
+        # 评分汇总与评分记录在同一事务中更新
+        AlbumRatingSummary.record(db.session, spotify_id, score)
         db.session.commit()
         return jsonify(rating.to_dict()), 201
     except Exception as e:
@@ -279,127 +302,107 @@ def delete_album(id):
         logger.error(f"删除 album {id} 失败: {str(e)}")
         return jsonify({'error': str(e)}), 400
     
+def sync_tracks_one_by_one(session, spotify_id, spotify_data):
+    """逐首写入专辑中的歌曲，单首失败不影响其他歌曲（批量写入失败时的回退路径）"""
+    for track_data in spotify_data.get('tracks', {}).get('items', []):
+        try:
+            # 新事务处理每首歌曲
+            with session.no_autoflush:
+                track = session.query(Track).filter_by(spotify_id=track_data['id']).first()
+            if not track:
+                track = Track(
+                    spotify_id=track_data['id'],
+                    name=track_data.get('name', 'Unknown Song'),
+                    artist_name=', '.join(artist['name'] for artist in track_data.get('artists', []))[:255],
+                    artist_id=', '.join(artist['id'] for artist in track_data.get('artists', []))[:255],
+                    album_name=spotify_data.get('name'),
+                    album_id=spotify_id,
+                    duration_ms=track_data.get('duration_ms'),
+                    track_number=track_data.get('track_number'),
+                    popularity=track_data.get('popularity'),
+                    created_at=datetime.utcnow(),
+                    explicit=track_data.get('explicit', False)
+                )
+                session.add(track)
+            else:
+                track.name = track_data.get('name', track.name)
+                track.artist_name = ', '.join(artist['name'] for artist in track_data.get('artists', []))[:255]
+                track.artist_id = ', '.join(artist['id'] for artist in track_data.get('artists', []))[:255]
+                track.album_name = spotify_data.get('name', track.album_name)
+                track.album_id = spotify_id
+                track.duration_ms = track_data.get('duration_ms', track.duration_ms)
+                track.track_number = track_data.get('track_number', track.track_number)
+                track.popularity = track_data.get('popularity', track.popularity)
+                track.explicit = track_data.get('explicit', track.explicit)
+
+            # 提交每首歌曲事务
+            session.flush()
+            session.commit()
+        except Exception as track_error:
+            logger.error(f"处理歌曲 {track_data['id']} 失败: {str(track_error)}")
+            session.rollback()
+            continue  # 继续处理下一首歌曲
+
 @albums_bp.route('/spotify/<string:spotify_id>/sync', methods=['POST'])
 def sync_album(spotify_id):
     """同步 Spotify 专辑数据"""
     # 使用独立会话，禁用 autoflush
     session = Session(bind=db.engine, autoflush=False)
     try:
-        token = get_spotify_token()
-        headers = {'Authorization': f'Bearer {token}'}
-        url = f'https://api.spotify.com/v1/albums/{spotify_id}'
-        response = requests.get(url, headers=headers)
+        response = spotify_client.get(f'/albums/{spotify_id}')
         response.raise_for_status()
-        spotify_data = response.json()
+        # 超过 50 首的专辑沿 tracks.next 取回剩余歌曲，与批量同步的指纹和歌曲列表保持一致
+        spotify_data = fetch_all_tracks(response.json())
+        fingerprint = album_fingerprint(spotify_data)
 
-        # 处理专辑数据
+        # 处理专辑数据，指纹未变化时跳过全部写入
         album = session.query(Album).filter_by(spotify_id=spotify_id).first()
+        if album and album.sync_fingerprint == fingerprint:
+            logger.info(f"专辑 {spotify_id} 无变化，跳过同步")
+            return jsonify({**album.to_dict(), 'sync': {'skipped': True, 'changed_tracks': []}}), 200
+        values = album_values(spotify_data)
         if not album:
-            album = Album(
-                spotify_id=spotify_id,
-                name=spotify_data.get('name', 'Unknown Album'),
-                artist_name=', '.join(artist['name'] for artist in spotify_data.get('artists', []))[:255],
-                artist_id=', '.join(artist['id'] for artist in spotify_data.get('artists', []))[:255],
-                album_type=spotify_data.get('album_type'),
-                release_date=spotify_data.get('release_date'),
-                release_date_precision=spotify_data.get('release_date_precision'),
-                total_tracks=spotify_data.get('total_tracks', 0),
-                image_url=spotify_data['images'][0]['url'] if spotify_data.get('images') else None,
-                label=spotify_data.get('label'),
-                genres=spotify_data.get('genres', []),
-                popularity=spotify_data.get('popularity'),
-                uri=spotify_data.get('uri'),
-                tracks={
-                    'tracks': {
-                        'items': [
-                            {
-                                'id': track['id'],
-                                'name': track['name'],
-                                'artists': track['artists'],
-                                'duration_ms': track['duration_ms'],
-                                'track_number': track['track_number'],
-                                'popularity': track.get('popularity')
-                            } for track in spotify_data.get('tracks', {}).get('items', [])
-                        ]
-                    }
-                }
-            )
+            album = Album(**values)
             session.add(album)
         else:
-            album.name = spotify_data.get('name', album.name)
-            album.artist_name = ', '.join(artist['name'] for artist in spotify_data.get('artists', []))[:255]
-            album.artist_id = ', '.join(artist['id'] for artist in spotify_data.get('artists', []))[:255]
-            album.album_type = spotify_data.get('album_type', album.album_type)
-            album.release_date = spotify_data.get('release_date', album.release_date)
-            album.release_date_precision = spotify_data.get('release_date_precision', album.release_date_precision)
-            album.total_tracks = spotify_data.get('total_tracks', album.total_tracks)
-            album.image_url = spotify_data['images'][0]['url'] if spotify_data.get('images') else album.image_url
-            album.label = spotify_data.get('label', album.label)
-            album.genres = spotify_data.get('genres', album.genres)
-            album.popularity = spotify_data.get('popularity', album.popularity)
-            album.uri = spotify_data.get('uri', album.uri)
-            album.tracks = {
-                'tracks': {
-                    'items': [
-                        {
-                            'id': track['id'],
-                            'name': track['name'],
-                            'artists': track['artists'],
-                            'duration_ms': track['duration_ms'],
-                            'track_number': track['track_number'],
-                            'popularity': track.get('popularity')
-                        } for track in spotify_data.get('tracks', {}).get('items', [])
-                    ]
-                }
-            }
+            # 与批量同步的 upsert 一致：spotify_id、created_at 不变，部分列仅在新值非空时覆盖
+            for column, value in values.items():
+                if column in ('spotify_id', 'created_at'):
+                    continue
+                if column in ALBUM_KEEP_EXISTING_COLUMNS and value is None:
+                    continue
+                setattr(album, column, value)
 
         # 提交 album 事务
         session.flush()
         session.commit()
 
-        # 处理歌曲数据，分批提交
-        for track_data in spotify_data.get('tracks', {}).get('items', []):
-            try:
-                # 新事务处理每首歌曲
-                with session.no_autoflush:
-                    track = session.query(Track).filter_by(spotify_id=track_data['id']).first()
-                if not track:
-                    track = Track(
-                        spotify_id=track_data['id'],
-                        name=track_data.get('name', 'Unknown Song'),
-                        artist_name=', '.join(artist['name'] for artist in track_data.get('artists', []))[:255],
-                        artist_id=', '.join(artist['id'] for artist in track_data.get('artists', []))[:255],
-                        album_name=spotify_data.get('name'),
-                        album_id=spotify_id,
-                        duration_ms=track_data.get('duration_ms'),
-                        track_number=track_data.get('track_number'),
-                        popularity=track_data.get('popularity'),
-                        created_at=datetime.utcnow(),
-                        explicit=track_data.get('explicit', False)
-                    )
-                    session.add(track)
-                else:
-                    track.name = track_data.get('name', track.name)
-                    track.artist_name = ', '.join(artist['name'] for artist in track_data.get('artists', []))[:255]
-                    track.artist_id = ', '.join(artist['id'] for artist in track_data.get('artists', []))[:255]
-                    track.album_name = spotify_data.get('name', track.album_name)
-                    track.album_id = spotify_id
-                    track.duration_ms = track_data.get('duration_ms', track.duration_ms)
-                    track.track_number = track_data.get('track_number', track.track_number)
-                    track.popularity = track_data.get('popularity', track.popularity)
-                    track.explicit = track_data.get('explicit', track.explicit)
+        # 处理歌曲数据：只有新增或变化的歌曲用一条 INSERT ... ON CONFLICT DO UPDATE 写入，失败时才逐首处理
+        changed_tracks = changed_track_rows(session, track_rows(spotify_data))
+        try:
+            upsert_tracks(session, changed_tracks)
+            # 歌曲全部写入后才记录指纹，否则下次同步会重新处理
+            album.sync_fingerprint = fingerprint
+            session.commit()
+            track_catalog.refresh(session, [row['spotify_id'] for row in changed_tracks])
+            neighbor_table.enqueue(row['spotify_id'] for row in changed_tracks)
+        except SQLAlchemyError as bulk_error:
+            session.rollback()
+            logger.warning(f"批量写入歌曲失败 for {spotify_id}，改为逐首写入: {str(bulk_error)}")
+            sync_tracks_one_by_one(session, spotify_id, spotify_data)
+            track_catalog.refresh(session, [row['spotify_id'] for row in track_rows(spotify_data)])
+            neighbor_table.enqueue(row['spotify_id'] for row in track_rows(spotify_data))
 
-                # 提交每首歌曲事务
-                session.flush()
-                session.commit()
-            except Exception as track_error:
-                logger.error(f"处理歌曲 {track_data['id']} 失败: {str(track_error)}")
-                session.rollback()
-                continue  # 继续处理下一首歌曲
-
-        logger.info(f"成功同步专辑 {spotify_id}")
-        return jsonify(album.to_dict()), 200
+        logger.info(f"成功同步专辑 {spotify_id}，变化歌曲 {len(changed_tracks)} 首")
+        return jsonify({
+            **album.to_dict(),
+            'sync': {'skipped': False, 'changed_tracks': [row['spotify_id'] for row in changed_tracks]}
+        }), 200
 
+    except SpotifyUnavailableError as e:
+        session.rollback()
+        logger.warning(f"Spotify 限流或熔断 for {spotify_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 503
     except requests.exceptions.RequestException as e:
         session.rollback()
         logger.error(f"Spotify API 请求失败 for {spotify_id}: {str(e)}")
@@ -413,4 +416,21 @@ def sync_album(spotify_id):
         logger.error(f"同步专辑失败 for {spotify_id}: {str(e)}")
         return jsonify({'error': '服务器内部错误，请稍后重试'}), 500
     finally:
-        session.close()
\ No newline at end of file
+        session.close()
+
+@albums_bp.route('/sync', methods=['POST'])
+def sync_albums_batch():
+    """批量同步 Spotify 专辑数据"""
+    data = request.get_json(silent=True)
+    album_ids = data.get('ids') if data else None
+    if not isinstance(album_ids, list) or not album_ids:
+        return jsonify({'error': 'ids 为必填项，且必须是专辑 ID 数组'}), 400
+    if len(album_ids) > ALBUM_SYNC_MAX_IDS:
+        return jsonify({'error': f'单次最多同步 {ALBUM_SYNC_MAX_IDS} 张专辑'}), 400
+
+    try:
+        summary = sync_albums([str(album_id) for album_id in album_ids])
+        return jsonify(summary), 200
+    except Exception as e:
+        logger.error(f"批量同步专辑失败: {str(e)}")
+        return jsonify({'error': '服务器内部错误，请稍后重试'}), 500
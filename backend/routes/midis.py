@@ -182,17 +182,7 @@ def get_midi_info(track_id):
         # 返回MIDI信息
         return jsonify({
             'exists': True,
-            'midi_info': {
-                'id': midi.id,
-                'track_id': midi.track_id,
-                'original_filename': midi.original_filename,
-                'file_size': midi.file_size,
-                'created_at': midi.created_at.isoformat(),
-                'updated_at': midi.updated_at.isoformat(),
-                'description': midi.description,
-                'uploaded_by': midi.uploaded_by,
-                'midi_url': f"/midis/download/{track_id}"
-            }
+            'midi_info': midi.info_dict()
         }), 200
     
     except Exception as e:
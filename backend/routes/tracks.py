@@ -1,17 +1,37 @@
 # backend/routes/tracks.py
-from flask import Blueprint, request, jsonify
-from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app
+from datetime import datetime, MINYEAR, MAXYEAR
+import os
 import logging
 import json
-from models.track import Track
+from concurrent.futures import ThreadPoolExecutor, wait
+from models.track import Track, structure_hash, DICT_FIELDS, RELEASE_YEAR, YEAR_POPULARITY_ORDER
 from models.score import Score
 from models.chord_progression import ChordProgression
+from models.chord_vocabulary import ChordVocabulary
+from models.midi import Midi
+from utils.chord_index import chord_index, parse_chords
+from utils.chord_similarity import similar_tracks_sql, SIMILAR_CHORDS_BACKEND
+from utils.progression_index import progression_index, roman_progression_index
+from utils.roman_numerals import roman_progression, roman_progression_text
+from utils.progression_bktree import progression_bktree
+from utils.nearest import nearest_neighbors
+from utils.track_catalog import track_catalog
+from utils.track_neighbors import neighbor_table
 from database import db
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 logger = logging.getLogger(__name__)
 tracks_bp = Blueprint('tracks', __name__)
 
+# search-by-progression?mode=fuzzy 允许的最大编辑距离
+MAX_FUZZY_DISTANCE = 3
+# mode=fuzzy 响应中 progressions 列表的默认条数和上限（progression_count 为匹配总数）
+FUZZY_PROGRESSIONS_LIMIT = 100
+MAX_FUZZY_PROGRESSIONS_LIMIT = 500
+# 批量获取歌曲单次最多接受的 ID 数
+TRACK_BATCH_MAX_IDS = int(os.getenv('TRACK_BATCH_MAX_IDS', '500'))
+
 @tracks_bp.route('/spotify/<string:spotify_id>', methods=['GET'])
 def get_track(spotify_id):
     """获取歌曲信息"""
@@ -28,6 +48,49 @@ def get_track(spotify_id):
     finally:
         session.close()
 
+@tracks_bp.route('/batch', methods=['POST'])
+def get_tracks_batch():
+    """批量获取歌曲：{"ids": [...], "fields": [...]}，一次 IN 查询，按请求顺序返回
+
+    不存在的 ID 在 tracks 中对应位置为 null，并列入 missing；fields 可选，只读取并返回这些字段（始终包含 spotify_id）
+    """
+    data = request.get_json(silent=True)
+    spotify_ids = data.get('ids') if data else None
+    if not isinstance(spotify_ids, list) or not spotify_ids:
+        return jsonify({'error': 'ids 为必填项，且必须是歌曲 ID 数组'}), 400
+    if len(spotify_ids) > TRACK_BATCH_MAX_IDS:
+        return jsonify({'error': f'单次最多获取 {TRACK_BATCH_MAX_IDS} 首歌曲'}), 400
+    fields = data.get('fields')
+    if fields is not None:
+        if not isinstance(fields, list) or not all(isinstance(field, str) for field in fields):
+            return jsonify({'error': 'fields 必须是字段名数组'}), 400
+        unknown = [field for field in fields if field not in DICT_FIELDS]
+        if unknown:
+            return jsonify({'error': f"未知的字段: {', '.join(unknown)}，可选: {', '.join(DICT_FIELDS)}"}), 400
+        fields = list(dict.fromkeys(['spotify_id', *fields]))
+
+    spotify_ids = [str(spotify_id) for spotify_id in spotify_ids]
+    session = db.session()
+    try:
+        query = session.query(Track).filter(Track.spotify_id.in_(set(spotify_ids)))
+        if fields is not None:
+            # 列表视图不需要的列（sections、chords 等）不从数据库读取
+            query = query.options(load_only(*(getattr(Track, field) for field in fields)))
+        tracks_by_id = {track.spotify_id: track for track in query}
+        missing = [spotify_id for spotify_id in dict.fromkeys(spotify_ids) if spotify_id not in tracks_by_id]
+        return jsonify({
+            'tracks': [
+                tracks_by_id[spotify_id].to_dict(fields) if spotify_id in tracks_by_id else None
+                for spotify_id in spotify_ids
+            ],
+            'missing': missing
+        }), 200
+    except Exception as e:
+        logger.error(f"批量获取歌曲失败: {str(e)}")
+        return jsonify({'error': '服务器内部错误，请稍后重试'}), 500
+    finally:
+        session.close()
+
 @tracks_bp.route('/spotify/<string:spotify_id>/scores', methods=['GET'])
 def get_scores(spotify_id):
     """获取歌曲的最新乐谱"""
@@ -73,6 +136,7 @@ def upload_chords(spotify_id):
             return jsonify({'error': '歌曲不存在'}), 404
 
         # 提取调性
+        previous_key = (track.key, track.scale)
         keys = score_data.get('keys', [])
         if keys:
             key_info = keys[0]
@@ -104,6 +168,8 @@ def upload_chords(spotify_id):
                 chord_list.append(chord_name)
 
         track.chords = json.dumps(chord_list) if chord_list else track.chords
+        if chord_list:
+            track.chord_codes = ChordVocabulary.encode(session, chord_list)
         logger.info(f"更新和弦: {track.chords}")
 
         # 提取歌曲结构（仅 name）
@@ -116,6 +182,13 @@ def upload_chords(spotify_id):
         track.sections = section_names if section_names else []
         logger.info(f"更新歌曲结构: {track.sections}")
 
+        # 调性变化后重新计算该歌曲各段落的级数形式
+        reanalyzed = []
+        if (track.key, track.scale) != previous_key:
+            reanalyzed = session.query(ChordProgression).filter_by(track_id=spotify_id).all()
+            for progression in reanalyzed:
+                progression.roman_progression = roman_progression_text(progression.progression, track.key, track.scale)
+
         # 检查 scores 表是否已有记录
         with session.no_autoflush:  # 禁用 autoflush
             score = session.query(Score).filter_by(track_id=spotify_id).order_by(Score.created_at.desc()).first()
@@ -138,6 +211,11 @@ def upload_chords(spotify_id):
         # 提交事务
         session.flush()  # 手动刷新
         session.commit()
+        chord_index.update(track.id, track.spotify_id, track.chords)
+        track_catalog.refresh(session, [track.spotify_id])
+        neighbor_table.enqueue([track.spotify_id])
+        for progression in reanalyzed:
+            roman_progression_index.update(progression.id, progression.track_id, progression.section_name, progression.roman_progression)
         logger.info(f"成功保存乐谱 for track {spotify_id}")
 
         return jsonify({
@@ -157,32 +235,166 @@ def upload_chords(spotify_id):
     finally:
         session.close()
 
+def _load_track(session, spotify_id, current_track):
+    """单独的路由按需查询当前歌曲；聚合接口传入已经加载的歌曲"""
+    if current_track is None:
+        current_track = session.query(Track).filter_by(spotify_id=spotify_id).first()
+    return current_track
+
+def similar_structure_tracks(session, spotify_id, current_track=None, precomputed=True):
+    """具有相同歌曲结构的其他歌曲，最多10首"""
+    # 优先读取预计算的相似歌曲，没有时实时计算
+    neighbors = neighbor_table.lookup(session, spotify_id, 'structure') if precomputed else None
+    if neighbors is not None:
+        return neighbors
+
+    # 启用列式曲库时在内存中筛选，只取最终的10首
+    if track_catalog.has(spotify_id):
+        return Track.in_order(session, track_catalog.similar_structure(spotify_id, 10))
+
+    # 获取当前歌曲的结构
+    current_track = _load_track(session, spotify_id, current_track)
+    sections_hash = structure_hash(current_track.sections) if current_track else None
+    if not sections_hash:
+        logger.info(f"歌曲 {spotify_id} 无结构数据")
+        return []
+    
+    # 按结构指纹等值查询（ix_tracks_sections_hash），最多返回10首
+    return session.query(Track).filter(
+        Track.sections_hash == sections_hash,
+        Track.spotify_id != spotify_id
+    ).order_by(Track.id).limit(10).all()
+
+def similar_key_tracks(session, spotify_id, current_track=None, precomputed=True):
+    """具有相同调性的其他歌曲，最多10首"""
+    # 优先读取预计算的相似歌曲，没有时实时计算
+    neighbors = neighbor_table.lookup(session, spotify_id, 'key') if precomputed else None
+    if neighbors is not None:
+        return neighbors
+
+    # 启用列式曲库时在内存中筛选，只取最终的10首
+    if track_catalog.has(spotify_id):
+        return Track.in_order(session, track_catalog.similar_key(spotify_id, 10))
+
+    # 获取当前歌曲的调性
+    current_track = _load_track(session, spotify_id, current_track)
+    if not current_track or not current_track.key or not current_track.scale:
+        logger.info(f"歌曲 {spotify_id} 无调性数据")
+        return []
+    
+    # 获取所有具有相同调性的其他歌曲
+    return session.query(Track).filter(
+        Track.spotify_id != spotify_id,
+        Track.key == current_track.key,
+        Track.scale == current_track.scale,
+        Track.key.isnot(None),
+        Track.scale.isnot(None)
+    ).limit(10).all()
+
+def similar_year_tracks(session, spotify_id, year=None, current_track=None, precomputed=True):
+    """同一年发行的其他歌曲中最热门的12首；未指定年份时使用当前歌曲的发行年份"""
+    if year is None:
+        # 未指定年份时优先读取预计算的相似歌曲
+        neighbors = neighbor_table.lookup(session, spotify_id, 'year') if precomputed else None
+        if neighbors is not None:
+            return neighbors
+    # 指定年份时只需曲库加载完成；否则当前歌曲的发行日期也要从曲库读取
+    use_catalog = track_catalog.ready if year is not None else track_catalog.has(spotify_id)
+    if year is None:
+        # 如果没有提供年份，尝试从当前歌曲中获取
+        if use_catalog:
+            release_date = track_catalog.release_date(spotify_id)
+        else:
+            current_track = _load_track(session, spotify_id, current_track)
+            release_date = current_track.release_date if current_track else None
+        if not release_date:
+            logger.info(f"歌曲 {spotify_id} 无发行日期数据")
+            return []
+            
+        # 从日期中提取年份
+        year = release_date.year
+    
+    # 获取同一年发行的其他歌曲，按热度排序（按年份、热度索引只扫描该年最热门的几行）
+    if use_catalog:
+        return Track.in_order(session, track_catalog.similar_year(spotify_id, year, 12))
+    return session.query(Track).filter(
+        Track.spotify_id != spotify_id,
+        RELEASE_YEAR == year
+    ).order_by(*YEAR_POPULARITY_ORDER).limit(12).all()
+
+def similar_duration_tracks(session, spotify_id, duration_ms=None, range_seconds=None,
+                            current_track=None, precomputed=True):
+    """时长相差 range_seconds（默认30秒）以内、最接近的其他歌曲，最多15首；未指定时长时使用当前歌曲的时长"""
+    if duration_ms is None and range_seconds is None:
+        # 使用默认参数时优先读取预计算的相似歌曲
+        neighbors = neighbor_table.lookup(session, spotify_id, 'duration') if precomputed else None
+        if neighbors is not None:
+            return neighbors
+    
+    # 指定时长时只需曲库加载完成；否则当前歌曲的时长也要从曲库读取
+    use_catalog = track_catalog.ready if duration_ms is not None else track_catalog.has(spotify_id)
+    if duration_ms is None:
+        # 如果没有提供持续时间，从当前歌曲获取
+        if use_catalog:
+            duration_ms = track_catalog.duration(spotify_id)
+        else:
+            current_track = _load_track(session, spotify_id, current_track)
+            duration_ms = current_track.duration_ms if current_track else None
+        if not duration_ms:
+            logger.info(f"歌曲 {spotify_id} 无持续时间数据")
+            return []
+    
+    # 计算持续时间范围（毫秒）
+    range_ms = (30 if range_seconds is None else range_seconds) * 1000
+    min_duration = max(0, duration_ms - range_ms)  # 确保不小于0
+    max_duration = duration_ms + range_ms
+    
+    # 查询相似持续时间的歌曲，按持续时间差升序排序（最接近的优先）
+    if use_catalog:
+        return Track.in_order(
+            session, track_catalog.similar_duration(spotify_id, duration_ms, min_duration, max_duration, 15)
+        )
+    return nearest_neighbors(
+        session, Track, Track.duration_ms, duration_ms, 15,
+        filters=(Track.spotify_id != spotify_id,),
+        lower=min_duration, upper=max_duration
+    )
+
+def similar_chord_tracks(session, spotify_id, current_track=None, precomputed=True):
+    """和弦相似的其他歌曲，最多12首"""
+    # 优先读取预计算的相似歌曲，没有时实时计算
+    neighbors = neighbor_table.lookup(session, spotify_id, 'chords') if precomputed else None
+    if neighbors is not None:
+        return neighbors
+
+    # 获取当前歌曲的和弦
+    current_track = _load_track(session, spotify_id, current_track)
+    if not current_track or not current_track.chords:
+        logger.info(f"歌曲 {spotify_id} 无和弦数据")
+        return []
+    
+    # 解析和弦数据 - 期望是一个和弦数组: ['C', 'E', 'F', ...]，非 JSON 时按逗号分隔
+    current_chords = parse_chords(current_track.chords)
+    if not current_chords:
+        logger.info(f"无法解析歌曲 {spotify_id} 的和弦数据")
+        return []
+    
+    logger.info(f"当前歌曲和弦: {current_chords}")
+        
+    # 只对至少有2个相同和弦的歌曲评分，取前12首（默认由 Postgres 的 GIN 索引完成）
+    if SIMILAR_CHORDS_BACKEND == 'memory':
+        ranked = chord_index.similar(spotify_id, current_chords, limit=12)
+    else:
+        ranked = similar_tracks_sql(session, spotify_id, current_chords, limit=12,
+                                    chord_codes=current_track.chord_codes)
+    return Track.in_order(session, [track_id for track_id, _ in ranked])
+
 @tracks_bp.route('/spotify/<string:spotify_id>/similar-structure', methods=['GET'])
 def get_similar_structure_tracks(spotify_id):
     """获取具有相同歌曲结构的其他歌曲"""
     session = db.session()
     try:
-        # 获取当前歌曲的结构
-        current_track = session.query(Track).filter_by(spotify_id=spotify_id).first()
-        if not current_track or not current_track.sections:
-            logger.info(f"歌曲 {spotify_id} 无结构数据")
-            return jsonify({"tracks": []}), 200
-        
-        # 获取所有有sections数据的其他歌曲
-        all_tracks = session.query(Track).filter(
-            Track.spotify_id != spotify_id,
-            Track.sections.isnot(None)
-        ).all()
-        
-        # 在Python中比较sections的相等性
-        similar_tracks = []
-        current_sections = current_track.sections
-        for track in all_tracks:
-            if track.sections == current_sections:  # Python的列表比较
-                similar_tracks.append(track)
-            if len(similar_tracks) >= 10:  # 最多返回10首
-                break
-        
+        similar_tracks = similar_structure_tracks(session, spotify_id)
         return jsonify({
             "tracks": [track.to_dict() for track in similar_tracks]
         }), 200
@@ -197,21 +409,7 @@ def get_similar_key_tracks(spotify_id):
     """获取具有相同调性的其他歌曲"""
     session = db.session()
     try:
-        # 获取当前歌曲的调性
-        current_track = session.query(Track).filter_by(spotify_id=spotify_id).first()
-        if not current_track or not current_track.key or not current_track.scale:
-            logger.info(f"歌曲 {spotify_id} 无调性数据")
-            return jsonify({"tracks": []}), 200
-        
-        # 获取所有具有相同调性的其他歌曲
-        similar_tracks = session.query(Track).filter(
-            Track.spotify_id != spotify_id,
-            Track.key == current_track.key,
-            Track.scale == current_track.scale,
-            Track.key.isnot(None),
-            Track.scale.isnot(None)
-        ).limit(10).all()
-        
+        similar_tracks = similar_key_tracks(session, spotify_id)
         return jsonify({
             "tracks": [track.to_dict() for track in similar_tracks]
         }), 200
@@ -228,33 +426,15 @@ def get_similar_year_tracks(spotify_id):
     try:
         # 获取请求参数中的年份
         year = request.args.get('year')
-        if not year:
-            # 如果没有提供年份，尝试从当前歌曲中获取
-            current_track = session.query(Track).filter_by(spotify_id=spotify_id).first()
-            if not current_track or not current_track.release_date:
-                logger.info(f"歌曲 {spotify_id} 无发行日期数据")
-                return jsonify({"tracks": []}), 200
-                
-            # 从日期中提取年份
-            if current_track.release_date:
-                year = str(current_track.release_date).split('-')[0]
-            
-        if not year:
-            logger.info("无法确定年份")
-            return jsonify({"tracks": []}), 200
-            
-        # 构建日期范围查询条件（从年份开始到年份结束）
-        year_start = f"{year}-01-01"
-        year_end = f"{year}-12-31"
-        
-        # 获取同一年发行的其他歌曲
-        similar_tracks = session.query(Track).filter(
-            Track.spotify_id != spotify_id,
-            Track.release_date.isnot(None),
-            Track.release_date >= year_start,
-            Track.release_date <= year_end
-        ).order_by(Track.popularity.desc()).limit(12).all()
+        try:
+            year = int(year) if year else None
+            if year is not None and not MINYEAR <= year <= MAXYEAR:
+                raise ValueError(f"year {year} is out of range")
+        except (ValueError, TypeError) as e:
+            logger.error(f"无效的年份: {str(e)}")
+            return jsonify({'error': '无效的年份'}), 400
         
+        similar_tracks = similar_year_tracks(session, spotify_id, year)
         return jsonify({
             "tracks": [track.to_dict() for track in similar_tracks]
         }), 200
@@ -269,43 +449,19 @@ def get_similar_duration_tracks(spotify_id):
     """获取相似时长的其他歌曲"""
     session = db.session()
     try:
-        # 获取请求参数
+        # 获取请求参数（默认以当前歌曲的时长为中心，±30秒范围）
         duration_ms = request.args.get('duration_ms')
-        range_seconds = request.args.get('range_seconds', '30')  # 默认±30秒范围
+        range_seconds = request.args.get('range_seconds')
         
         # 转换参数类型
         try:
-            if duration_ms:
-                duration_ms = int(duration_ms)
-            else:
-                # 如果没有提供持续时间，从当前歌曲获取
-                current_track = session.query(Track).filter_by(spotify_id=spotify_id).first()
-                if not current_track or not current_track.duration_ms:
-                    logger.info(f"歌曲 {spotify_id} 无持续时间数据")
-                    return jsonify({"tracks": []}), 200
-                duration_ms = current_track.duration_ms
-                
-            range_seconds = int(range_seconds)
+            duration_ms = int(duration_ms) if duration_ms else None
+            range_seconds = int(range_seconds) if range_seconds is not None else None
         except (ValueError, TypeError) as e:
             logger.error(f"参数类型转换失败: {str(e)}")
             return jsonify({'error': '无效的参数类型'}), 400
         
-        # 计算持续时间范围（毫秒）
-        range_ms = range_seconds * 1000
-        min_duration = max(0, duration_ms - range_ms)  # 确保不小于0
-        max_duration = duration_ms + range_ms
-        
-        # 查询相似持续时间的歌曲
-        similar_tracks = session.query(Track).filter(
-            Track.spotify_id != spotify_id,
-            Track.duration_ms.isnot(None),
-            Track.duration_ms >= min_duration,
-            Track.duration_ms <= max_duration
-        ).order_by(
-            # 按持续时间差升序排序（最接近的优先）
-            db.func.abs(Track.duration_ms - duration_ms)
-        ).limit(15).all()
-        
+        similar_tracks = similar_duration_tracks(session, spotify_id, duration_ms, range_seconds)
         return jsonify({
             "tracks": [track.to_dict() for track in similar_tracks]
         }), 200
@@ -320,86 +476,7 @@ def get_similar_chord_tracks(spotify_id):
     """获取和弦相似的其他歌曲"""
     session = db.session()
     try:
-        # 获取当前歌曲的和弦
-        current_track = session.query(Track).filter_by(spotify_id=spotify_id).first()
-        
-        if not current_track or not current_track.chords:
-            logger.info(f"歌曲 {spotify_id} 无和弦数据")
-            return jsonify({"tracks": []}), 200
-        
-        # 解析和弦数据
-        current_chords = []
-        try:
-            # 尝试作为JSON解析 - 期望是一个和弦数组: ['C', 'E', 'F', ...]
-            parsed_chords = json.loads(current_track.chords)
-            if isinstance(parsed_chords, list):
-                current_chords = parsed_chords
-            else:
-                logger.warning(f"歌曲 {spotify_id} 的和弦数据格式不符合预期: {current_track.chords}")
-        except (json.JSONDecodeError, TypeError):
-            # 如果不是有效的JSON，尝试作为逗号分隔的字符串处理
-            if isinstance(current_track.chords, str):
-                current_chords = [c.strip() for c in current_track.chords.split(',')]
-        
-        if not current_chords:
-            logger.info(f"无法解析歌曲 {spotify_id} 的和弦数据")
-            return jsonify({"tracks": []}), 200
-        
-        logger.info(f"当前歌曲和弦: {current_chords}")
-            
-        # 查找具有相似和弦的歌曲
-        similar_tracks = []
-        all_tracks = session.query(Track).filter(
-            Track.spotify_id != spotify_id,
-            Track.chords.isnot(None)
-        ).all()
-        
-        # 查找至少有2个相同和弦的歌曲
-        for track in all_tracks:
-            if not track.chords:
-                continue
-                
-            track_chords = []
-            try:
-                # 尝试作为JSON解析
-                parsed_chords = json.loads(track.chords)
-                if isinstance(parsed_chords, list):
-                    track_chords = parsed_chords
-                else:
-                    # 不是期望的数组格式，跳过
-                    continue
-            except (json.JSONDecodeError, TypeError):
-                # 如果不是有效的JSON，尝试作为逗号分隔的字符串处理
-                if isinstance(track.chords, str):
-                    track_chords = [c.strip() for c in track.chords.split(',')]
-            
-            if not track_chords:
-                continue
-                
-            # 计算两个歌曲之间的和弦重叠
-            common_chords = set(current_chords) & set(track_chords)
-            
-            # 如果有至少2个共同和弦，认为是相似的
-            if len(common_chords) >= 2:
-                # 计算一个相似度分数 - 调整权重使共同和弦更重要
-                common_ratio = len(common_chords) / len(track_chords)
-                order_similarity = 0.0
-                
-                # 加分项：如果和弦顺序也相似（最多考虑前4个）
-                for i in range(min(4, len(current_chords), len(track_chords))):
-                    if i < len(current_chords) and i < len(track_chords) and current_chords[i] == track_chords[i]:
-                        order_similarity += 0.1
-                
-                # 综合评分：共同和弦比例 + 顺序相似度 + 额外加成（使用相同主要和弦）
-                major_chord_bonus = 0.1 if "C" in common_chords or "G" in common_chords or "F" in common_chords else 0
-                similarity_score = common_ratio + order_similarity + major_chord_bonus
-                
-                similar_tracks.append((track, similarity_score))
-        
-        # 按相似度排序，取前12首
-        similar_tracks.sort(key=lambda x: x[1], reverse=True)
-        top_tracks = [track for track, score in similar_tracks[:12]]
-        
+        top_tracks = similar_chord_tracks(session, spotify_id)
         return jsonify({
             "tracks": [track.to_dict() for track in top_tracks]
         }), 200
@@ -409,6 +486,98 @@ def get_similar_chord_tracks(spotify_id):
     finally:
         session.close()
 
+# 曲目页聚合接口可以包含的部分：名称 -> 预计算维度与实时计算函数（similar-*），其余部分单独查询
+SIMILAR_PAGE_SECTIONS = {
+    'similar-structure': ('structure', similar_structure_tracks),
+    'similar-key': ('key', similar_key_tracks),
+    'similar-year': ('year', similar_year_tracks),
+    'similar-duration': ('duration', similar_duration_tracks),
+    'similar-chords': ('chords', similar_chord_tracks),
+}
+PAGE_SECTIONS = ('score', 'progressions', 'midi') + tuple(SIMILAR_PAGE_SECTIONS)
+# 曲目页各部分在共享线程池中并发查询（每个部分一个会话和连接）；线程数限制所有请求合计占用的连接数
+PAGE_SECTION_WORKERS = int(os.getenv('PAGE_SECTION_WORKERS', '4'))
+# 每个部分的超时（秒），超时或失败的部分返回 {'error': ...}，其余部分照常返回
+PAGE_SECTION_TIMEOUT = float(os.getenv('PAGE_SECTION_TIMEOUT', '2'))
+page_executor = ThreadPoolExecutor(max_workers=max(1, PAGE_SECTION_WORKERS), thread_name_prefix='track-page')
+
+def _page_section(app, spotify_id, section, track):
+    """在独立会话中查询曲目页的一个部分（在 page_executor 的线程中执行）；track 为已加载的当前歌曲，只读取其属性"""
+    with app.app_context():
+        session = Session(bind=db.engine, autoflush=False)
+        try:
+            if section == 'score':
+                latest_score = session.query(Score).filter_by(track_id=spotify_id).order_by(Score.created_at.desc()).first()
+                return latest_score.to_dict() if latest_score else {'score_data': {}}
+            if section == 'progressions':
+                progressions = session.query(ChordProgression).filter_by(track_id=spotify_id).order_by(ChordProgression.section_index).all()
+                return {'count': len(progressions), 'items': [prog.to_dict() for prog in progressions]}
+            if section == 'midi':
+                midi = session.query(Midi).filter_by(track_id=spotify_id).first()
+                return {'exists': True, 'midi_info': midi.info_dict()} if midi else {'exists': False}
+            _, compute = SIMILAR_PAGE_SECTIONS[section]
+            similar_tracks = compute(session, spotify_id, current_track=track, precomputed=False)
+            return {'tracks': [similar.to_dict() for similar in similar_tracks]}
+        finally:
+            session.close()
+
+@tracks_bp.route('/spotify/<string:spotify_id>/page', methods=['GET'])
+def get_track_page(spotify_id):
+    """曲目页聚合接口：一次返回歌曲信息和 include 指定的部分（逗号分隔，默认全部）
+
+    各部分的内容与对应独立接口（/scores、/chord-progressions、/midis/info、/similar-*，默认参数）的响应相同；
+    预计算的相似歌曲一次批量读取，其余部分并发查询，每个部分最多等待 PAGE_SECTION_TIMEOUT 秒，
+    超时或失败的部分为 {'error': ...}。
+    """
+    include = request.args.get('include')
+    sections = [section.strip() for section in include.split(',') if section.strip()] if include else list(PAGE_SECTIONS)
+    unknown = [section for section in sections if section not in PAGE_SECTIONS]
+    if unknown:
+        return jsonify({'error': f"未知的 include: {', '.join(unknown)}，可选: {', '.join(PAGE_SECTIONS)}"}), 400
+    sections = list(dict.fromkeys(sections))
+
+    session = db.session()
+    try:
+        track = session.query(Track).filter_by(spotify_id=spotify_id).first()
+        if not track:
+            logger.error(f"未找到歌曲: spotify_id={spotify_id}")
+            return jsonify({'error': '歌曲不存在'}), 404
+        page = {'track': track.to_dict()}
+        precomputed = neighbor_table.lookup_many(
+            session, track.id, [SIMILAR_PAGE_SECTIONS[section][0] for section in sections if section in SIMILAR_PAGE_SECTIONS]
+        )
+        results = {}
+        for section in sections:
+            facet = SIMILAR_PAGE_SECTIONS[section][0] if section in SIMILAR_PAGE_SECTIONS else None
+            if facet in precomputed:
+                results[section] = {'tracks': [similar.to_dict() for similar in precomputed[facet]]}
+    except Exception as e:
+        logger.error(f"获取曲目页失败 for track {spotify_id}: {str(e)}")
+        return jsonify({'error': '服务器内部错误，请稍后重试'}), 500
+    finally:
+        # 等待各部分期间不占用连接
+        session.close()
+
+    app = current_app._get_current_object()
+    futures = {
+        page_executor.submit(_page_section, app, spotify_id, section, track): section
+        for section in sections if section not in results
+    }
+    done, not_done = wait(futures, timeout=PAGE_SECTION_TIMEOUT)
+    for future in not_done:
+        future.cancel()
+        logger.error(f"获取曲目页 {futures[future]} 超时 for track {spotify_id}")
+        results[futures[future]] = {'error': '加载超时'}
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except Exception as e:
+            logger.error(f"获取曲目页 {futures[future]} 失败 for track {spotify_id}: {str(e)}")
+            results[futures[future]] = {'error': '服务器内部错误，请稍后重试'}
+
+    page.update((section, results[section]) for section in sections)
+    return jsonify(page), 200
+
 @tracks_bp.route('/spotify/<string:spotify_id>/chord-progressions', methods=['POST'])
 def save_chord_progression(spotify_id):
     """保存歌曲某个段落的和弦进行"""
@@ -437,9 +606,13 @@ def save_chord_progression(spotify_id):
         if existing:
             # 更新现有和弦进行
             existing.progression = data['chordProgression']
+            existing.roman_progression = roman_progression_text(existing.progression, track.key, track.scale)
             existing.section_name = data['sectionName']
             session.flush()
             session.commit()
+            progression_index.update(existing.id, existing.track_id, existing.section_name, existing.progression)
+            progression_bktree.update(existing.id, existing.track_id, existing.section_name, existing.progression)
+            roman_progression_index.update(existing.id, existing.track_id, existing.section_name, existing.roman_progression)
             logger.info(f"更新了歌曲 {spotify_id} 的和弦进行: 段落={data['sectionName']}")
             return jsonify(existing.to_dict()), 200
         else:
@@ -448,11 +621,15 @@ def save_chord_progression(spotify_id):
                 track_id=spotify_id,
                 section_name=data['sectionName'],
                 section_index=data['sectionIndex'],
-                progression=data['chordProgression']
+                progression=data['chordProgression'],
+                roman_progression=roman_progression_text(data['chordProgression'], track.key, track.scale)
             )
             session.add(progression)
             session.flush()
             session.commit()
+            progression_index.update(progression.id, progression.track_id, progression.section_name, progression.progression)
+            progression_bktree.update(progression.id, progression.track_id, progression.section_name, progression.progression)
+            roman_progression_index.update(progression.id, progression.track_id, progression.section_name, progression.roman_progression)
             logger.info(f"添加了歌曲 {spotify_id} 的和弦进行: 段落={data['sectionName']}")
             return jsonify(progression.to_dict()), 201
     
@@ -504,48 +681,33 @@ def search_by_progression():
         if not chords:
             return jsonify({'error': '无效的和弦进行格式'}), 400
         
-        # 首先获取所有已保存的和弦进行
-        all_progressions = session.query(ChordProgression).all()
-        
-        # 保存匹配结果
-        matched_tracks = []
-        
-        # 计算相似度和匹配分数
-        for prog in all_progressions:
-            track_id = prog.track_id
-            saved_progression = prog.progression.split()
-            
-            # 计算匹配分数
-            match_score = calculate_progression_similarity(chords, saved_progression)
-            
-            # 只保留匹配分数大于阈值的结果
-            if match_score > 0.1:  # 10% 的最小匹配度
-                # 检查是否已经添加过该歌曲
-                existing_track = next((t for t in matched_tracks if t['track_id'] == track_id), None)
-                
-                if existing_track:
-                    # 如果已存在该歌曲，保留匹配度更高的那个记录
-                    if match_score > existing_track['match_score']:
-                        existing_track['match_score'] = match_score
-                        existing_track['matched_section'] = prog.section_name
-                else:
-                    # 添加新的匹配记录
-                    matched_tracks.append({
-                        'track_id': track_id,
-                        'match_score': match_score,
-                        'matched_section': prog.section_name
-                    })
-        
-        # 按匹配分数降序排序
-        matched_tracks.sort(key=lambda x: x['match_score'], reverse=True)
-        
-        # 最多返回15首歌曲
-        top_matches = matched_tracks[:15]
+        # mode=relative 时按级数搜索，与调无关；查询的调性可用 key/scale 指定，否则自动判断
+        mode = request.args.get('mode', 'absolute')
+        if mode not in ('absolute', 'relative', 'fuzzy'):
+            return jsonify({'error': 'mode 只能是 absolute、relative 或 fuzzy'}), 400
+        if mode == 'fuzzy':
+            return search_by_progression_fuzzy(session, chords)
+        numerals = None
+        if mode == 'relative':
+            numerals = roman_progression(chords, request.args.get('key'), request.args.get('scale'))
+            if not numerals:
+                return jsonify({'error': '无法分析和弦进行的调性'}), 400
+            logger.info(f"和弦进行级数: {' '.join(numerals)}")
+        
+        # 通过 n-gram 倒排索引找出候选段落，只对可能进入前15的候选精确评分
+        if numerals:
+            top_matches = roman_progression_index.search(numerals, limit=15)
+        else:
+            top_matches = progression_index.search(chords, limit=15)
         
-        # 获取歌曲详细信息
+        # 一次 IN 查询获取歌曲详细信息
+        tracks_by_id = {
+            track.spotify_id: track
+            for track in session.query(Track).filter(Track.spotify_id.in_([match['track_id'] for match in top_matches]))
+        } if top_matches else {}
         result_tracks = []
         for match in top_matches:
-            track = session.query(Track).filter_by(spotify_id=match['track_id']).first()
+            track = tracks_by_id.get(match['track_id'])
             if track:
                 track_data = track.to_dict()
                 # 添加匹配分数和匹配的段落信息
@@ -553,10 +715,13 @@ def search_by_progression():
                 track_data['matched_section'] = match['matched_section']
                 result_tracks.append(track_data)
         
-        return jsonify({
+        response = {
             'count': len(result_tracks),
             'tracks': result_tracks
-        }), 200
+        }
+        if numerals:
+            response['roman_progression'] = ' '.join(numerals)
+        return jsonify(response), 200
         
     except Exception as e:
         logger.error(f"搜索和弦进行失败: {str(e)}")
@@ -564,63 +729,39 @@ def search_by_progression():
     finally:
         session.close()
 
-def calculate_progression_similarity(query_chords, saved_chords):
-    """计算两个和弦进行之间的相似度"""
-    if not query_chords or not saved_chords:
-        return 0.0
-    
-    # 计算最长公共子序列 (LCS)
-    lcs_length = longest_common_subsequence(query_chords, saved_chords)
-    
-    # 计算连续匹配的和弦数量
-    consecutive_matches = longest_consecutive_match(query_chords, saved_chords)
-    
-    # 计算准确匹配的和弦数量
-    exact_matches = sum(1 for i in range(min(len(query_chords), len(saved_chords))) 
-                        if query_chords[i] == saved_chords[i])
-    
-    # 计算包含匹配
-    contained_matches = sum(1 for chord in query_chords if chord in saved_chords)
-    
-    # 使用加权方式计算总体匹配分数
-    total_weight = 0.4 + 0.3 + 0.2 + 0.1  # 权重总和为1
-    
-    # 不同匹配类型的加权得分
-    lcs_score = (lcs_length / len(query_chords)) * 0.4  # 最长公共子序列(40%)
-    consecutive_score = (consecutive_matches / len(query_chords)) * 0.3  # 连续匹配(30%)
-    exact_score = (exact_matches / len(query_chords)) * 0.2  # 精确位置匹配(20%) 
-    contained_score = (contained_matches / len(query_chords)) * 0.1  # 包含匹配(10%)
-    
-    # 总体匹配分数
-    similarity = lcs_score + consecutive_score + exact_score + contained_score
-    
-    return min(1.0, similarity)  # 确保分数不超过1.0
-
-def longest_common_subsequence(str1, str2):
-    """计算最长公共子序列的长度"""
-    m, n = len(str1), len(str2)
-    dp = [[0] * (n + 1) for _ in range(m + 1)]
+def search_by_progression_fuzzy(session, chords):
+    """mode=fuzzy：返回编辑距离不超过 max_distance（默认 1，最大 3）的段落（按距离取前 progressions_limit 个），
+    以及每首歌距离最小的段落"""
+    max_distance = request.args.get('max_distance', 1, type=int)
+    if not 0 <= max_distance <= MAX_FUZZY_DISTANCE:
+        return jsonify({'error': f'max_distance 必须在 0 到 {MAX_FUZZY_DISTANCE} 之间'}), 400
+    progressions_limit = request.args.get('progressions_limit', FUZZY_PROGRESSIONS_LIMIT, type=int)
+    progressions_limit = min(max(progressions_limit, 0), MAX_FUZZY_PROGRESSIONS_LIMIT)
     
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            if str1[i-1] == str2[j-1]:
-                dp[i][j] = dp[i-1][j-1] + 1
-            else:
-                dp[i][j] = max(dp[i-1][j], dp[i][j-1])
+    matches = progression_bktree.search(chords, max_distance)
     
-    return dp[m][n]
-
-def longest_consecutive_match(str1, str2):
-    """计算最长连续匹配片段的长度"""
-    m, n = len(str1), len(str2)
-    max_length = 0
+    # 每首歌取距离最小的段落（matches 已按距离排序），最多返回15首
+    best_by_track = {}
+    for match in matches:
+        best_by_track.setdefault(match['track_id'], match)
+    top_matches = list(best_by_track.values())[:15]
     
-    for i in range(m):
-        for j in range(n):
-            length = 0
-            while (i + length < m and j + length < n and 
-                   str1[i + length] == str2[j + length]):
-                length += 1
-            max_length = max(max_length, length)
+    tracks_by_id = {
+        track.spotify_id: track
+        for track in session.query(Track).filter(Track.spotify_id.in_([match['track_id'] for match in top_matches]))
+    } if top_matches else {}
+    result_tracks = []
+    for match in top_matches:
+        track = tracks_by_id.get(match['track_id'])
+        if track:
+            track_data = track.to_dict()
+            track_data['distance'] = match['distance']
+            track_data['matched_section'] = match['section_name']
+            result_tracks.append(track_data)
     
-    return max_length
\ No newline at end of file
+    return jsonify({
+        'count': len(result_tracks),
+        'tracks': result_tracks,
+        'progression_count': len(matches),
+        'progressions': matches[:progressions_limit]
+    }), 200
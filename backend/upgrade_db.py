@@ -0,0 +1,205 @@
+# upgrade_db.py
+# 按版本顺序执行数据库升级，已执行过的版本记录在 schema_migrations 表中
+from app import app, db
+from sqlalchemy import bindparam, text
+from models.track import Track, structure_hash
+from models.chord_vocabulary import ChordVocabulary
+from models.chord_progression import ChordProgression
+from utils.roman_numerals import roman_progression_text
+from utils.chord_index import parse_chords
+from utils.catalog_search import TRACK_DOCUMENT, ALBUM_DOCUMENT, tsvector_sql
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+class ConcurrentIndex:
+    """CREATE INDEX CONCURRENTLY 步骤：不阻塞表的写入，但不能在事务中执行，由 upgrade() 在自动提交连接上单独执行"""
+
+    def __init__(self, name, definition):
+        self.name = name
+        self.definition = definition
+
+    def run(self, conn):
+        # 上次并发建索引中断会留下无效索引，IF NOT EXISTS 会跳过它，先删除再重建
+        valid = conn.execute(
+            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {'name': self.name}
+        ).scalar()
+        if valid is False:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self.name}"))
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.name} ON {self.definition}"))
+
+
+def backfill_sections_hash(session):
+    """按 id 分批为已有结构数据的歌曲计算 sections_hash（与 structure_hash 保持一致，不在 SQL 中重写归一化规则）"""
+    last_id = 0
+    while True:
+        rows = session.query(Track.id, Track.sections).filter(
+            Track.id > last_id,
+            Track.sections.isnot(None)
+        ).order_by(Track.id).limit(BACKFILL_BATCH_SIZE).all()
+        if not rows:
+            break
+        session.execute(
+            Track.__table__.update()
+            .where(Track.__table__.c.id == bindparam('row_id'))
+            .values(sections_hash=bindparam('hash')),
+            [{'row_id': row.id, 'hash': structure_hash(row.sections)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+def backfill_chord_codes(session):
+    """按 id 分批把已有的 chords 编码为 chord_codes（解析规则与 /similar-chords 相同）"""
+    last_id = 0
+    while True:
+        rows = session.query(Track.id, Track.chords).filter(
+            Track.id > last_id,
+            Track.chords.isnot(None)
+        ).order_by(Track.id).limit(BACKFILL_BATCH_SIZE).all()
+        if not rows:
+            break
+        parsed = [(row.id, [str(chord) for chord in parse_chords(row.chords) or []]) for row in rows]
+        symbols = list(dict.fromkeys(symbol for _, chords in parsed for symbol in chords))
+        vocabulary = dict(zip(symbols, ChordVocabulary.encode(session, symbols)))
+        updates = [
+            {'row_id': row_id, 'codes': [vocabulary[symbol] for symbol in chords]}
+            for row_id, chords in parsed if chords
+        ]
+        if updates:
+            session.execute(
+                Track.__table__.update()
+                .where(Track.__table__.c.id == bindparam('row_id'))
+                .values(chord_codes=bindparam('codes')),
+                updates
+            )
+        last_id = rows[-1].id
+
+
+def backfill_roman_progressions(session):
+    """按 id 分批为已保存的和弦进行计算级数形式（使用歌曲调性，没有时自动判断）"""
+    last_id = 0
+    while True:
+        rows = session.query(ChordProgression.id, ChordProgression.progression, Track.key, Track.scale).outerjoin(
+            Track, Track.spotify_id == ChordProgression.track_id
+        ).filter(ChordProgression.id > last_id).order_by(ChordProgression.id).limit(BACKFILL_BATCH_SIZE).all()
+        if not rows:
+            break
+        updates = [
+            {'row_id': row.id, 'roman': roman_progression_text(row.progression, row.key, row.scale)}
+            for row in rows
+        ]
+        session.execute(
+            ChordProgression.__table__.update()
+            .where(ChordProgression.__table__.c.id == bindparam('row_id'))
+            .values(roman_progression=bindparam('roman')),
+            updates
+        )
+        last_id = rows[-1].id
+
+
+MIGRATIONS = [
+    ('0001_catalog_search_indexes', [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        ConcurrentIndex("ix_tracks_search_tsv", f"tracks USING gin ({tsvector_sql(TRACK_DOCUMENT)})"),
+        ConcurrentIndex("ix_tracks_search_trgm", f"tracks USING gin ({TRACK_DOCUMENT} gin_trgm_ops)"),
+        ConcurrentIndex("ix_albums_search_tsv", f"albums USING gin ({tsvector_sql(ALBUM_DOCUMENT)})"),
+        ConcurrentIndex("ix_albums_search_trgm", f"albums USING gin ({ALBUM_DOCUMENT} gin_trgm_ops)"),
+    ]),
+    ('0002_album_sync_fingerprint', [
+        "ALTER TABLE albums ADD COLUMN IF NOT EXISTS sync_fingerprint VARCHAR(64)",
+    ]),
+    # album_rating_summaries 表由 db.create_all() 创建，这里用现有评分回填
+    ('0003_album_rating_summaries', [
+        """
+        INSERT INTO album_rating_summaries
+            (album_id, rating_count, rating_sum, count_1, count_2, count_3, count_4, count_5, updated_at)
+        SELECT album_id, COUNT(*), SUM(score),
+               COUNT(*) FILTER (WHERE score = 1), COUNT(*) FILTER (WHERE score = 2),
+               COUNT(*) FILTER (WHERE score = 3), COUNT(*) FILTER (WHERE score = 4),
+               COUNT(*) FILTER (WHERE score = 5), NOW()
+        FROM ratings
+        GROUP BY album_id
+        ON CONFLICT (album_id) DO UPDATE SET
+            rating_count = EXCLUDED.rating_count,
+            rating_sum = EXCLUDED.rating_sum,
+            count_1 = EXCLUDED.count_1,
+            count_2 = EXCLUDED.count_2,
+            count_3 = EXCLUDED.count_3,
+            count_4 = EXCLUDED.count_4,
+            count_5 = EXCLUDED.count_5,
+            updated_at = EXCLUDED.updated_at
+        """,
+    ]),
+    # 与各路由的过滤/排序列对应的索引（模型 __table_args__ 中声明了同名索引）
+    ('0004_route_indexes', [
+        ConcurrentIndex("ix_tracks_album_id_id", "tracks (album_id, id)"),
+        ConcurrentIndex("ix_tracks_key_scale", "tracks (key, scale)"),
+        ConcurrentIndex("ix_tracks_release_date_popularity", "tracks (release_date, popularity)"),
+        ConcurrentIndex("ix_tracks_duration_ms", "tracks (duration_ms)"),
+        ConcurrentIndex("ix_comments_album_id_created_at_id", "comments (album_id, created_at, id)"),
+        ConcurrentIndex("ix_ratings_album_id_created_at_id", "ratings (album_id, created_at, id)"),
+        ConcurrentIndex("ix_scores_track_id_created_at", "scores (track_id, created_at)"),
+        ConcurrentIndex("ix_chord_progressions_track_id_section_index", "chord_progressions (track_id, section_index)"),
+        ConcurrentIndex("ix_midis_track_id", "midis (track_id)"),
+    ]),
+    ('0005_track_sections_hash', [
+        "ALTER TABLE tracks ADD COLUMN IF NOT EXISTS sections_hash VARCHAR(64)",
+        backfill_sections_hash,
+        ConcurrentIndex("ix_tracks_sections_hash", "tracks (sections_hash)"),
+    ]),
+    # chord_vocabulary 表由 db.create_all() 创建
+    ('0006_track_chord_codes', [
+        "ALTER TABLE tracks ADD COLUMN IF NOT EXISTS chord_codes INTEGER[]",
+        backfill_chord_codes,
+        ConcurrentIndex("ix_tracks_chord_codes", "tracks USING gin (chord_codes)"),
+    ]),
+    ('0007_roman_progressions', [
+        "ALTER TABLE chord_progressions ADD COLUMN IF NOT EXISTS roman_progression TEXT",
+        backfill_roman_progressions,
+    ]),
+    ('0008_track_release_year_popularity', [
+        ConcurrentIndex("ix_tracks_release_year_popularity",
+                        "tracks ((EXTRACT(year FROM release_date)), popularity DESC, id)"),
+    ]),
+]
+
+
+def upgrade():
+    with app.app_context():
+        db.session.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version VARCHAR(100) PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """))
+        db.session.commit()
+        applied = {row[0] for row in db.session.execute(text("SELECT version FROM schema_migrations"))}
+
+        for version, steps in MIGRATIONS:
+            if version in applied:
+                print(f"{version} 已执行，跳过")
+                continue
+            print(f"执行 {version} ...")
+            try:
+                for step in steps:
+                    # 步骤可以是 SQL 字符串、接收 session 的回填函数，或在事务外执行的 ConcurrentIndex；
+                    # 并发建索引前先提交之前的步骤，所以各步骤都必须可以重复执行（中断后重跑整个版本）
+                    if isinstance(step, ConcurrentIndex):
+                        db.session.commit()
+                        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                            step.run(conn)
+                    elif callable(step):
+                        step(db.session)
+                    else:
+                        db.session.execute(text(step))
+                db.session.execute(text("INSERT INTO schema_migrations (version) VALUES (:version)"), {'version': version})
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"执行 {version} 失败: {str(e)}")
+                raise
+        print("数据库升级完成")
+
+
+if __name__ == '__main__':
+    upgrade()
@@ -0,0 +1,241 @@
+# backend/utils/album_sync.py
+import os
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from sqlalchemy.orm import Session
+from database import db
+from models.album import Album
+from models.track import Track
+from utils.bulk import upsert
+from utils.spotify import spotify_client
+from utils.track_catalog import track_catalog
+from utils.track_neighbors import neighbor_table
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# Spotify /v1/albums?ids= 每次最多 20 个 ID
+SPOTIFY_ALBUMS_PER_REQUEST = 20
+# 同时请求 Spotify 的分组数
+ALBUM_SYNC_CONCURRENCY = int(os.getenv('ALBUM_SYNC_CONCURRENCY', '4'))
+# 单次批量同步最多接受的专辑数
+ALBUM_SYNC_MAX_IDS = int(os.getenv('ALBUM_SYNC_MAX_IDS', '1000'))
+
+# 同步时直接覆盖 / 仅在新值非空时覆盖的列
+ALBUM_UPDATE_COLUMNS = ('artist_name', 'artist_id', 'tracks', 'genres', 'sync_fingerprint')
+ALBUM_KEEP_EXISTING_COLUMNS = (
+    'name', 'album_type', 'release_date', 'release_date_precision', 'total_tracks',
+    'image_url', 'label', 'popularity', 'uri'
+)
+TRACK_UPDATE_COLUMNS = ('name', 'artist_name', 'artist_id', 'album_id')
+TRACK_KEEP_EXISTING_COLUMNS = ('album_name', 'duration_ms', 'track_number', 'popularity', 'explicit')
+
+
+def album_values(spotify_data):
+    """把 Spotify 专辑对象转换为 albums 表的一行"""
+    return {
+        'spotify_id': spotify_data['id'],
+        'name': spotify_data.get('name', 'Unknown Album')[:255],
+        'artist_name': ', '.join(artist['name'] for artist in spotify_data.get('artists', []))[:255],
+        'artist_id': ', '.join(artist['id'] for artist in spotify_data.get('artists', []))[:100],
+        'album_type': spotify_data.get('album_type'),
+        'release_date': spotify_data.get('release_date'),
+        'release_date_precision': spotify_data.get('release_date_precision'),
+        'total_tracks': spotify_data.get('total_tracks', 0),
+        'image_url': spotify_data['images'][0]['url'] if spotify_data.get('images') else None,
+        'label': spotify_data.get('label'),
+        'genres': spotify_data.get('genres', []),
+        'popularity': spotify_data.get('popularity'),
+        'uri': spotify_data.get('uri'),
+        'tracks': {
+            'tracks': {
+                'items': [
+                    {
+                        'id': track['id'],
+                        'name': track['name'],
+                        'artists': track['artists'],
+                        'duration_ms': track['duration_ms'],
+                        'track_number': track['track_number'],
+                        'popularity': track.get('popularity')
+                    } for track in spotify_data.get('tracks', {}).get('items', [])
+                ]
+            }
+        },
+        'created_at': datetime.utcnow()
+    }
+
+
+def track_rows(spotify_data):
+    """把 Spotify 专辑对象中的歌曲转换为 tracks 表的行"""
+    return [
+        {
+            'spotify_id': track_data['id'],
+            'name': track_data.get('name', 'Unknown Song')[:255],
+            'artist_name': ', '.join(artist['name'] for artist in track_data.get('artists', []))[:255],
+            'artist_id': ', '.join(artist['id'] for artist in track_data.get('artists', []))[:255],
+            'album_name': (spotify_data.get('name') or '')[:255] or None,
+            'album_id': spotify_data['id'],
+            'duration_ms': track_data.get('duration_ms'),
+            'track_number': track_data.get('track_number'),
+            'popularity': track_data.get('popularity'),
+            'created_at': datetime.utcnow(),
+            'explicit': track_data.get('explicit', False)
+        } for track_data in spotify_data.get('tracks', {}).get('items', [])
+    ]
+
+
+def album_fingerprint(spotify_data):
+    """对规范化后的专辑及歌曲数据计算指纹，数据未变化时指纹不变"""
+    album = album_values(spotify_data)
+    album.pop('created_at')
+    tracks = [
+        {column: value for column, value in row.items() if column != 'created_at'}
+        for row in track_rows(spotify_data)
+    ]
+    payload = json.dumps({'album': album, 'tracks': tracks}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def changed_track_rows(session, rows):
+    """一次查询比对现有歌曲，只返回新增或内容有变化的行"""
+    if not rows:
+        return []
+    columns = TRACK_UPDATE_COLUMNS + TRACK_KEEP_EXISTING_COLUMNS
+    existing = {
+        row.spotify_id: row
+        for row in session.query(Track.spotify_id, *(getattr(Track, column) for column in columns))
+        .filter(Track.spotify_id.in_([row['spotify_id'] for row in rows]))
+    }
+    changed = []
+    for row in rows:
+        old = existing.get(row['spotify_id'])
+        if old is None:
+            changed.append(row)
+        elif any(row[column] != getattr(old, column) for column in TRACK_UPDATE_COLUMNS):
+            changed.append(row)
+        elif any(row[column] is not None and row[column] != getattr(old, column) for column in TRACK_KEEP_EXISTING_COLUMNS):
+            changed.append(row)
+    return changed
+
+
+def upsert_albums(session, rows):
+    return upsert(session, Album, rows, ALBUM_UPDATE_COLUMNS, ALBUM_KEEP_EXISTING_COLUMNS)
+
+
+def upsert_tracks(session, rows):
+    return upsert(session, Track, rows, TRACK_UPDATE_COLUMNS, TRACK_KEEP_EXISTING_COLUMNS)
+
+
+def fetch_all_tracks(spotify_data):
+    """专辑超过一页（50 首）时，沿 tracks.next 取回剩余歌曲，合并到 spotify_data['tracks']['items']"""
+    tracks = spotify_data.get('tracks') or {}
+    items = list(tracks.get('items', []))
+    next_url = tracks.get('next')
+    while next_url:
+        response = spotify_client.get(next_url)
+        response.raise_for_status()
+        page = response.json()
+        items.extend(page.get('items', []))
+        next_url = page.get('next')
+    spotify_data['tracks'] = {**tracks, 'items': items, 'next': None}
+    return spotify_data
+
+
+def fetch_album_group(album_ids):
+    """一次请求获取最多 20 张专辑；返回与 album_ids 对齐的列表，不存在的专辑为 None"""
+    response = spotify_client.get('/albums', params={'ids': ','.join(album_ids)})
+    response.raise_for_status()
+    albums = response.json().get('albums', [])
+    return [fetch_all_tracks(album) if album else None for album in albums]
+
+
+def _write_group(session, album_ids, albums, results):
+    found = [album for album in albums if album]
+    fingerprints = {album['id']: album_fingerprint(album) for album in found}
+    try:
+        stored = dict(
+            session.query(Album.spotify_id, Album.sync_fingerprint)
+            .filter(Album.spotify_id.in_(list(fingerprints)))
+        ) if fingerprints else {}
+        # 指纹未变化的专辑跳过全部写入
+        changed_albums = [album for album in found if stored.get(album['id']) != fingerprints[album['id']]]
+        album_rows = [
+            {**album_values(album), 'sync_fingerprint': fingerprints[album['id']]}
+            for album in changed_albums
+        ]
+        changed_tracks = changed_track_rows(session, [row for album in changed_albums for row in track_rows(album)])
+        upsert_albums(session, album_rows)
+        upsert_tracks(session, changed_tracks)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"批量写入专辑失败 {album_ids}: {str(e)}")
+        for album_id in album_ids:
+            results[album_id] = {'spotify_id': album_id, 'status': 'error', 'error': '数据库错误'}
+        return
+
+    track_catalog.refresh(session, [row['spotify_id'] for row in changed_tracks])
+    neighbor_table.enqueue(row['spotify_id'] for row in changed_tracks)
+    changed_by_album = {}
+    for row in changed_tracks:
+        changed_by_album.setdefault(row['album_id'], []).append(row['spotify_id'])
+    changed_ids = {album['id'] for album in changed_albums}
+    for album_id, album in zip(album_ids, albums):
+        if album:
+            results[album_id] = {
+                'spotify_id': album_id,
+                'status': 'ok',
+                'tracks': len(album.get('tracks', {}).get('items', [])),
+                'skipped': album['id'] not in changed_ids,
+                'changed_tracks': changed_by_album.get(album['id'], [])
+            }
+        else:
+            results[album_id] = {'spotify_id': album_id, 'status': 'error', 'error': 'Spotify 上不存在该专辑'}
+
+
+def sync_albums(album_ids, concurrency=ALBUM_SYNC_CONCURRENCY):
+    """批量同步专辑：每 20 个 ID 一组并发请求 Spotify，每组一条专辑 upsert + 一条歌曲 upsert，指纹未变化的专辑不写入
+
+    返回 {'results': [...], 'synced', 'failed', 'elapsed_seconds', 'albums_per_second'}，results 与输入顺序一致
+    """
+    album_ids = list(dict.fromkeys(album_id.strip() for album_id in album_ids if album_id and album_id.strip()))
+    groups = [
+        album_ids[i:i + SPOTIFY_ALBUMS_PER_REQUEST]
+        for i in range(0, len(album_ids), SPOTIFY_ALBUMS_PER_REQUEST)
+    ]
+    results = {}
+    started = time.perf_counter()
+
+    session = Session(bind=db.engine, autoflush=False)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(fetch_album_group, group): group for group in groups}
+            # 请求并发进行，写库在当前线程按完成顺序依次执行
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    albums = future.result()
+                except Exception as e:
+                    logger.error(f"Spotify API 请求失败 for {group}: {str(e)}")
+                    for album_id in group:
+                        results[album_id] = {'spotify_id': album_id, 'status': 'error', 'error': '无法获取 Spotify 数据'}
+                    continue
+                _write_group(session, group, albums, results)
+    finally:
+        session.close()
+
+    elapsed = time.perf_counter() - started
+    ordered = [results[album_id] for album_id in album_ids]
+    synced = sum(1 for result in ordered if result['status'] == 'ok')
+    logger.info(f"批量同步 {len(album_ids)} 张专辑完成：成功 {synced}，用时 {elapsed:.2f} 秒")
+    return {
+        'results': ordered,
+        'synced': synced,
+        'failed': len(ordered) - synced,
+        'elapsed_seconds': round(elapsed, 3),
+        'albums_per_second': round(synced / elapsed, 2) if elapsed > 0 else 0.0
+    }
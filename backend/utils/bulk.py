@@ -0,0 +1,39 @@
+# backend/utils/bulk.py
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+
+def _dedupe(rows, key):
+    """按 key 去重，保留最后一次出现的行（同一条 INSERT 不能两次命中同一行）"""
+    unique = {}
+    for row in rows:
+        unique[row[key]] = row
+    return list(unique.values())
+
+
+def insert_ignore(session, model, rows, key='spotify_id'):
+    """一条 INSERT ... ON CONFLICT (key) DO NOTHING 批量写入，返回新插入的行数"""
+    rows = _dedupe(rows, key)
+    if not rows:
+        return 0
+    stmt = insert(model.__table__).values(rows).on_conflict_do_nothing(index_elements=[key])
+    return session.execute(stmt).rowcount
+
+
+def upsert(session, model, rows, update_columns=(), keep_existing_columns=(), key='spotify_id'):
+    """一条 INSERT ... ON CONFLICT (key) DO UPDATE 批量写入
+
+    update_columns 直接用新值覆盖；keep_existing_columns 只有新值非空时才覆盖（COALESCE）
+    """
+    rows = _dedupe(rows, key)
+    if not rows:
+        return 0
+    table = model.__table__
+    stmt = insert(table).values(rows)
+    set_ = {column: stmt.excluded[column] for column in update_columns}
+    set_.update({
+        column: func.coalesce(stmt.excluded[column], table.c[column])
+        for column in keep_existing_columns
+    })
+    stmt = stmt.on_conflict_do_update(index_elements=[key], set_=set_)
+    return session.execute(stmt).rowcount
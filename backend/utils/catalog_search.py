@@ -0,0 +1,98 @@
+# backend/utils/catalog_search.py
+import os
+import logging
+import time
+from sqlalchemy import text
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 是否先查本地曲库：auto（默认）时只有 upgrade_db.py 执行过 0001_catalog_search_indexes 才启用，true/false 强制开关；
+# 本地结果少于 SEARCH_LOCAL_MIN_RESULTS 条时才去请求 Spotify
+SEARCH_LOCAL_ENABLED = os.getenv('SEARCH_LOCAL_ENABLED', 'auto').lower()
+SEARCH_LOCAL_MIN_RESULTS = int(os.getenv('SEARCH_LOCAL_MIN_RESULTS', '5'))
+SEARCH_LOCAL_LIMIT = 10
+CATALOG_SEARCH_MIGRATION = '0001_catalog_search_indexes'
+# 迁移尚未执行时，每隔多少秒重新检查一次（执行 upgrade_db.py 后无需重启）
+MIGRATION_RECHECK_INTERVAL = 300
+
+# 被索引的文本表达式。upgrade_db.py 用同样的表达式建立索引，查询时必须逐字一致才能走索引
+TRACK_DOCUMENT = "(coalesce(name, '') || ' ' || coalesce(artist_name, '') || ' ' || coalesce(album_name, ''))"
+ALBUM_DOCUMENT = "(coalesce(name, '') || ' ' || coalesce(artist_name, ''))"
+# 使用 simple 配置：曲名多语言混杂，不做词干化
+TS_CONFIG = 'simple'
+
+
+def tsvector_sql(document):
+    return f"to_tsvector('{TS_CONFIG}', {document})"
+
+
+def _search_sql(table, columns, document):
+    tsv = tsvector_sql(document)
+    return text(f"""
+        SELECT {columns},
+               ts_rank({tsv}, plainto_tsquery('{TS_CONFIG}', :q)) + word_similarity(:q, {document}) AS rank
+        FROM {table}
+        WHERE {tsv} @@ plainto_tsquery('{TS_CONFIG}', :q)
+           OR :q <% {document}
+        ORDER BY rank DESC
+        LIMIT :limit
+    """)
+
+
+TRACK_SEARCH_SQL = _search_sql('tracks', 'spotify_id, name, artist_name', TRACK_DOCUMENT)
+ALBUM_SEARCH_SQL = _search_sql('albums', 'spotify_id, name, artist_name', ALBUM_DOCUMENT)
+
+
+_migration_state = {'applied': False, 'checked_at': None}
+
+
+def local_search_enabled(session):
+    """本地搜索是否可用；auto 模式下查询 schema_migrations，未执行迁移时 pg_trgm 和索引都不存在"""
+    if SEARCH_LOCAL_ENABLED in ('1', 'true', 'yes'):
+        return True
+    if SEARCH_LOCAL_ENABLED != 'auto':
+        return False
+    if _migration_state['applied']:
+        return True
+    now = time.monotonic()
+    checked_at = _migration_state['checked_at']
+    if checked_at is not None and now - checked_at < MIGRATION_RECHECK_INTERVAL:
+        return False
+    _migration_state['checked_at'] = now
+    try:
+        applied = session.execute(
+            text("SELECT 1 FROM schema_migrations WHERE version = :version"),
+            {'version': CATALOG_SEARCH_MIGRATION}
+        ).first() is not None
+    except Exception:
+        # schema_migrations 表不存在（从未执行过 upgrade_db.py）
+        session.rollback()
+        applied = False
+    if not applied:
+        logger.info(f"{CATALOG_SEARCH_MIGRATION} 尚未执行，搜索直接请求 Spotify")
+    _migration_state['applied'] = applied
+    return applied
+
+
+def search_local_catalog(session, query, limit=SEARCH_LOCAL_LIMIT):
+    """在本地 tracks/albums 表中做全文 + 三元组模糊搜索，返回与 /search 相同格式的结果"""
+    params = {'q': query, 'limit': limit}
+    results = []
+    for row in session.execute(TRACK_SEARCH_SQL, params):
+        results.append({
+            'id': row.spotify_id,
+            'type': 'track',
+            'title': row.name,
+            'artist_name': row.artist_name,
+            'path': f'/dashboard/track/{row.spotify_id}'
+        })
+    for row in session.execute(ALBUM_SEARCH_SQL, params):
+        results.append({
+            'id': row.spotify_id,
+            'type': 'album',
+            'title': row.name,
+            'artist_name': row.artist_name,
+            'path': f'/dashboard/album/{row.spotify_id}'
+        })
+    return results
@@ -0,0 +1,156 @@
+# backend/utils/chord_index.py
+import json
+import logging
+import threading
+from collections import defaultdict
+from database import db
+from models.track import Track
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 至少共享多少个和弦才参与评分；顺序加分最多比较前几个位置；加分的常用和弦
+MIN_COMMON_CHORDS = 2
+ORDER_PREFIX_LENGTH = 4
+MAJOR_CHORDS = ('C', 'G', 'F')
+BUILD_BATCH_SIZE = 5000
+
+
+def parse_chords(raw):
+    """解析 Track.chords：优先按 JSON 数组解析，非 JSON 时按逗号分隔；格式不符返回 None"""
+    if not raw:
+        return None
+    try:
+        parsed = json.loads(raw)
+        return parsed if isinstance(parsed, list) else None
+    except (json.JSONDecodeError, TypeError):
+        if isinstance(raw, str):
+            return [c.strip() for c in raw.split(',')]
+        return None
+
+
+class ChordIndex:
+    """和弦倒排索引：和弦编号 -> 包含该和弦的歌曲
+
+    和弦符号统一编码为整数；每首歌只保留评分需要的信息（和弦总数、前几个和弦、和弦集合），
+    查询时只访问与当前歌曲共享和弦的倒排列表，耗时取决于重叠规模而不是曲库规模。
+    索引只在本进程内维护，多进程部署时各进程分别在启动时构建。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._app = None
+        self._built = False
+        self._codes = {}                  # 和弦符号 -> 编号
+        self._postings = defaultdict(set)  # 和弦编号 -> spotify_id 集合
+        self._docs = {}                   # spotify_id -> (track_id, 和弦总数, 前几个和弦编号, 和弦编号集合)
+
+    def init_app(self, app):
+        """启动时在后台线程构建索引，首次查询前未完成时查询会等待构建结束"""
+        self._app = app
+        threading.Thread(target=self._build_in_context, name='chord-index', daemon=True).start()
+
+    def _build_in_context(self):
+        try:
+            with self._app.app_context():
+                self.ensure_built()
+        except Exception as e:
+            logger.error(f"构建和弦索引失败: {str(e)}")
+
+    def ensure_built(self):
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+
+    def rebuild(self):
+        """从 tracks 表全量重建索引"""
+        with self._lock:
+            self._codes.clear()
+            self._postings.clear()
+            self._docs.clear()
+            rows = db.session.query(Track.id, Track.spotify_id, Track.chords).filter(
+                Track.chords.isnot(None)
+            ).execution_options(yield_per=BUILD_BATCH_SIZE)
+            for row in rows:
+                self._add(row.id, row.spotify_id, row.chords)
+            self._built = True
+            logger.info(f"和弦索引构建完成: {len(self._docs)} 首歌曲，{len(self._codes)} 种和弦")
+
+    def update(self, track_id, spotify_id, raw_chords):
+        """歌曲和弦变更后增量更新（未构建时跳过，构建时会读到最新数据）"""
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(spotify_id)
+            self._add(track_id, spotify_id, raw_chords)
+
+    def _encode(self, chords):
+        return [self._codes.setdefault(chord, len(self._codes)) for chord in chords]
+
+    def _add(self, track_id, spotify_id, raw_chords):
+        chords = parse_chords(raw_chords)
+        if not chords:
+            return
+        try:
+            encoded = self._encode(chords)
+        except TypeError:
+            logger.warning(f"歌曲 {spotify_id} 的和弦数据无法索引: {raw_chords}")
+            return
+        chord_set = frozenset(encoded)
+        self._docs[spotify_id] = (track_id, len(encoded), tuple(encoded[:ORDER_PREFIX_LENGTH]), chord_set)
+        for code in chord_set:
+            self._postings[code].add(spotify_id)
+
+    def _remove(self, spotify_id):
+        doc = self._docs.pop(spotify_id, None)
+        if doc is None:
+            return
+        for code in doc[3]:
+            posting = self._postings.get(code)
+            if posting is not None:
+                posting.discard(spotify_id)
+                if not posting:
+                    del self._postings[code]
+
+    def similar(self, spotify_id, chords, limit):
+        """返回 [(spotify_id, 相似度)]，按相似度降序；评分规则与原逐首比较的实现一致"""
+        self.ensure_built()
+        with self._lock:
+            query_codes = [self._codes.get(chord) for chord in chords]
+            query_set = {code for code in query_codes if code is not None}
+            query_prefix = query_codes[:ORDER_PREFIX_LENGTH]
+            major_codes = {self._codes[chord] for chord in MAJOR_CHORDS if chord in self._codes} & query_set
+
+            # 统计每首候选歌曲与当前歌曲共享的和弦数
+            overlap = defaultdict(int)
+            for code in query_set:
+                for candidate in self._postings.get(code, ()):
+                    overlap[candidate] += 1
+
+            scored = []
+            for candidate, common in overlap.items():
+                if common < MIN_COMMON_CHORDS or candidate == spotify_id:
+                    continue
+                track_id, length, prefix, chord_set = self._docs[candidate]
+                common_ratio = common / length
+                order_similarity = 0.0
+                for i in range(min(len(query_prefix), len(prefix))):
+                    if query_prefix[i] is not None and query_prefix[i] == prefix[i]:
+                        order_similarity += 0.1
+                major_chord_bonus = 0.1 if major_codes & chord_set else 0
+                scored.append((common_ratio + order_similarity + major_chord_bonus, track_id, candidate))
+
+        # 相似度相同时按 id 排序，与原先按表顺序扫描的结果保持一致
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(candidate, score) for score, _, candidate in scored[:limit]]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built': self._built,
+                'tracks': len(self._docs),
+                'chords': len(self._codes)
+            }
+
+
+chord_index = ChordIndex()
@@ -0,0 +1,59 @@
+# backend/utils/chord_similarity.py
+import os
+import logging
+from sqlalchemy import text
+from models.chord_vocabulary import ChordVocabulary
+from utils.chord_index import MIN_COMMON_CHORDS, ORDER_PREFIX_LENGTH, MAJOR_CHORDS
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# /similar-chords 的实现：sql 在 Postgres 中用 tracks.chord_codes 的 GIN 索引计算（多个 worker 共用），
+# memory 使用进程内倒排索引（utils/chord_index.py）
+SIMILAR_CHORDS_BACKEND = os.getenv('SIMILAR_CHORDS_BACKEND', 'sql').lower()
+
+# 评分与 ChordIndex.similar 相同：共同和弦数 / 候选歌曲和弦数 + 前 4 个位置每个相同加 0.1 + 共享常用和弦加 0.1
+# 常量都转成 double precision，保证与 Python 的浮点结果一致
+SIMILAR_CHORDS_SQL = text(f"""
+    SELECT t.spotify_id,
+           m.common::float8 / cardinality(t.chord_codes)
+             + o.order_matches * CAST(0.1 AS double precision)
+             + CASE WHEN m.major THEN CAST(0.1 AS double precision) ELSE 0 END AS score
+    FROM tracks t
+    CROSS JOIN LATERAL (
+        SELECT count(DISTINCT c) AS common, coalesce(bool_or(c = ANY(:major_codes)), false) AS major
+        FROM unnest(t.chord_codes) AS c
+        WHERE c = ANY(:codes)
+    ) m
+    CROSS JOIN LATERAL (
+        SELECT count(*) AS order_matches
+        FROM generate_series(1, least({ORDER_PREFIX_LENGTH}, cardinality(:prefix), cardinality(t.chord_codes))) AS i
+        WHERE t.chord_codes[i] = (:prefix)[i]
+    ) o
+    WHERE t.chord_codes && :codes
+      AND t.spotify_id != :spotify_id
+      AND m.common >= {MIN_COMMON_CHORDS}
+    ORDER BY score DESC, t.id
+    LIMIT :limit
+""")
+
+
+def similar_tracks_sql(session, spotify_id, chords, limit, chord_codes=None):
+    """返回 [(spotify_id, 相似度)]，按相似度降序；chord_codes 为当前歌曲已保存的编码，缺失时按词表编码"""
+    if chord_codes is None:
+        chord_codes = ChordVocabulary.encode(session, chords, create=False)
+    codes = sorted({code for code in chord_codes if code})
+    if not codes:
+        return []
+    major_codes = [
+        code for chord, code in zip(chords, chord_codes)
+        if code and chord in MAJOR_CHORDS
+    ]
+    rows = session.execute(SIMILAR_CHORDS_SQL, {
+        'codes': codes,
+        'major_codes': major_codes or [0],
+        'prefix': list(chord_codes[:ORDER_PREFIX_LENGTH]),
+        'spotify_id': spotify_id,
+        'limit': limit
+    })
+    return [(row.spotify_id, row.score) for row in rows]
@@ -0,0 +1,34 @@
+# backend/utils/nearest.py
+from sqlalchemy import select, union_all
+
+
+def nearest_neighbors_statement(stmt, column, target, k, lower=None, upper=None):
+    """最近邻查询语句：目标值以下按列降序、以上按列升序各取 k 行，UNION ALL 合并
+
+    两段都是沿 column 上 B 树索引的有序扫描，各自读到 k 行就停止，
+    不像 ORDER BY abs(column - target) 那样需要把范围内的所有行取出来排序。
+    lower/upper 为可选的闭区间边界。
+    """
+    below = stmt.where(column <= target)
+    above = stmt.where(column > target)
+    if lower is not None:
+        below = below.where(column >= lower)
+    if upper is not None:
+        above = above.where(column <= upper)
+    return union_all(
+        below.order_by(column.desc()).limit(k),
+        above.order_by(column.asc()).limit(k)
+    )
+
+
+def nearest_neighbors(session, model, column, target, k, filters=(), lower=None, upper=None):
+    """返回 column 值与 target 最接近的 k 个 model 实例，按距离升序（同距离时较小的值优先）
+
+    column 可以是数值、日期等支持相减的列，filters 为额外的过滤条件
+    """
+    stmt = select(model).where(column.isnot(None), *filters)
+    rows = session.execute(
+        select(model).from_statement(nearest_neighbors_statement(stmt, column, target, k, lower, upper))
+    ).scalars().all()
+    # 以下的行在前且按距离升序，排序稳定，因此同距离时较小的值排在前面
+    return sorted(rows, key=lambda row: abs(getattr(row, column.key) - target))[:k]
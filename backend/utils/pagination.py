@@ -0,0 +1,117 @@
+# backend/utils/pagination.py
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+from flask import request
+from sqlalchemy import DateTime, tuple_
+
+# 每页默认条数和上限
+DEFAULT_PER_PAGE = 10
+MAX_PER_PAGE = 100
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析"""
+
+
+def encode_cursor(values):
+    """把排序键的值编码为不透明的游标字符串"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_value(column, value):
+    """按列的 Python 类型校验并还原一个排序键的值，类型不符时抛出 InvalidCursor"""
+    if value is None:
+        return None
+    if isinstance(column.type, DateTime):
+        if not isinstance(value, str):
+            raise InvalidCursor('无效的游标')
+        return datetime.fromisoformat(value)
+    python_type = column.type.python_type
+    if python_type is float:
+        valid = isinstance(value, (int, float))
+    elif python_type is int:
+        valid = isinstance(value, int)
+    else:
+        valid = isinstance(value, python_type)
+    # bool 是 int 的子类，JSON 的 true/false 不能当作整数键；字符串中的 NUL 也无法传给 PostgreSQL
+    if not valid or (isinstance(value, bool) and python_type is not bool) or (isinstance(value, str) and '\x00' in value):
+        raise InvalidCursor('无效的游标')
+    return value
+
+
+def decode_cursor(cursor, columns):
+    """解析游标，按列类型校验并还原排序键的值"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise InvalidCursor('无效的游标')
+        return [_decode_value(column, value) for column, value in zip(columns, values)]
+    except (binascii.Error, UnicodeError, ValueError, TypeError) as e:
+        raise InvalidCursor('无效的游标') from e
+
+
+def read_page_args(default_per_page=DEFAULT_PER_PAGE):
+    """从查询参数读取 per_page、cursor、include_total"""
+    per_page = request.args.get('per_page', default_per_page, type=int)
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    cursor = request.args.get('cursor') or None
+    include_total = request.args.get('include_total', 'false').lower() in ('1', 'true', 'yes')
+    return per_page, cursor, include_total
+
+
+def keyset_paginate(query, columns, per_page, cursor=None, descending=False, include_total=False):
+    """基于排序键的游标分页：WHERE (k1, k2) > (:v1, :v2) ORDER BY k1, k2 LIMIT n+1
+
+    columns 的最后一列必须唯一（通常是 id），深分页与第一页代价相同；include_total 为真时才执行 COUNT(*)
+    返回 (items, pagination)
+    """
+    total = query.order_by(None).count() if include_total else None
+
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    items = query.order_by(*order).limit(per_page + 1).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+
+    pagination = {
+        'per_page': per_page,
+        'has_next': has_next,
+        'next_cursor': encode_cursor([getattr(items[-1], column.key) for column in columns]) if has_next else None
+    }
+    if include_total:
+        pagination['total'] = total
+        pagination['pages'] = math.ceil(total / per_page)
+    return items, pagination
+
+
+def offset_paginate(query, columns, per_page, page):
+    """旧的页码分页（?page=N），返回与游标分页之前相同的 pagination 字段；每次都会执行 COUNT(*)，深分页较慢"""
+    result = query.order_by(*columns).paginate(page=page, per_page=per_page, error_out=False)
+    return result.items, {
+        'total': result.total,
+        'pages': result.pages,
+        'current_page': result.page,
+        'per_page': result.per_page,
+        'has_prev': result.has_prev,
+        'has_next': result.has_next,
+        'prev_page': result.prev_num,
+        'next_page': result.next_num
+    }
+
+
+def paginate_request(query, columns, default_per_page=DEFAULT_PER_PAGE):
+    """按查询参数分页：带 page 且不带 cursor 时沿用页码分页（兼容旧客户端），否则使用游标分页"""
+    per_page, cursor, include_total = read_page_args(default_per_page)
+    page = request.args.get('page', type=int)
+    if page is not None and not cursor:
+        return offset_paginate(query, columns, per_page, max(page, 1))
+    return keyset_paginate(query, columns, per_page, cursor, include_total=include_total)
@@ -0,0 +1,161 @@
+# backend/utils/progression_bktree.py
+import logging
+import threading
+from database import db
+from models.chord_progression import ChordProgression
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+BUILD_BATCH_SIZE = 5000
+
+
+def edit_distance(a, b):
+    """以和弦为单位的编辑距离（插入、删除、替换各计 1）"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, chord in enumerate(a, start=1):
+        current = [i]
+        for j, other in enumerate(b, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (chord != other)
+            ))
+        previous = current
+    return previous[-1]
+
+
+class _Node:
+    __slots__ = ('chords', 'progression_ids', 'children')
+
+    def __init__(self, chords):
+        self.chords = chords
+        self.progression_ids = set()
+        self.children = {}  # 与本节点的距离 -> 子节点
+
+
+class ProgressionBKTree:
+    """和弦进行的 BK 树，用于查找编辑距离不超过 k 的段落（容忍输错、漏掉个别和弦）
+
+    编辑距离满足三角不等式：与节点距离为 d 时，只有距离在 [d-k, d+k] 的子树可能包含结果，其余整棵跳过。
+    相同的和弦序列共用一个节点；段落修改后从旧节点移除 id，旧节点保留作路由（BK 树不支持删除节点）。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._app = None
+        self._built = False
+        self._root = None
+        self._nodes = {}        # 和弦元组 -> 节点
+        self._docs = {}         # 和弦进行 id -> (track_id, section_name, 和弦元组)
+        self._counters = {'searches': 0, 'distance_computations': 0}
+
+    def init_app(self, app):
+        """启动时在后台线程构建索引，首次查询前未完成时查询会等待构建结束"""
+        self._app = app
+        threading.Thread(target=self._build_in_context, name='progression-bktree', daemon=True).start()
+
+    def _build_in_context(self):
+        try:
+            with self._app.app_context():
+                self.ensure_built()
+        except Exception as e:
+            logger.error(f"构建和弦进行 BK 树失败: {str(e)}")
+
+    def ensure_built(self):
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+
+    def rebuild(self):
+        """从 chord_progressions 表全量重建"""
+        with self._lock:
+            self._root = None
+            self._nodes.clear()
+            self._docs.clear()
+            rows = db.session.query(
+                ChordProgression.id, ChordProgression.track_id,
+                ChordProgression.section_name, ChordProgression.progression
+            ).execution_options(yield_per=BUILD_BATCH_SIZE)
+            for row in rows:
+                self._add(row.id, row.track_id, row.section_name, row.progression)
+            self._built = True
+            logger.info(f"和弦进行 BK 树构建完成: {len(self._docs)} 个段落，{len(self._nodes)} 个节点")
+
+    def update(self, progression_id, track_id, section_name, progression):
+        """和弦进行新增或修改后增量更新（未构建时跳过，构建时会读到最新数据）"""
+        with self._lock:
+            if not self._built:
+                return
+            old = self._docs.get(progression_id)
+            if old is not None:
+                self._nodes[old[2]].progression_ids.discard(progression_id)
+            self._add(progression_id, track_id, section_name, progression)
+
+    def _add(self, progression_id, track_id, section_name, progression):
+        chords = tuple(progression.split())
+        self._docs[progression_id] = (track_id, section_name, chords)
+        node = self._nodes.get(chords)
+        if node is None:
+            node = self._nodes[chords] = _Node(chords)
+            self._insert(node)
+        node.progression_ids.add(progression_id)
+
+    def _insert(self, node):
+        if self._root is None:
+            self._root = node
+            return
+        parent = self._root
+        while True:
+            distance = edit_distance(node.chords, parent.chords)
+            child = parent.children.get(distance)
+            if child is None:
+                parent.children[distance] = node
+                return
+            parent = child
+
+    def search(self, chords, max_distance):
+        """返回编辑距离不超过 max_distance 的所有段落 [{'progression_id', 'track_id', 'section_name', 'progression', 'distance'}]，
+        按距离、id 升序"""
+        self.ensure_built()
+        query = tuple(chords)
+        matches = []
+        computed = 0
+        with self._lock:
+            stack = [self._root] if self._root is not None else []
+            while stack:
+                node = stack.pop()
+                distance = edit_distance(query, node.chords)
+                computed += 1
+                if distance <= max_distance:
+                    for progression_id in node.progression_ids:
+                        track_id, section_name, _ = self._docs[progression_id]
+                        matches.append({
+                            'progression_id': progression_id,
+                            'track_id': track_id,
+                            'section_name': section_name,
+                            'progression': ' '.join(node.chords),
+                            'distance': distance
+                        })
+                for child_distance, child in node.children.items():
+                    if distance - max_distance <= child_distance <= distance + max_distance:
+                        stack.append(child)
+            self._counters['searches'] += 1
+            self._counters['distance_computations'] += computed
+        logger.info(f"模糊搜索和弦进行: 计算距离 {computed} 次 / {len(self._nodes)} 个节点")
+        matches.sort(key=lambda match: (match['distance'], match['progression_id']))
+        return matches
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built': self._built,
+                'progressions': len(self._docs),
+                'nodes': len(self._nodes),
+                **self._counters
+            }
+
+
+progression_bktree = ProgressionBKTree()
@@ -0,0 +1,170 @@
+# backend/utils/progression_index.py
+import logging
+import threading
+from collections import defaultdict
+from database import db
+from models.chord_progression import ChordProgression
+from utils.progression_pool import ProgressionPool
+from utils.progression_similarity import ProgressionQuery, MIN_MATCH_SCORE, rank_candidates, weighted_similarity
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+BUILD_BATCH_SIZE = 5000
+
+
+def ngrams(chords, n):
+    return {tuple(chords[i:i + n]) for i in range(len(chords) - n + 1)}
+
+
+class ProgressionIndex:
+    """已保存和弦进行的 n-gram 倒排索引（单个和弦、二元组、三元组 -> 和弦进行 id）
+
+    查询时先用倒排列表统计每个候选段落的命中情况，得到匹配分数的上界：
+    包含匹配可以精确算出，LCS 和精确位置匹配不超过包含匹配数和段落长度，
+    没有共同二元组时最长连续匹配不超过 1，没有共同三元组时不超过 2。
+    候选按上界从高到低精确评分，上界低于当前第 limit 名时停止，
+    因此耗时取决于与查询共享和弦的段落数，而不是和弦进行总数。
+    """
+
+    def __init__(self, column='progression'):
+        self.column = column               # 被索引的 ChordProgression 列（原始和弦或级数形式）
+        self.pool = ProgressionPool()
+        self._lock = threading.RLock()
+        self._app = None
+        self._built = False
+        self._version = 0                  # 每次增删段落加一，进程池据此判断共享内存中的快照是否过期
+        self._docs = {}                    # 和弦进行 id -> (track_id, section_name, 和弦元组)
+        self._postings = [defaultdict(set) for _ in range(3)]  # 1/2/3-gram -> 和弦进行 id 集合
+
+    def init_app(self, app):
+        """启动时在后台线程构建索引，首次查询前未完成时查询会等待构建结束"""
+        self._app = app
+        threading.Thread(target=self._build_in_context, name=f'progression-index-{self.column}', daemon=True).start()
+
+    def _build_in_context(self):
+        try:
+            with self._app.app_context():
+                self.ensure_built()
+        except Exception as e:
+            logger.error(f"构建和弦进行索引失败: {str(e)}")
+
+    def ensure_built(self):
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+
+    def rebuild(self):
+        """从 chord_progressions 表全量重建索引"""
+        with self._lock:
+            self._docs.clear()
+            for postings in self._postings:
+                postings.clear()
+            column = getattr(ChordProgression, self.column)
+            rows = db.session.query(
+                ChordProgression.id, ChordProgression.track_id,
+                ChordProgression.section_name, column.label('chords')
+            ).filter(column.isnot(None)).execution_options(yield_per=BUILD_BATCH_SIZE)
+            for row in rows:
+                self._add(row.id, row.track_id, row.section_name, row.chords)
+            self._built = True
+            logger.info(f"和弦进行索引构建完成: {len(self._docs)} 个段落")
+
+    def update(self, progression_id, track_id, section_name, progression):
+        """和弦进行新增或修改后增量更新，progression 为 None 时只移除（未构建时跳过，构建时会读到最新数据）"""
+        with self._lock:
+            if not self._built:
+                return
+            self._remove(progression_id)
+            if progression is not None:
+                self._add(progression_id, track_id, section_name, progression)
+
+    def _add(self, progression_id, track_id, section_name, progression):
+        chords = tuple(progression.split())
+        self._version += 1
+        self._docs[progression_id] = (track_id, section_name, chords)
+        for n, postings in enumerate(self._postings, start=1):
+            for gram in ngrams(chords, n):
+                postings[gram].add(progression_id)
+
+    def _remove(self, progression_id):
+        doc = self._docs.pop(progression_id, None)
+        if doc is None:
+            return
+        self._version += 1
+        for n, postings in enumerate(self._postings, start=1):
+            for gram in ngrams(doc[2], n):
+                posting = postings.get(gram)
+                if posting is not None:
+                    posting.discard(progression_id)
+                    if not posting:
+                        del postings[gram]
+
+    def _candidates(self, chords):
+        """返回 [(上界, 和弦进行 id)]，只包含上界超过阈值的段落"""
+        unigram, bigram, trigram = self._postings
+        contained = defaultdict(int)
+        for chord in set(chords):
+            weight = chords.count(chord)
+            for progression_id in unigram.get((chord,), ()):
+                contained[progression_id] += weight
+        with_bigram = set().union(*(bigram.get(gram, ()) for gram in ngrams(chords, 2)))
+        with_trigram = set().union(*(trigram.get(gram, ()) for gram in ngrams(chords, 3)))
+
+        candidates = []
+        for progression_id, contained_matches in contained.items():
+            saved_length = len(self._docs[progression_id][2])
+            bound = min(contained_matches, saved_length)
+            if progression_id not in with_bigram:
+                consecutive_bound = min(bound, 1)
+            elif progression_id not in with_trigram:
+                consecutive_bound = min(bound, 2)
+            else:
+                consecutive_bound = bound
+            upper = weighted_similarity(len(chords), bound, consecutive_bound, bound, contained_matches)
+            if upper > MIN_MATCH_SCORE:
+                candidates.append((upper, progression_id))
+        return candidates
+
+    def docs_snapshot(self):
+        """返回 (版本, 全部段落的副本)，供进程池发布到共享内存"""
+        with self._lock:
+            return self._version, dict(self._docs)
+
+    def search(self, chords, limit):
+        """返回 [{'track_id', 'match_score', 'matched_section'}]，每首歌取匹配分数最高的段落，按分数降序"""
+        self.ensure_built()
+        with self._lock:
+            candidates = self._candidates(chords)
+            docs = {progression_id: self._docs[progression_id] for _, progression_id in candidates}
+            version = self._version
+            corpus_size = len(self._docs)
+
+        ranked = None
+        # 候选很多时交给进程池并行评分（语料还未发布时本次仍单线程评分）
+        if self.pool.should_use(len(candidates), corpus_size):
+            ranked = self.pool.rank(chords, candidates, docs, limit, version, self.docs_snapshot)
+        if ranked is None:
+            # 和弦进行 id 按表顺序递增，同分时保留 id 较小的段落，与按表顺序扫描一致
+            ranked = rank_candidates(
+                ProgressionQuery(chords), candidates,
+                lambda progression_id: (docs[progression_id][0], docs[progression_id][2]), limit
+            )
+        return [
+            {'track_id': track_id, 'match_score': score, 'matched_section': docs[progression_id][1]}
+            for score, progression_id, track_id in ranked
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'built': self._built,
+                'progressions': len(self._docs),
+                'ngrams': sum(len(postings) for postings in self._postings),
+                'pool': self.pool.stats()
+            }
+
+
+progression_index = ProgressionIndex()
+# 与调无关的级数形式（ChordProgression.roman_progression），用于移调不变的搜索
+roman_progression_index = ProgressionIndex('roman_progression')
@@ -0,0 +1,309 @@
+# backend/utils/progression_pool.py
+import os
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from utils.progression_similarity import ProgressionQuery, rank_candidates
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 评分进程数（0 表示不启用，全部在请求线程内评分）。所有索引共用同一个进程池
+PROGRESSION_SEARCH_WORKERS = int(os.getenv('PROGRESSION_SEARCH_WORKERS', '0'))
+# 候选段落数、语料段落数都达到下限才交给进程池，否则进程间通信的开销大于收益
+PROGRESSION_PARALLEL_MIN_CANDIDATES = int(os.getenv('PROGRESSION_PARALLEL_MIN_CANDIDATES', '2000'))
+PROGRESSION_PARALLEL_MIN_PROGRESSIONS = int(os.getenv('PROGRESSION_PARALLEL_MIN_PROGRESSIONS', '10000'))
+# 语料变化后至少间隔多少秒才重新发布到共享内存；期间新增或修改的段落在请求线程内评分
+PROGRESSION_POOL_REPUBLISH_INTERVAL = float(os.getenv('PROGRESSION_POOL_REPUBLISH_INTERVAL', '30'))
+# 进程启动方式。默认 forkserver：语料已在共享内存中，工作进程不需要继承父进程的内存；
+# 从多线程的 Web 进程 fork 可能继承到被其他线程持有的锁，只有显式设置 PROGRESSION_POOL_START_METHOD=fork 时才使用。
+# spawn/forkserver 会以 __mp_main__ 重新执行主模块，python app.py 启动时 app.py 据此跳过后台任务和建表
+PROGRESSION_POOL_START_METHODS = ('forkserver', 'spawn', 'fork')
+PROGRESSION_POOL_START_METHOD = os.getenv('PROGRESSION_POOL_START_METHOD', 'forkserver')
+if PROGRESSION_POOL_START_METHOD not in PROGRESSION_POOL_START_METHODS:
+    raise ValueError(f"PROGRESSION_POOL_START_METHOD 必须是 {', '.join(PROGRESSION_POOL_START_METHODS)} 之一")
+
+# 工作进程中已映射的共享内存段：名称 -> SharedMemory（多个索引的语料各占一段，只保留最近用到的几段）
+_attached = OrderedDict()
+MAX_ATTACHED_SEGMENTS = 4
+
+# 进程内共享的进程池
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _corpus_arrays(buffer, token_count, doc_count):
+    """共享内存布局（int64）：和弦编号 | 每个段落的起始偏移（doc_count + 1 个） | 每个段落的歌曲编号"""
+    data = np.ndarray((token_count + 2 * doc_count + 1,), dtype=np.int64, buffer=buffer)
+    return (
+        data[:token_count],
+        data[token_count:token_count + doc_count + 1],
+        data[token_count + doc_count + 1:]
+    )
+
+
+def _attach(name):
+    shm = _attached.get(name)
+    if shm is not None:
+        _attached.move_to_end(name)
+        return shm
+    while len(_attached) >= MAX_ATTACHED_SEGMENTS:
+        # 旧版本的语料已不再使用，释放映射
+        _, old = _attached.popitem(last=False)
+        old.close()
+    shm = _attached[name] = shared_memory.SharedMemory(name=name)
+    return shm
+
+
+def _score_chunk(corpus, query_tokens, positions, bounds, limit):
+    """在工作进程中对一部分候选评分，返回本进程的前 limit 首 [(分数, 段落位置, 歌曲编号)]"""
+    name, token_count, doc_count = corpus
+    shm = _attach(name)
+    tokens, offsets, tracks = _corpus_arrays(shm.buf, token_count, doc_count)
+    try:
+        def lookup(position):
+            return int(tracks[position]), tokens[offsets[position]:offsets[position + 1]].tolist()
+
+        return rank_candidates(ProgressionQuery(query_tokens), list(zip(bounds, positions)), lookup, limit)
+    finally:
+        # 释放对共享内存缓冲区的引用，之后才能 close
+        del tokens, offsets, tracks
+
+
+def shared_executor(workers):
+    """首次使用时启动进程池，之后各索引共用"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(PROGRESSION_POOL_START_METHOD)
+            )
+            atexit.register(shutdown_executor)
+            logger.info(f"和弦进行评分进程池已启动: {workers} 个进程（{PROGRESSION_POOL_START_METHOD}）")
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+class CorpusSnapshot:
+    """发布到共享内存的一份只读语料。查询期间持有引用，被新版本替换且没有查询在用时才释放共享内存"""
+
+    def __init__(self, version, docs):
+        self.version = version
+        self.docs = docs  # 和弦进行 id -> 发布时的 (track_id, section_name, 和弦元组)，用于判断段落是否已变化
+        symbols, track_numbers = {}, {}
+        tokens, offsets, tracks, progression_ids = [], [0], [], []
+        for progression_id in sorted(docs):
+            track_id, _, chords = docs[progression_id]
+            tokens.extend(symbols.setdefault(chord, len(symbols)) for chord in chords)
+            offsets.append(len(tokens))
+            tracks.append(track_numbers.setdefault(track_id, len(track_numbers)))
+            progression_ids.append(progression_id)
+
+        size = max(8 * (len(tokens) + 2 * len(tracks) + 1), 8)
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        token_array, offset_array, track_array = _corpus_arrays(self._shm.buf, len(tokens), len(tracks))
+        token_array[:] = tokens
+        offset_array[:] = offsets
+        track_array[:] = tracks
+        del token_array, offset_array, track_array
+
+        self.corpus = (self._shm.name, len(tokens), len(tracks))
+        self.symbols = symbols  # 和弦符号 -> 编号
+        self.positions = {progression_id: position for position, progression_id in enumerate(progression_ids)}
+        self.progression_ids = progression_ids
+        self.track_ids = list(track_numbers)  # 歌曲编号 -> spotify_id
+        self._users = 0
+        self._retired = False
+
+    def acquire(self):
+        # 调用方需持有 ProgressionPool._state_lock
+        self._users += 1
+
+    def release(self, state_lock):
+        with state_lock:
+            self._users -= 1
+            free = self._retired and self._users == 0
+        if free:
+            self._free()
+
+    def retire(self):
+        # 调用方需持有 ProgressionPool._state_lock；返回是否可以立即释放
+        self._retired = True
+        return self._users == 0
+
+    def _free(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+class ProgressionPool:
+    """多进程和弦进行评分
+
+    和弦进行语料按整数编码后发布为一份只读快照放在共享内存中，工作进程只映射、不复制；
+    并发查询共用同一份快照和同一个进程池，互不阻塞。
+    候选段落按分数上界排序后轮流分给各进程，每个进程独立剪枝并返回自己的前 k 首，主进程合并。
+    语料变化后在后台线程重新发布（两次发布至少间隔 republish_interval 秒），
+    快照发布之后新增或修改的段落在请求线程内评分，再与进程池的结果合并，结果与单线程评分一致。
+    """
+
+    def __init__(self, workers=PROGRESSION_SEARCH_WORKERS, min_candidates=PROGRESSION_PARALLEL_MIN_CANDIDATES,
+                 min_progressions=PROGRESSION_PARALLEL_MIN_PROGRESSIONS,
+                 republish_interval=PROGRESSION_POOL_REPUBLISH_INTERVAL):
+        self.workers = workers
+        self.min_candidates = min_candidates
+        self.min_progressions = min_progressions
+        self.republish_interval = republish_interval
+        self.cpu_count = os.cpu_count() or 1
+        self._state_lock = threading.Lock()  # 保护快照的替换和引用计数
+        self._snapshot = None
+        self._published_at = 0.0
+        self._publishing = False
+        self._publishes = 0
+
+    @property
+    def enabled(self):
+        # 单核机器上多进程只会更慢
+        return self.workers > 0 and self.cpu_count > 1
+
+    def should_use(self, candidate_count, corpus_size):
+        return self.enabled and candidate_count >= self.min_candidates and corpus_size >= self.min_progressions
+
+    def publish(self, version, docs):
+        """把 docs（{和弦进行 id: (track_id, section_name, 和弦元组)}，调用方不再修改）发布为新的快照"""
+        snapshot = CorpusSnapshot(version, docs)
+        with self._state_lock:
+            old, self._snapshot = self._snapshot, snapshot
+            self._published_at = time.monotonic()
+            self._publishes += 1
+            free = old is not None and old.retire()
+        if free:
+            old._free()
+        logger.info(f"和弦进行语料已发布到共享内存: {len(snapshot.progression_ids)} 个段落，{snapshot.corpus[1]} 个和弦")
+
+    def _publish_in_background(self, load_docs):
+        try:
+            self.publish(*load_docs())
+        except Exception as e:
+            logger.error(f"发布和弦进行语料失败: {str(e)}")
+        finally:
+            with self._state_lock:
+                self._publishing = False
+
+    def _acquire_snapshot(self, version, load_docs):
+        """返回已加引用的当前快照（可能不是最新版本），没有快照时返回 None；语料过期时在后台重新发布"""
+        with self._state_lock:
+            snapshot = self._snapshot
+            stale = snapshot is None or (
+                snapshot.version != version
+                and time.monotonic() - self._published_at >= self.republish_interval
+            )
+            if stale and not self._publishing:
+                self._publishing = True
+                threading.Thread(
+                    target=self._publish_in_background, args=(load_docs,), name='progression-publish', daemon=True
+                ).start()
+            if snapshot is not None:
+                snapshot.acquire()
+            return snapshot
+
+    def rank(self, chords, candidates, docs, limit, version, load_docs):
+        """与 rank_candidates 相同的结果格式 [(分数, 和弦进行 id, track_id)]；还没有快照时返回 None（调用方单线程评分）
+
+        docs 为候选段落的当前内容 {和弦进行 id: (track_id, section_name, 和弦元组)}；
+        load_docs() 返回 (版本, 全部段落的副本)，在需要重新发布时调用
+        """
+        snapshot = self._acquire_snapshot(version, load_docs)
+        if snapshot is None:
+            return None
+        try:
+            pooled, changed = [], []
+            for upper, progression_id in candidates:
+                published = snapshot.docs.get(progression_id) is docs[progression_id]
+                (pooled if published else changed).append((upper, progression_id))
+            ranked = self._rank_pooled(snapshot, chords, pooled, limit) if pooled else []
+        finally:
+            snapshot.release(self._state_lock)
+
+        if not changed:
+            return ranked
+        # 快照之后变化的段落在本线程评分，合并时每首歌取分数最高（同分取 id 较小）的段落
+        ranked += rank_candidates(
+            ProgressionQuery(chords), changed,
+            lambda progression_id: (docs[progression_id][0], docs[progression_id][2]), limit
+        )
+        best = {}
+        for score, progression_id, track_id in ranked:
+            current = best.get(track_id)
+            if current is None or (-score, progression_id) < (-current[0], current[1]):
+                best[track_id] = (score, progression_id)
+        merged = sorted(((score, progression_id, track_id) for track_id, (score, progression_id) in best.items()),
+                        key=lambda item: (-item[0], item[1]))
+        return merged[:limit]
+
+    def _rank_pooled(self, snapshot, chords, candidates, limit):
+        executor = shared_executor(self.workers)
+        # 查询中语料没有的和弦编码为互不相同的负数，长度不变且不会与任何段落匹配
+        query_tokens = [snapshot.symbols.get(chord, -1 - i) for i, chord in enumerate(chords)]
+        ordered = sorted(
+            ((upper, snapshot.positions[progression_id]) for upper, progression_id in candidates),
+            key=lambda item: (-item[0], item[1])
+        )
+        # 按上界排序后轮流分配，各进程拿到的候选分布相近，剪枝效果一致
+        futures = [
+            executor.submit(
+                _score_chunk, snapshot.corpus, query_tokens,
+                [position for _, position in ordered[start::self.workers]],
+                [upper for upper, _ in ordered[start::self.workers]],
+                limit
+            )
+            for start in range(min(self.workers, len(ordered)))
+        ]
+
+        best = {}
+        for future in futures:
+            for score, position, track in future.result():
+                current = best.get(track)
+                if current is None or (-score, position) < (-current[0], current[1]):
+                    best[track] = (score, position)
+        ranked = sorted(((score, position, track) for track, (score, position) in best.items()),
+                        key=lambda item: (-item[0], item[1]))
+        return [
+            (score, snapshot.progression_ids[position], snapshot.track_ids[track])
+            for score, position, track in ranked[:limit]
+        ]
+
+    def shutdown(self):
+        """释放本索引的快照（进程池由 shutdown_executor 关闭）"""
+        with self._state_lock:
+            old, self._snapshot = self._snapshot, None
+            free = old is not None and old.retire()
+        if free:
+            old._free()
+
+    def stats(self):
+        with self._state_lock:
+            snapshot = self._snapshot
+            return {
+                'workers': self.workers,
+                'enabled': self.enabled,
+                'cpu_count': self.cpu_count,
+                'start_method': PROGRESSION_POOL_START_METHOD,
+                'started': _executor is not None,
+                'published_version': snapshot.version if snapshot else None,
+                'published_progressions': len(snapshot.progression_ids) if snapshot else 0,
+                'publishes': self._publishes
+            }
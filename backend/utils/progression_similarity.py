@@ -0,0 +1,139 @@
+# backend/utils/progression_similarity.py
+# 和弦进行相似度：/tracks/search-by-progression 和 utils/progression_index.py 共用
+#
+# 查询的和弦进行编码为位掩码：每种和弦对应一个整数，第 i 位为 1 表示查询第 i 个和弦是它。
+# 之后与每个已保存段落比较时只需按段落长度做若干次整数位运算：
+# LCS 用位并行算法（Allison-Dix / Hyyrö），最长连续匹配按对角线逐级求交，
+# 不再为每次比较分配 (m+1)×(n+1) 的二维表。
+
+import heapq
+
+# 只返回匹配分数大于该阈值的段落
+MIN_MATCH_SCORE = 0.1
+
+
+class ProgressionQuery:
+    """预先编码好的查询和弦进行，可与多个已保存段落比较"""
+
+    def __init__(self, query_chords):
+        self.chords = list(query_chords)
+        self.length = len(self.chords)
+        self.full_mask = (1 << self.length) - 1
+        self.masks = {}
+        for i, chord in enumerate(self.chords):
+            self.masks[chord] = self.masks.get(chord, 0) | (1 << i)
+
+    def lcs_length(self, saved_chords):
+        """位并行 LCS：V 中为 0 的位数即 LCS 长度"""
+        masks = self.masks
+        full_mask = self.full_mask
+        v = full_mask
+        for chord in saved_chords:
+            u = v & masks.get(chord, 0)
+            v = ((v + u) | (v - u)) & full_mask
+        return self.length - v.bit_count()
+
+    def longest_run(self, saved_chords):
+        """最长连续匹配：runs[k] 的第 i 位表示以 (i, j) 结尾、长度至少为 k+1 的公共片段"""
+        masks = self.masks
+        longest = 0
+        runs = []
+        for chord in saved_chords:
+            match = masks.get(chord, 0)
+            current = []
+            extended = match
+            while extended:
+                current.append(extended)
+                extended = match & (runs[len(current) - 1] << 1) if len(current) <= len(runs) else 0
+            runs = current
+            longest = max(longest, len(current))
+        return longest
+
+    def similarity(self, saved_chords):
+        if not self.chords or not saved_chords:
+            return 0.0
+        masks = self.masks
+
+        # 计算最长公共子序列 (LCS)
+        lcs_length = self.lcs_length(saved_chords)
+
+        # 计算连续匹配的和弦数量
+        consecutive_matches = self.longest_run(saved_chords)
+
+        # 计算准确匹配的和弦数量
+        exact_matches = sum(
+            (masks.get(chord, 0) >> i) & 1
+            for i, chord in enumerate(saved_chords[:self.length])
+        )
+
+        # 计算包含匹配：出现在已保存段落中的查询和弦位置数
+        contained = 0
+        for chord in set(saved_chords):
+            contained |= masks.get(chord, 0)
+        contained_matches = contained.bit_count()
+
+        return weighted_similarity(self.length, lcs_length, consecutive_matches, exact_matches, contained_matches)
+
+
+def rank_candidates(query, candidates, lookup, limit):
+    """按分数上界从高到低精确评分，上界低于当前第 limit 名时停止
+
+    candidates 为 [(分数上界, key)]，lookup(key) 返回 (歌曲, 和弦序列)；
+    每首歌保留分数最高的段落，同分时保留 key 较小的段落；返回 [(分数, key, 歌曲)]，按分数降序，最多 limit 首
+    """
+    best = {}
+    top = []     # 当前前 limit 首的最小堆 (分数, 歌曲)，分数提高后旧条目留在堆里，出堆时跳过
+    in_top = {}  # 在前 limit 首中的歌曲 -> 当前分数
+
+    def top_min():
+        while top[0][0] != in_top.get(top[0][1]):
+            heapq.heappop(top)
+        return top[0]
+
+    for upper, key in sorted(candidates, key=lambda item: (-item[0], item[1])):
+        if len(in_top) >= limit and upper < top_min()[0]:
+            break
+        track, saved_chords = lookup(key)
+        match_score = query.similarity(saved_chords)
+        if match_score <= MIN_MATCH_SCORE:
+            continue
+        current = best.get(track)
+        if current is None or match_score > current[0] or (match_score == current[0] and key < current[1]):
+            best[track] = (match_score, key)
+        if in_top.get(track, -1.0) >= match_score:
+            continue
+        in_top[track] = match_score
+        heapq.heappush(top, (match_score, track))
+        if len(in_top) > limit:
+            del in_top[top_min()[1]]
+
+    ranked = sorted(((score, key, track) for track, (score, key) in best.items()), key=lambda item: (-item[0], item[1]))
+    return ranked[:limit]
+
+
+def calculate_progression_similarity(query_chords, saved_chords):
+    """计算两个和弦进行之间的相似度"""
+    if not query_chords or not saved_chords:
+        return 0.0
+    return ProgressionQuery(query_chords).similarity(saved_chords)
+
+def weighted_similarity(query_length, lcs_length, consecutive_matches, exact_matches, contained_matches):
+    """按权重合成总体匹配分数；各项计数越大分数越大，因此代入计数的上界即得到分数的上界"""
+    # 不同匹配类型的加权得分（权重总和为1）
+    lcs_score = (lcs_length / query_length) * 0.4  # 最长公共子序列(40%)
+    consecutive_score = (consecutive_matches / query_length) * 0.3  # 连续匹配(30%)
+    exact_score = (exact_matches / query_length) * 0.2  # 精确位置匹配(20%)
+    contained_score = (contained_matches / query_length) * 0.1  # 包含匹配(10%)
+
+    # 总体匹配分数
+    similarity = lcs_score + consecutive_score + exact_score + contained_score
+
+    return min(1.0, similarity)  # 确保分数不超过1.0
+
+def longest_common_subsequence(str1, str2):
+    """计算最长公共子序列的长度"""
+    return ProgressionQuery(str1).lcs_length(str2)
+
+def longest_consecutive_match(str1, str2):
+    """计算最长连续匹配片段的长度"""
+    return ProgressionQuery(str1).longest_run(str2)
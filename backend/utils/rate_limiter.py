@@ -0,0 +1,137 @@
+# backend/utils/rate_limiter.py
+import threading
+import time
+
+
+class RateLimitExceeded(Exception):
+    """在允许的等待时间内拿不到令牌"""
+
+    def __init__(self, wait_seconds):
+        super().__init__(f"需要等待 {wait_seconds:.1f} 秒")
+        self.wait_seconds = wait_seconds
+
+
+class AdaptiveRateLimiter:
+    """线程安全的令牌桶：被限流（429）时暂停到 Retry-After 并把速率减半，之后每次成功逐步恢复"""
+
+    def __init__(self, rate, burst, min_rate=1.0, recovery_step=0.1):
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.recovery_step = recovery_step
+        self.capacity = float(burst)
+        self._rate = float(rate)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._counters = {'acquired': 0, 'waited': 0, 'rejected': 0, 'throttled': 0}
+
+    def _refill(self, now):
+        # 调用方需持有 self._lock
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, max_wait):
+        """取一个令牌，必要时等待；预计等待超过 max_wait 秒时抛出 RateLimitExceeded"""
+        deadline = time.monotonic() + max_wait
+        waited = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    self._counters['acquired'] += 1
+                    if waited:
+                        self._counters['waited'] += 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self._rate
+                if now + wait > deadline:
+                    self._counters['rejected'] += 1
+                    raise RateLimitExceeded(wait)
+            waited = True
+            time.sleep(wait)
+
+    def on_throttled(self, retry_after):
+        """上游返回 429：在 retry_after 秒内暂停发放令牌，并把速率减半"""
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + retry_after)
+            self._rate = max(self.min_rate, self._rate / 2)
+            self._tokens = 0.0
+            self._updated = now
+            self._counters['throttled'] += 1
+
+    def on_success(self):
+        with self._lock:
+            if self._rate < self.max_rate:
+                self._rate = min(self.max_rate, self._rate + self.recovery_step)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                **self._counters,
+                'rate': round(self._rate, 3),
+                'max_rate': self.max_rate,
+                'tokens': round(self._tokens, 2),
+                'blocked_for': round(max(0.0, self._blocked_until - now), 2)
+            }
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后熔断，reset_timeout 秒后放行一个探测请求，成功则恢复"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+        self._counters = {'opened': 0, 'short_circuited': 0}
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if now >= self._opened_at + self.reset_timeout:
+                # 放行一个探测请求；结果未返回前其余请求继续被拒绝
+                self._state = self.HALF_OPEN
+                self._opened_at = now
+                return True
+            self._counters['short_circuited'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._counters['opened'] += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                'state': self._state,
+                'consecutive_failures': self._failures,
+                'retry_in': round(max(0.0, self._opened_at + self.reset_timeout - time.monotonic()), 2)
+                if self._state != self.CLOSED else 0.0
+            }
@@ -0,0 +1,105 @@
+# backend/utils/roman_numerals.py
+# 把和弦进行转换为与调无关的罗马数字级数，例如 C 大调的 "C G Am F" 与 D 大调的 "D A Bm G" 都是 "I V vi IV"。
+# 小调统一按关系大调分析（A 小调的 Am 记为 vi），这样有调性信息的歌曲与自动判断调性的查询使用同一套级数。
+import re
+
+NOTE_PITCHES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+ACCIDENTALS = {'': 0, '#': 1, '♯': 1, 'b': -1, '♭': -1}
+# 相对主音的半音数 -> 级数
+DEGREES = ['I', 'bII', 'II', 'bIII', 'III', 'IV', '#IV', 'V', 'bVI', 'VI', 'bVII', 'VII']
+# 大调顺阶三和弦：半音数 -> 性质
+DIATONIC_TRIADS = {0: 'major', 2: 'minor', 4: 'minor', 5: 'major', 7: 'major', 9: 'minor', 11: 'diminished'}
+
+CHORD_PATTERN = re.compile(r'^([A-G])([#b♯♭]?)(.*)$')
+MINOR_PATTERN = re.compile(r'^(m(?!aj)|min|-)')
+
+
+def parse_note(name):
+    """音名 -> 音高类（0-11），无法解析返回 None"""
+    match = CHORD_PATTERN.match(name or '')
+    if not match or match.group(3):
+        return None
+    return (NOTE_PITCHES[match.group(1)] + ACCIDENTALS[match.group(2)]) % 12
+
+
+def parse_chord(chord):
+    """和弦名 -> (根音音高类, 性质, 其余后缀, 低音音高类或 None)；无法解析返回 None"""
+    main, _, bass = chord.partition('/')
+    match = CHORD_PATTERN.match(main)
+    if not match:
+        return None
+    root = (NOTE_PITCHES[match.group(1)] + ACCIDENTALS[match.group(2)]) % 12
+    suffix = match.group(3)
+    minor = MINOR_PATTERN.match(suffix)
+    if minor:
+        quality, suffix = 'minor', suffix[minor.end():]
+    elif suffix.startswith('dim'):
+        quality, suffix = 'diminished', suffix[3:]
+    else:
+        quality = 'major'
+    bass_pitch = parse_note(bass) if bass else None
+    if bass and bass_pitch is None:
+        return None
+    return root, quality, suffix, bass_pitch
+
+
+def major_tonic(key, scale=None):
+    """歌曲调性 -> 关系大调主音的音高类，无法解析返回 None"""
+    tonic = parse_note((key or '').strip())
+    if tonic is None:
+        return None
+    if (scale or '').strip().lower() == 'minor':
+        tonic = (tonic + 3) % 12
+    return tonic
+
+
+def detect_tonic(chords):
+    """按顺阶三和弦的吻合数判断大调主音，首尾和弦是主和弦时加分；同分时优先第一个和弦的根音"""
+    parsed = [parse_chord(chord) for chord in chords]
+    parsed = [chord for chord in parsed if chord]
+    if not parsed:
+        return None
+
+    def fit(tonic):
+        score = sum(
+            1.0 for root, quality, _, _ in parsed
+            if DIATONIC_TRIADS.get((root - tonic) % 12) == quality
+        )
+        for root, quality, _, _ in (parsed[0], parsed[-1]):
+            if root == tonic and quality == 'major':
+                score += 0.5
+        return score, tonic == parsed[0][0], -tonic
+
+    return max(range(12), key=fit)
+
+
+def to_roman(chord, tonic):
+    """单个和弦 -> 级数；无法解析的记号原样保留"""
+    parsed = parse_chord(chord)
+    if parsed is None:
+        return chord
+    root, quality, suffix, bass = parsed
+    numeral = DEGREES[(root - tonic) % 12]
+    if quality == 'minor':
+        numeral = numeral.lower()
+    elif quality == 'diminished':
+        numeral = numeral.lower() + '°'
+    if bass is not None:
+        suffix += '/' + DEGREES[(bass - tonic) % 12]
+    return numeral + suffix
+
+
+def roman_progression(chords, key=None, scale=None):
+    """和弦列表 -> 级数列表；有歌曲调性时按调性分析，否则自动判断。完全无法分析时返回 None"""
+    tonic = major_tonic(key, scale)
+    if tonic is None:
+        tonic = detect_tonic(chords)
+    if tonic is None:
+        return None
+    return [to_roman(chord, tonic) for chord in chords]
+
+
+def roman_progression_text(progression, key=None, scale=None):
+    """ChordProgression.progression 文本 -> roman_progression 文本"""
+    numerals = roman_progression(progression.split(), key, scale)
+    return ' '.join(numerals) if numerals else None
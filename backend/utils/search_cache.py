@@ -0,0 +1,182 @@
+# backend/utils/search_cache.py
+import os
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 缓存条目数上限、新鲜期和过期后仍可返回旧数据的时长（秒）
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '1024'))
+SEARCH_CACHE_TTL = float(os.getenv('SEARCH_CACHE_TTL', '300'))
+SEARCH_CACHE_STALE_TTL = float(os.getenv('SEARCH_CACHE_STALE_TTL', '3600'))
+# 艺术家结果变化很慢，单独缓存更长时间
+ARTIST_CACHE_TTL = float(os.getenv('ARTIST_CACHE_TTL', '86400'))
+ARTIST_CACHE_STALE_TTL = float(os.getenv('ARTIST_CACHE_STALE_TTL', '604800'))
+
+
+def normalize_query(query):
+    """规范化搜索词作为缓存键：去掉多余空白并转小写"""
+    return ' '.join(query.lower().split())
+
+
+class _InflightCall:
+    """正在进行的上游请求，相同键的并发未命中共享同一次结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SearchCache:
+    """有界 LRU/TTL 缓存：合并并发未命中，过期后先返回旧数据并在后台刷新"""
+
+    def __init__(self, maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, stale_ttl=SEARCH_CACHE_STALE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._inflight = {}  # key -> _InflightCall
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'stale': 0,
+            'coalesced': 0,
+            'stale_on_error': 0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+            'evictions': 0
+        }
+
+    def _count(self, name):
+        # 调用方需持有 self._lock
+        self._counters[name] += 1
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._count('evictions')
+
+    def get_or_load(self, key, loader):
+        """返回 key 对应的结果，必要时调用 loader() 获取"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = time.monotonic() - stored_at
+                self._entries.move_to_end(key)
+                if age < self.ttl:
+                    self._count('hits')
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self._count('stale')
+                    self._start_refresh(key, loader)
+                    return value
+
+            call = self._inflight.get(key)
+            if call is not None:
+                self._count('coalesced')
+                leader = False
+            else:
+                self._count('misses')
+                call = _InflightCall()
+                self._inflight[key] = call
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = loader()
+            self._store(key, call.result)
+            return call.result
+        except Exception as e:
+            call.error = e
+            # 上游失败时，如果还有更早的旧数据则直接返回
+            with self._lock:
+                old = self._entries.get(key)
+                if old is not None:
+                    self._count('stale_on_error')
+                    call.error = None
+                    call.result = old[0]
+                    logger.warning(f"搜索上游失败，返回旧缓存 for '{key}': {str(e)}")
+                    return old[0]
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def put(self, key, value):
+        """直接写入一条结果（例如另一个请求顺带取到的数据）"""
+        self._store(key, value)
+
+    def peek(self, key, loader):
+        """只读缓存、不等待上游：命中时返回结果（过期则后台刷新）；未命中时在后台调用 loader() 并返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                age = time.monotonic() - stored_at
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._count('hits' if age < self.ttl else 'stale')
+                    if age >= self.ttl:
+                        self._start_refresh(key, loader)
+                    return value
+            self._count('misses')
+            self._start_refresh(key, loader)
+            return None
+
+    def _start_refresh(self, key, loader):
+        # 调用方需持有 self._lock；同一个键同时只会有一个后台刷新
+        if key in self._refreshing or key in self._inflight:
+            return
+        self._refreshing.add(key)
+        self._count('refreshes')
+        thread = threading.Thread(target=self._refresh, args=(key, loader), daemon=True)
+        thread.start()
+
+    def _refresh(self, key, loader):
+        try:
+            self._store(key, loader())
+        except Exception as e:
+            with self._lock:
+                self._count('refresh_errors')
+            logger.warning(f"后台刷新搜索缓存失败 for '{key}': {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['stale'] + self._counters['misses'] + self._counters['coalesced']
+            return {
+                **self._counters,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'stale_ttl': self.stale_ttl,
+                'hit_ratio': round((self._counters['hits'] + self._counters['stale']) / lookups, 4) if lookups else 0.0
+            }
+
+
+# 进程内共享的 /search 结果缓存
+search_cache = SearchCache()
+# 本地曲库命中时使用的艺术家结果缓存（本地不保存艺术家）
+artist_cache = SearchCache(ttl=ARTIST_CACHE_TTL, stale_ttl=ARTIST_CACHE_STALE_TTL)
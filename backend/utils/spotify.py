@@ -0,0 +1,160 @@
+# backend/utils/spotify.py
+import os
+import base64
+import logging
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from utils.rate_limiter import AdaptiveRateLimiter, CircuitBreaker, RateLimitExceeded
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+SPOTIFY_TOKEN_URL = 'https://accounts.spotify.com/api/token'
+SPOTIFY_API_BASE = 'https://api.spotify.com/v1'
+
+# 连接超时和读取超时（秒）
+SPOTIFY_CONNECT_TIMEOUT = float(os.getenv('SPOTIFY_CONNECT_TIMEOUT', '3.05'))
+SPOTIFY_READ_TIMEOUT = float(os.getenv('SPOTIFY_READ_TIMEOUT', '10'))
+# 连接池大小（每个 host 保持的 keep-alive 连接数）
+SPOTIFY_POOL_SIZE = int(os.getenv('SPOTIFY_POOL_SIZE', '20'))
+# 在 expires_in 到期前提前刷新令牌的秒数
+TOKEN_REFRESH_MARGIN = 60
+# 出站请求速率（次/秒）、突发上限，以及为拿到令牌或等待 Retry-After 最多等待的秒数
+SPOTIFY_RATE_LIMIT = float(os.getenv('SPOTIFY_RATE_LIMIT', '10'))
+SPOTIFY_RATE_BURST = float(os.getenv('SPOTIFY_RATE_BURST', '20'))
+SPOTIFY_MAX_WAIT = float(os.getenv('SPOTIFY_MAX_WAIT', '5'))
+# 429 后最多重试次数
+SPOTIFY_MAX_RETRIES = 2
+# 连续失败多少次后熔断，熔断多少秒后放行探测请求
+SPOTIFY_BREAKER_THRESHOLD = int(os.getenv('SPOTIFY_BREAKER_THRESHOLD', '5'))
+SPOTIFY_BREAKER_RESET = float(os.getenv('SPOTIFY_BREAKER_RESET', '30'))
+
+
+class SpotifyUnavailableError(requests.exceptions.RequestException):
+    """Spotify 正在限流或已熔断，请求未发出"""
+
+
+class SpotifyClient:
+    """共享的 Spotify 客户端：缓存访问令牌，复用 HTTP 连接池，出站请求统一限速和熔断"""
+
+    def __init__(self, pool_size=SPOTIFY_POOL_SIZE,
+                 timeout=(SPOTIFY_CONNECT_TIMEOUT, SPOTIFY_READ_TIMEOUT)):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+        self.limiter = AdaptiveRateLimiter(SPOTIFY_RATE_LIMIT, SPOTIFY_RATE_BURST)
+        self.breaker = CircuitBreaker(SPOTIFY_BREAKER_THRESHOLD, SPOTIFY_BREAKER_RESET)
+
+    def _send(self, method, url, **kwargs):
+        """所有出站请求的入口：熔断检查、令牌桶限速、处理 429 Retry-After"""
+        if not self.breaker.allow():
+            raise SpotifyUnavailableError("Spotify 服务暂不可用，请稍后重试")
+
+        for attempt in range(SPOTIFY_MAX_RETRIES + 1):
+            try:
+                self.limiter.acquire(SPOTIFY_MAX_WAIT)
+            except RateLimitExceeded as e:
+                raise SpotifyUnavailableError(f"Spotify 请求过于频繁，{e.wait_seconds:.0f} 秒后重试")
+
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.exceptions.RequestException:
+                self.breaker.record_failure()
+                raise
+
+            if response.status_code == 429:
+                # 被限流说明服务本身可用，不计入熔断失败
+                self.breaker.record_success()
+                try:
+                    retry_after = float(response.headers.get('Retry-After', 1))
+                except ValueError:
+                    retry_after = 1.0
+                self.limiter.on_throttled(retry_after)
+                logger.warning(f"Spotify 返回 429，Retry-After={retry_after} 秒")
+                if attempt < SPOTIFY_MAX_RETRIES and retry_after <= SPOTIFY_MAX_WAIT:
+                    continue
+                raise SpotifyUnavailableError(f"Spotify 请求过于频繁，{retry_after:.0f} 秒后重试")
+
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+                self.limiter.on_success()
+            return response
+
+    def _token_valid(self):
+        return self._token is not None and time.monotonic() < self._token_expires_at
+
+    def get_token(self):
+        """获取访问令牌，过期前复用缓存；并发请求只会触发一次刷新"""
+        if self._token_valid():
+            return self._token
+        with self._token_lock:
+            # 等锁期间其他线程可能已经刷新过
+            if self._token_valid():
+                return self._token
+            self._refresh_token()
+            return self._token
+
+    def _refresh_token(self):
+        client_id = os.getenv('SPOTIFY_CLIENT_ID')
+        client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
+        if not client_id or not client_secret:
+            raise ValueError("缺少 Spotify 客户端凭据")
+
+        auth_base64 = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+        headers = {
+            "Authorization": f"Basic {auth_base64}",
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+        response = self._send(
+            'POST',
+            SPOTIFY_TOKEN_URL,
+            headers=headers,
+            data={"grant_type": "client_credentials"}
+        )
+        if response.status_code != 200:
+            logger.error(f"获取 Spotify 令牌失败: {response.text}")
+        response.raise_for_status()
+
+        payload = response.json()
+        expires_in = int(payload.get('expires_in', 3600))
+        self._token = payload['access_token']
+        self._token_expires_at = time.monotonic() + max(0, expires_in - TOKEN_REFRESH_MARGIN)
+        logger.info(f"已刷新 Spotify 令牌，{expires_in} 秒后过期")
+
+    def invalidate_token(self, token=None):
+        """作废缓存的令牌（仅当缓存的仍是 token 时）"""
+        with self._token_lock:
+            if token is None or self._token == token:
+                self._token = None
+                self._token_expires_at = 0.0
+
+    def get(self, path, params=None):
+        """对 Spotify Web API 发起 GET 请求，返回 requests.Response"""
+        url = path if path.startswith('http') else f"{SPOTIFY_API_BASE}{path}"
+        token = self.get_token()
+        response = self._send('GET', url, headers={"Authorization": f"Bearer {token}"}, params=params)
+        if response.status_code == 401:
+            # 令牌被提前吊销，刷新后重试一次
+            logger.warning("Spotify 令牌已失效，重新获取后重试")
+            self.invalidate_token(token)
+            token = self.get_token()
+            response = self._send('GET', url, headers={"Authorization": f"Bearer {token}"}, params=params)
+        return response
+
+    def stats(self):
+        return {
+            'rate_limiter': self.limiter.stats(),
+            'circuit_breaker': self.breaker.stats()
+        }
+
+
+# 进程内共享的客户端实例
+spotify_client = SpotifyClient()
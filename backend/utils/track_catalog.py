@@ -0,0 +1,219 @@
+# backend/utils/track_catalog.py
+import os
+import logging
+import threading
+from datetime import date
+import numpy as np
+from database import db
+from models.track import Track
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 是否启用进程内列式曲库（similar-key/year/duration/structure 直接在内存中计算）
+TRACK_CATALOG_ENABLED = os.getenv('TRACK_CATALOG_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+INITIAL_CAPACITY = 1024
+BUILD_BATCH_SIZE = 5000
+MISSING = -1
+
+LOAD_COLUMNS = (
+    Track.id, Track.spotify_id, Track.key, Track.scale, Track.release_date,
+    Track.duration_ms, Track.popularity, Track.sections_hash
+)
+
+
+def hash_prefix(sections_hash):
+    """sections_hash 的前 60 位转为整数，便于向量化比较；无结构时为 MISSING"""
+    return int(sections_hash[:15], 16) if sections_hash else MISSING
+
+
+class TrackCatalog:
+    """每首歌一行的列式内存曲库，列为 NumPy 数组，行号即进程内的整数歌曲编号
+
+    启动时在后台线程加载；upload-chords 与专辑同步提交后调用 refresh 重新读取变化的歌曲。
+    查询用向量化掩码筛选、argpartition 取前 k 行，只把最终的 spotify_id 交给路由去数据库取整行。
+    未加载完成或歌曲不在曲库中（例如搜索时新写入的歌曲）时路由回退到数据库查询，见 has()。
+    结构指纹只比较 sha256 的前 60 位，碰撞概率可以忽略。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._app = None
+        self._ready = False
+        self._size = 0
+        self._rows = {}         # spotify_id -> 行号
+        self._spotify_ids = []  # 行号 -> spotify_id
+        self._keys = {}         # 调性名 -> 编号
+        self._scales = {}       # 调式名 -> 编号
+        self._allocate(INITIAL_CAPACITY)
+
+    def _allocate(self, capacity):
+        self.ids = np.full(capacity, MISSING, dtype=np.int64)
+        self.key = np.full(capacity, MISSING, dtype=np.int16)
+        self.scale = np.full(capacity, MISSING, dtype=np.int16)
+        self.year = np.full(capacity, MISSING, dtype=np.int16)
+        self.release_day = np.full(capacity, MISSING, dtype=np.int32)  # date.toordinal()
+        self.duration_ms = np.full(capacity, MISSING, dtype=np.int32)
+        self.popularity = np.full(capacity, MISSING, dtype=np.int16)
+        self.structure = np.full(capacity, MISSING, dtype=np.int64)
+
+    def _grow(self):
+        columns = ('ids', 'key', 'scale', 'year', 'release_day', 'duration_ms', 'popularity', 'structure')
+        old = {name: getattr(self, name) for name in columns}
+        self._allocate(len(self.ids) * 2)
+        for name, values in old.items():
+            getattr(self, name)[:len(values)] = values
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def has(self, spotify_id):
+        return self._ready and spotify_id in self._rows
+
+    def init_app(self, app, enabled=TRACK_CATALOG_ENABLED):
+        self._app = app
+        if not enabled:
+            return
+        threading.Thread(target=self._load_in_context, name='track-catalog', daemon=True).start()
+
+    def _load_in_context(self):
+        try:
+            with self._app.app_context():
+                self.load()
+        except Exception as e:
+            logger.error(f"加载列式曲库失败: {str(e)}")
+
+    def load(self):
+        """从 tracks 表全量加载"""
+        rows = db.session.query(*LOAD_COLUMNS).execution_options(yield_per=BUILD_BATCH_SIZE)
+        with self._lock:
+            self._size = 0
+            self._rows.clear()
+            self._spotify_ids.clear()
+            self._allocate(INITIAL_CAPACITY)
+            for row in rows:
+                self._put(row)
+            self._ready = True
+            logger.info(f"列式曲库加载完成: {self._size} 首歌曲")
+
+    def refresh(self, session, spotify_ids):
+        """歌曲写入提交后重新读取这些歌曲（未启用或未加载完成时跳过）"""
+        if not self._ready or not spotify_ids:
+            return
+        try:
+            rows = session.query(*LOAD_COLUMNS).filter(Track.spotify_id.in_(list(spotify_ids))).all()
+        except Exception as e:
+            logger.error(f"刷新列式曲库失败: {str(e)}")
+            return
+        with self._lock:
+            for row in rows:
+                self._put(row)
+
+    def _code(self, vocabulary, value):
+        if value is None:
+            return MISSING
+        return vocabulary.setdefault(value, len(vocabulary))
+
+    def _put(self, row):
+        position = self._rows.get(row.spotify_id)
+        if position is None:
+            if self._size == len(self.ids):
+                self._grow()
+            position = self._size
+            self._size += 1
+            self._rows[row.spotify_id] = position
+            self._spotify_ids.append(row.spotify_id)
+        release_date = row.release_date
+        self.ids[position] = row.id
+        self.key[position] = self._code(self._keys, row.key)
+        self.scale[position] = self._code(self._scales, row.scale)
+        self.year[position] = release_date.year if release_date else MISSING
+        self.release_day[position] = release_date.toordinal() if release_date else MISSING
+        self.duration_ms[position] = row.duration_ms if row.duration_ms is not None else MISSING
+        self.popularity[position] = row.popularity if row.popularity is not None else MISSING
+        self.structure[position] = hash_prefix(row.sections_hash)
+
+    def _lookup(self, spotify_id):
+        """返回 (行号, 除当前歌曲外的行掩码)；当前歌曲不在曲库中时行号为 None"""
+        position = self._rows.get(spotify_id)
+        others = np.ones(self._size, dtype=bool)
+        if position is not None:
+            others[position] = False
+        return position, others
+
+    def _nearest(self, values, mask, target, k):
+        """mask 内与 target 距离最小的 k 行，按距离升序（同距离时较小的值优先，与 nearest_neighbors 一致）"""
+        candidates = np.flatnonzero(mask)
+        selected = values[candidates].astype(np.int64)
+        # 排序键：距离 * 2，目标值以上的再加 1，这样第 k 名附近同距离的行也按较小值优先截断
+        rank = np.abs(selected - target) * 2 + (selected > target)
+        if len(candidates) > k:
+            top = np.argpartition(rank, k - 1)[:k]
+            candidates, rank = candidates[top], rank[top]
+        return [self._spotify_ids[position] for position in candidates[np.argsort(rank, kind='stable')]]
+
+    def similar_key(self, spotify_id, k):
+        """与当前歌曲调性、调式相同的 k 首歌"""
+        with self._lock:
+            position, others = self._lookup(spotify_id)
+            if position is None or self.key[position] == MISSING or self.scale[position] == MISSING:
+                return []
+            mask = others & (self.key[:self._size] == self.key[position]) & (self.scale[:self._size] == self.scale[position])
+            return [self._spotify_ids[row] for row in np.flatnonzero(mask)[:k]]
+
+    def similar_structure(self, spotify_id, k):
+        """与当前歌曲结构指纹相同的 k 首歌，按 id 升序"""
+        with self._lock:
+            position, others = self._lookup(spotify_id)
+            if position is None or self.structure[position] == MISSING:
+                return []
+            candidates = np.flatnonzero(others & (self.structure[:self._size] == self.structure[position]))
+            candidates = candidates[np.argsort(self.ids[candidates], kind='stable')][:k]
+            return [self._spotify_ids[row] for row in candidates]
+
+    def release_date(self, spotify_id):
+        with self._lock:
+            position = self._rows.get(spotify_id)
+            if position is None or self.release_day[position] == MISSING:
+                return None
+            return date.fromordinal(int(self.release_day[position]))
+
+    def duration(self, spotify_id):
+        with self._lock:
+            position = self._rows.get(spotify_id)
+            if position is None or self.duration_ms[position] == MISSING:
+                return None
+            return int(self.duration_ms[position])
+
+    def similar_year(self, spotify_id, year, k):
+        """同一年发行的 k 首最热门的歌，按热度降序（热度为空的在前，与 ORDER BY popularity DESC 一致），同热度按 id 升序"""
+        with self._lock:
+            _, others = self._lookup(spotify_id)
+            candidates = np.flatnonzero(others & (self.year[:self._size] == year))
+            popularity = self.popularity[candidates].astype(np.int32)
+            popularity[popularity == MISSING] = np.iinfo(np.int32).max
+            order = np.lexsort((self.ids[candidates], -popularity))[:k]
+            return [self._spotify_ids[position] for position in candidates[order]]
+
+    def similar_duration(self, spotify_id, duration_ms, min_duration, max_duration, k):
+        """时长在 [min_duration, max_duration] 内、与 duration_ms 最接近的 k 首歌"""
+        with self._lock:
+            _, others = self._lookup(spotify_id)
+            durations = self.duration_ms[:self._size]
+            mask = others & (durations != MISSING) & (durations >= min_duration) & (durations <= max_duration)
+            return self._nearest(durations, mask, duration_ms, k)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ready': self._ready,
+                'tracks': self._size,
+                'bytes': sum(array.nbytes for array in (
+                    self.ids, self.key, self.scale, self.year, self.release_day,
+                    self.duration_ms, self.popularity, self.structure
+                ))
+            }
+
+
+track_catalog = TrackCatalog()
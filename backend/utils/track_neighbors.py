@@ -0,0 +1,360 @@
+# backend/utils/track_neighbors.py
+import os
+import logging
+import queue
+import threading
+from sqlalchemy import and_, func, or_, select, text
+from database import db
+from models.track import Track, RELEASE_YEAR, YEAR_POPULARITY_ORDER
+from models.track_neighbor import TrackNeighbor
+from models.chord_vocabulary import ChordVocabulary
+from utils.chord_index import chord_index, parse_chords, MIN_COMMON_CHORDS, ORDER_PREFIX_LENGTH, MAJOR_CHORDS
+from utils.chord_similarity import similar_tracks_sql, SIMILAR_CHORDS_BACKEND
+from utils.nearest import nearest_neighbors
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 是否由 track_neighbors 表响应 similar-* 并在写入后增量刷新（需先运行 flask --app app compute-neighbors）
+TRACK_NEIGHBORS_ENABLED = os.getenv('TRACK_NEIGHBORS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+TRACK_NEIGHBORS_QUEUE_SIZE = int(os.getenv('TRACK_NEIGHBORS_QUEUE_SIZE', '1000'))
+NEIGHBOR_BATCH_SIZE = 500
+# 每个维度保存的数量与对应路由返回的数量一致
+NEIGHBOR_LIMITS = {'key': 10, 'structure': 10, 'chords': 12, 'duration': 15, 'year': 12}
+DURATION_RANGE_MS = 30000  # similar-duration 默认的 ±30 秒
+
+# 排序分数：key/structure 为歌曲 id，duration 为距离，都是越小越靠前；chords 为相似度、year 为热度，越大越靠前
+# 反向查找 chords：当前被写入的歌曲作为候选时，各首歌对它的相似度（评分同 SIMILAR_CHORDS_SQL，查询方与候选方互换）
+CHORDS_ENTERING_SQL = text(f"""
+    SELECT t.id
+    FROM tracks t
+    JOIN track_neighbors n ON n.track_id = t.id AND n.facet = 'chords'
+    CROSS JOIN LATERAL (
+        SELECT count(DISTINCT c) AS common, coalesce(bool_or(c = ANY(:major_codes)), false) AS major
+        FROM unnest(CAST(:codes AS integer[])) AS c
+        WHERE c = ANY(t.chord_codes)
+    ) m
+    CROSS JOIN LATERAL (
+        SELECT count(*) AS order_matches
+        FROM generate_series(1, least({ORDER_PREFIX_LENGTH}, cardinality(t.chord_codes), cardinality(CAST(:codes AS integer[])))) AS i
+        WHERE t.chord_codes[i] = (CAST(:codes AS integer[]))[i]
+    ) o
+    WHERE t.chord_codes && CAST(:codes AS integer[])
+      AND t.id != :track_id
+      AND m.common >= {MIN_COMMON_CHORDS}
+      AND (n.cutoff IS NULL
+           OR m.common::float8 / cardinality(CAST(:codes AS integer[]))
+              + o.order_matches * CAST(0.1 AS double precision)
+              + CASE WHEN m.major THEN CAST(0.1 AS double precision) ELSE 0 END >= n.cutoff)
+""")
+
+
+def _group_neighbors(session, track, facet, cache, group_key, *conditions):
+    """同组（同调性或同结构）按 id 取前 limit + 1 首，组内歌曲共用一份，去掉自己后取前 limit 首"""
+    limit = NEIGHBOR_LIMITS[facet]
+    group_key = (facet, group_key)
+    group = cache.get(group_key)
+    if group is None:
+        group = cache[group_key] = [
+            track_id for track_id, in session.query(Track.id).filter(*conditions).order_by(Track.id).limit(limit + 1)
+        ]
+    return [(track_id, track_id) for track_id in group if track_id != track.id][:limit]
+
+
+def key_neighbors(session, track, cache):
+    if not track.key or not track.scale:
+        return []
+    return _group_neighbors(session, track, 'key', cache, (track.key, track.scale),
+                            Track.key == track.key, Track.scale == track.scale)
+
+
+def structure_neighbors(session, track, cache):
+    if not track.sections_hash:
+        return []
+    return _group_neighbors(session, track, 'structure', cache, track.sections_hash,
+                            Track.sections_hash == track.sections_hash)
+
+
+def chord_neighbors(session, track, cache):
+    chords = parse_chords(track.chords)
+    if not chords:
+        return []
+    limit = NEIGHBOR_LIMITS['chords']
+    if SIMILAR_CHORDS_BACKEND == 'memory':
+        ranked = chord_index.similar(track.spotify_id, chords, limit=limit)
+    else:
+        ranked = similar_tracks_sql(session, track.spotify_id, chords, limit=limit, chord_codes=track.chord_codes)
+    ids = dict(session.query(Track.spotify_id, Track.id).filter(
+        Track.spotify_id.in_([spotify_id for spotify_id, _ in ranked])
+    )) if ranked else {}
+    return [(ids[spotify_id], score) for spotify_id, score in ranked if spotify_id in ids]
+
+
+def duration_neighbors(session, track, cache):
+    if not track.duration_ms:
+        return []
+    target = track.duration_ms
+    rows = nearest_neighbors(
+        session, Track, Track.duration_ms, target, NEIGHBOR_LIMITS['duration'],
+        filters=(Track.id != track.id,),
+        lower=max(0, target - DURATION_RANGE_MS), upper=target + DURATION_RANGE_MS
+    )
+    return [(row.id, abs(row.duration_ms - target)) for row in rows]
+
+
+def year_neighbors(session, track, cache):
+    """同一年最热门的 limit + 1 首，年内歌曲共用一份，去掉自己后取前 limit 首"""
+    if not track.release_date:
+        return []
+    limit = NEIGHBOR_LIMITS['year']
+    group_key = ('year', track.release_date.year)
+    group = cache.get(group_key)
+    if group is None:
+        group = cache[group_key] = session.query(Track.id, Track.popularity).filter(
+            RELEASE_YEAR == track.release_date.year
+        ).order_by(*YEAR_POPULARITY_ORDER).limit(limit + 1).all()
+    return [(track_id, popularity) for track_id, popularity in group if track_id != track.id][:limit]
+
+
+FACETS = {
+    'key': key_neighbors,
+    'structure': structure_neighbors,
+    'chords': chord_neighbors,
+    'duration': duration_neighbors,
+    'year': year_neighbors,
+}
+
+
+def _with_row(session, facet):
+    """已有 facet 维度结果的歌曲"""
+    return session.query(Track.id).join(
+        TrackNeighbor, and_(TrackNeighbor.track_id == Track.id, TrackNeighbor.facet == facet)
+    )
+
+
+def _entering(session, facet, track, *conditions):
+    return [track_id for track_id, in _with_row(session, facet).filter(Track.id != track.id, *conditions)]
+
+
+def key_entering(session, track):
+    if not track.key or not track.scale:
+        return []
+    return _entering(session, 'key', track, Track.key == track.key, Track.scale == track.scale,
+                     or_(TrackNeighbor.cutoff.is_(None), TrackNeighbor.cutoff > track.id))
+
+
+def structure_entering(session, track):
+    if not track.sections_hash:
+        return []
+    return _entering(session, 'structure', track, Track.sections_hash == track.sections_hash,
+                     or_(TrackNeighbor.cutoff.is_(None), TrackNeighbor.cutoff > track.id))
+
+
+def chord_entering(session, track):
+    codes = [code for code in (track.chord_codes or []) if code]
+    if not codes:
+        return []
+    major_codes = [code for code, in session.query(ChordVocabulary.id).filter(ChordVocabulary.symbol.in_(MAJOR_CHORDS))]
+    rows = session.execute(CHORDS_ENTERING_SQL, {
+        'codes': codes,
+        'major_codes': major_codes or [0],
+        'track_id': track.id
+    })
+    return [row.id for row in rows]
+
+
+def duration_entering(session, track):
+    if not track.duration_ms:
+        return []
+    target = track.duration_ms
+    return _entering(session, 'duration', track,
+                     Track.duration_ms.between(target - DURATION_RANGE_MS, target + DURATION_RANGE_MS),
+                     or_(TrackNeighbor.cutoff.is_(None), func.abs(Track.duration_ms - target) <= TrackNeighbor.cutoff))
+
+
+def year_entering(session, track):
+    if not track.release_date:
+        return []
+    conditions = [RELEASE_YEAR == track.release_date.year]
+    if track.popularity is not None:
+        # 热度为空的排在最前，总能挤进列表；否则热度不低于最后一名时才可能挤进
+        conditions.append(or_(TrackNeighbor.cutoff.is_(None), TrackNeighbor.cutoff <= track.popularity))
+    return _entering(session, 'year', track, *conditions)
+
+
+# 被写入的歌曲可能挤进哪些歌曲的列表：与它同组或在范围内，且列表未满或它的排序分数不差于最后一名
+ENTERING = {
+    'key': key_entering,
+    'structure': structure_entering,
+    'chords': chord_entering,
+    'duration': duration_entering,
+    'year': year_entering,
+}
+
+
+def lookup_statement(spotify_id, facet):
+    return select(TrackNeighbor.neighbor_ids).join(Track, Track.id == TrackNeighbor.track_id).where(
+        Track.spotify_id == spotify_id, TrackNeighbor.facet == facet
+    )
+
+
+class NeighborTable:
+    """similar-* 的预计算结果（track_neighbors 表）：读取与写入后的增量刷新
+
+    全量结果由命令行 compute-neighbors 计算；之后歌曲写入提交后把 spotify_id 入队，后台线程只重算受影响的行：
+    被写入的歌曲自己、列表中含有它的歌曲（GIN 索引反查），以及它现在可能挤进其列表的歌曲。
+    未启用或某首歌还没有结果时路由回退到实时计算；刷新完成前读到的是写入前的结果。
+    """
+
+    def __init__(self, maxsize=TRACK_NEIGHBORS_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._app = None
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'refreshed_tracks': 0,
+            'recomputed_rows': 0,
+            'failed_refreshes': 0,
+            'rejected': 0
+        }
+
+    def init_app(self, app, enabled=TRACK_NEIGHBORS_ENABLED):
+        self._app = app
+        if not enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='track-neighbors', daemon=True)
+        self._thread.start()
+        logger.info("预计算相似歌曲表已启用")
+
+    @property
+    def enabled(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._counters[name] += amount
+
+    def lookup(self, session, spotify_id, facet):
+        """返回预计算的相似歌曲（Track 列表，已排好序）；未启用或没有这首歌的结果时返回 None"""
+        if not self.enabled:
+            return None
+        neighbor_ids = session.execute(lookup_statement(spotify_id, facet)).scalar()
+        if neighbor_ids is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return Track.in_order(session, neighbor_ids, Track.id)
+
+    def lookup_many(self, session, track_id, facets):
+        """一次读取一首歌多个维度的预计算结果，返回 {facet: Track 列表}；没有结果的维度不在返回值中"""
+        if not self.enabled or not facets:
+            return {}
+        rows = session.query(TrackNeighbor.facet, TrackNeighbor.neighbor_ids).filter(
+            TrackNeighbor.track_id == track_id, TrackNeighbor.facet.in_(list(facets))
+        ).all()
+        self._count('hits', len(rows))
+        self._count('misses', len(set(facets)) - len(rows))
+        neighbor_ids = {neighbor_id for _, ids in rows for neighbor_id in ids}
+        tracks_by_id = {
+            track.id: track for track in session.query(Track).filter(Track.id.in_(neighbor_ids))
+        } if neighbor_ids else {}
+        return {facet: [tracks_by_id[neighbor_id] for neighbor_id in ids if neighbor_id in tracks_by_id] for facet, ids in rows}
+
+    def enqueue(self, spotify_ids):
+        """歌曲写入提交后调用；队列已满时丢弃（这些行保持旧结果，直到下次全量计算）"""
+        spotify_ids = list(spotify_ids)
+        if not self.enabled or not spotify_ids:
+            return
+        try:
+            self._queue.put_nowait(spotify_ids)
+        except queue.Full:
+            self._count('rejected')
+            logger.warning(f"相似歌曲刷新队列已满，丢弃 {len(spotify_ids)} 首歌曲")
+
+    def _run(self):
+        while True:
+            spotify_ids = set(self._queue.get())
+            while True:
+                try:
+                    spotify_ids.update(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self._app.app_context():
+                try:
+                    self.refresh(db.session, spotify_ids)
+                except Exception as e:
+                    db.session.rollback()
+                    self._count('failed_refreshes')
+                    logger.error(f"刷新相似歌曲失败: {str(e)}")
+
+    def refresh(self, session, spotify_ids):
+        """重算受这些歌曲写入影响的行并提交，返回重算的行数"""
+        tracks = session.query(Track).filter(Track.spotify_id.in_(list(spotify_ids))).all()
+        if not tracks:
+            return 0
+        written_ids = [track.id for track in tracks]
+        affected = {facet: set(written_ids) for facet in FACETS}
+        for track_id, facet in session.query(TrackNeighbor.track_id, TrackNeighbor.facet).filter(
+            TrackNeighbor.neighbor_ids.overlap(written_ids)
+        ):
+            affected[facet].add(track_id)
+        for track in tracks:
+            for facet, entering in ENTERING.items():
+                affected[facet].update(entering(session, track))
+
+        all_ids = set().union(*affected.values())
+        tracks_by_id = {track.id: track for track in session.query(Track).filter(Track.id.in_(all_ids))}
+        cache = {}
+        rows = [
+            self._row(session, tracks_by_id[track_id], facet, cache)
+            for facet, track_ids in affected.items()
+            for track_id in track_ids if track_id in tracks_by_id
+        ]
+        TrackNeighbor.store(session, rows)
+        session.commit()
+        self._count('refreshed_tracks', len(tracks))
+        self._count('recomputed_rows', len(rows))
+        logger.info(f"刷新相似歌曲: 写入 {len(tracks)} 首，重算 {len(rows)} 行")
+        return len(rows)
+
+    def _row(self, session, track, facet, cache):
+        neighbors = FACETS[facet](session, track, cache)
+        full = len(neighbors) >= NEIGHBOR_LIMITS[facet]
+        return {
+            'track_id': track.id,
+            'facet': facet,
+            'neighbor_ids': [track_id for track_id, _ in neighbors],
+            # 最后一名的分数为空（热度为空）时不记录，之后写入同组歌曲总会重算这一行
+            'cutoff': float(neighbors[-1][1]) if full and neighbors[-1][1] is not None else None
+        }
+
+    def compute_all(self, session, batch_size=NEIGHBOR_BATCH_SIZE):
+        """按 id 分批全量计算所有歌曲的所有维度，每批提交一次，返回歌曲数"""
+        cache = {}
+        last_id = 0
+        total = 0
+        while True:
+            tracks = session.query(Track).filter(Track.id > last_id).order_by(Track.id).limit(batch_size).all()
+            if not tracks:
+                break
+            TrackNeighbor.store(session, [
+                self._row(session, track, facet, cache) for track in tracks for facet in FACETS
+            ])
+            session.commit()
+            last_id = tracks[-1].id
+            total += len(tracks)
+            logger.info(f"已计算 {total} 首歌曲的相似歌曲")
+        return total
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                **self._counters,
+                'enabled': self.enabled,
+                'queue_depth': self._queue.qsize()
+            }
+
+
+neighbor_table = NeighborTable()
@@ -0,0 +1,171 @@
+# backend/utils/write_behind.py
+import os
+import atexit
+import logging
+import queue
+import threading
+import time
+from database import db
+from utils.bulk import insert_ignore
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 是否启用异步写入（默认关闭：启用后，后台提交前刚搜索到的歌曲、专辑在数据库中还读不到）
+# 队列上限（批次数）、每批最多行数、空闲时的刷新间隔（秒）
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+WRITE_BEHIND_MAXSIZE = int(os.getenv('WRITE_BEHIND_MAXSIZE', '1000'))
+WRITE_BEHIND_BATCH_ROWS = int(os.getenv('WRITE_BEHIND_BATCH_ROWS', '500'))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '0.5'))
+
+
+class WriteBehindQueue:
+    """进程内异步写入队列：请求线程只负责入队，后台线程批量 INSERT ... ON CONFLICT DO NOTHING"""
+
+    def __init__(self, maxsize=WRITE_BEHIND_MAXSIZE, batch_rows=WRITE_BEHIND_BATCH_ROWS,
+                 flush_interval=WRITE_BEHIND_FLUSH_INTERVAL):
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._app = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._pending_rows = 0
+        self._counters = {
+            'enqueued_rows': 0,
+            'written_rows': 0,
+            'failed_rows': 0,
+            'rejected': 0,
+            'batches': 0
+        }
+        self._last_batch_ms = 0.0
+        self._max_batch_ms = 0.0
+        self._total_batch_ms = 0.0
+
+    def init_app(self, app, enabled=WRITE_BEHIND_ENABLED):
+        self._app = app
+        if not enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+        logger.info("异步写入队列已启动")
+
+    @property
+    def enabled(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stopping.is_set()
+
+    def enqueue(self, writes):
+        """writes 为 [(Model, rows), ...]；入队成功返回 True，未启用或队列已满返回 False（调用方应同步写入）"""
+        writes = [(model, rows) for model, rows in writes if rows]
+        if not writes:
+            return True
+        if not self.enabled:
+            return False
+        row_count = sum(len(rows) for _, rows in writes)
+        with self._stats_lock:
+            self._pending_rows += row_count
+        try:
+            self._queue.put_nowait(writes)
+        except queue.Full:
+            with self._stats_lock:
+                self._pending_rows -= row_count
+                self._counters['rejected'] += 1
+            logger.warning("异步写入队列已满，改为同步写入")
+            return False
+        with self._stats_lock:
+            self._counters['enqueued_rows'] += row_count
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+                continue
+
+            items = [first]
+            row_count = sum(len(rows) for _, rows in first)
+            while row_count < self.batch_rows:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                items.append(item)
+                row_count += sum(len(rows) for _, rows in item)
+
+            self._write_batch(items, row_count)
+            for _ in items:
+                self._queue.task_done()
+
+    def _insert(self, items):
+        # 按表合并，每张表一条 INSERT，全部放在一个事务里
+        grouped = {}
+        for writes in items:
+            for model, rows in writes:
+                grouped.setdefault(model, []).extend(rows)
+        try:
+            for model, rows in grouped.items():
+                insert_ignore(db.session, model, rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _write_batch(self, items, row_count):
+        started = time.perf_counter()
+        failed_rows = 0
+        with self._app.app_context():
+            try:
+                self._insert(items)
+            except Exception as e:
+                # 合并后的批次失败时逐个入队项重试，一条坏数据不会连带丢弃其他请求的数据
+                logger.warning(f"异步批量写入失败（{row_count} 行），改为逐项重试: {str(e)}")
+                for writes in items:
+                    try:
+                        self._insert([writes])
+                    except Exception as item_error:
+                        item_rows = sum(len(rows) for _, rows in writes)
+                        failed_rows += item_rows
+                        logger.error(f"异步写入失败（{item_rows} 行）: {str(item_error)}")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        with self._stats_lock:
+            self._pending_rows -= row_count
+            self._counters['batches'] += 1
+            self._counters['written_rows'] += row_count - failed_rows
+            self._counters['failed_rows'] += failed_rows
+            self._last_batch_ms = elapsed_ms
+            self._max_batch_ms = max(self._max_batch_ms, elapsed_ms)
+            self._total_batch_ms += elapsed_ms
+
+    def shutdown(self, timeout=10):
+        """停止接收新数据，并等待后台线程写完队列中剩余的数据"""
+        if self._thread is None or self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"异步写入队列未能在 {timeout} 秒内写完，剩余 {self._pending_rows} 行")
+        else:
+            logger.info("异步写入队列已全部写入")
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self._counters['batches']
+            return {
+                **self._counters,
+                'enabled': self.enabled,
+                'queue_depth': self._queue.qsize(),
+                'pending_rows': self._pending_rows,
+                'last_batch_ms': round(self._last_batch_ms, 2),
+                'max_batch_ms': round(self._max_batch_ms, 2),
+                'avg_batch_ms': round(self._total_batch_ms / batches, 2) if batches else 0.0
+            }
+
+
+# 进程内共享的异步写入队列
+write_behind = WriteBehindQueue()
@@ -1,7 +1,7 @@
 'use client';
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useCallback } from 'react';
 import axios from 'axios';
-import { Card, Box, Typography, Stack, CardHeader, Skeleton } from '@mui/material';
+import { Card, Box, Typography, Stack, CardHeader, Skeleton, Button } from '@mui/material';
 import { CommentInput } from 'src/sections/album/comment-input';
 import { ProfilePostItem } from 'src/sections/album/profile-post-item';
 
@@ -11,6 +11,7 @@ export default function CommentsSection({ album }) {
   const [comments, setComments] = useState({ count: 0, items: [] });
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     if (!album?.spotify_id) {
@@ -29,6 +30,7 @@ export default function CommentsSection({ album }) {
         const response = await axios.get(
           `http://localhost:8000/albums/spotify/${album.spotify_id}/comments`,
           {
+            params: { include_total: true }, // 只在第一页请求评论总数
             headers: { 'Content-Type': 'application/json' },
             timeout: 10000, // 设置 10 秒超时
             signal: controller.signal,
@@ -59,6 +61,32 @@ export default function CommentsSection({ album }) {
     };
   }, [album]);
 
+  // 按 next_cursor 加载下一页（count 为总数，items 为已加载的部分）
+  const nextCursor = comments.pagination?.next_cursor;
+  const handleLoadMore = useCallback(async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(
+        `http://localhost:8000/albums/spotify/${album.spotify_id}/comments`,
+        {
+          params: { cursor: nextCursor },
+          headers: { 'Content-Type': 'application/json' },
+          timeout: 10000, // 设置 10 秒超时
+        }
+      );
+      setComments((prev) => ({
+        ...response.data,
+        count: prev.count,
+        items: [...prev.items, ...response.data.items],
+      }));
+    } catch (err) {
+      setError(err.message || '无法加载评论');
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [album, nextCursor]);
+
   return (
     <Card sx={{ p: 3 }}>
       <CardHeader
@@ -99,6 +127,11 @@ export default function CommentsSection({ album }) {
             ))}
           </Stack>
         )}
+        {!loading && !error && nextCursor && (
+          <Button fullWidth variant="outlined" onClick={handleLoadMore} disabled={loadingMore} sx={{ mt: 3 }}>
+            {loadingMore ? '加载中...' : '加载更多'}
+          </Button>
+        )}
         {loading ? (
           <Skeleton variant="rectangular" height={40} sx={{ mt: 3 }} />
         ) : (
@@ -1,8 +1,8 @@
 'use client';
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useCallback } from 'react';
 import axios from 'axios';
 import { varAlpha } from 'minimal-shared/utils';
-import { Box, Card, Stack, Avatar, Typography, CardHeader, Skeleton, Rating } from '@mui/material';
+import { Box, Card, Stack, Avatar, Typography, CardHeader, Skeleton, Rating, Button } from '@mui/material';
 import { fDate } from 'src/utils/format-time';
 import { useMockedUser } from 'src/auth/hooks';
 
@@ -13,6 +13,7 @@ export default function RatingsSection({ album }) {
   const [ratings, setRatings] = useState({ count: 0, items: [] });
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     if (!album?.spotify_id) {
@@ -61,6 +62,31 @@ export default function RatingsSection({ album }) {
     };
   }, [album]);
 
+  // 按 next_cursor 加载下一页（count 为总数，items 为已加载的部分）
+  const nextCursor = ratings.pagination?.next_cursor;
+  const handleLoadMore = useCallback(async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(
+        `http://localhost:8000/albums/spotify/${album.spotify_id}/ratings`,
+        {
+          params: { cursor: nextCursor },
+          headers: { 'Content-Type': 'application/json' },
+          timeout: 10000, // 设置 10 秒超时
+        }
+      );
+      setRatings((prev) => ({
+        ...response.data,
+        items: [...prev.items, ...response.data.items],
+      }));
+    } catch (err) {
+      setError(err.message || '无法加载评测');
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [album, nextCursor]);
+
   const renderRatingItem = (rating) => (
     <Box sx={{ gap: 2, display: 'flex' }}>
       <Avatar
@@ -122,6 +148,11 @@ export default function RatingsSection({ album }) {
             ))}
           </Stack>
         )}
+        {!loading && !error && nextCursor && (
+          <Button fullWidth variant="outlined" onClick={handleLoadMore} disabled={loadingMore} sx={{ mt: 3 }}>
+            {loadingMore ? '加载中...' : '加载更多'}
+          </Button>
+        )}
       </Box>
     </Card>
   );
@@ -85,6 +85,7 @@ export function AlbumView({ album }) {
   const [comments, setComments] = useState({ count: 0, items: [] });
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [message, setMessage] = useState('');
   const [rating, setRating] = useState(0);
   const [review, setReview] = useState('');
@@ -112,6 +113,7 @@ export function AlbumView({ album }) {
           const response = await axios.get(
             `http://localhost:8000/albums/spotify/${album.spotify_id}/comments`,
             {
+              params: { include_total: true }, // 只在第一页请求评论总数
               headers: {
                 'Content-Type': 'application/json',
               },
@@ -134,6 +136,33 @@ export function AlbumView({ album }) {
     }
   }, [selectedTab, album]);
 
+  // 按 next_cursor 加载下一页评论（count 为总数，items 为已加载的部分）
+  const nextCursor = comments.pagination?.next_cursor;
+  const handleLoadMoreComments = useCallback(async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(
+        `http://localhost:8000/albums/spotify/${album.spotify_id}/comments`,
+        {
+          params: { cursor: nextCursor },
+          headers: {
+            'Content-Type': 'application/json',
+          },
+        }
+      );
+      setComments((prev) => ({
+        ...response.data,
+        count: prev.count,
+        items: [...prev.items, ...response.data.items],
+      }));
+    } catch (err) {
+      setError(err.message);
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [album, nextCursor]);
+
   // 处理评论输入
   const handleChangeMessage = useCallback((event) => {
     setMessage(event.target.value);
@@ -162,9 +191,11 @@ export function AlbumView({ album }) {
         throw new Error(`HTTP error! Status: ${response.status}`);
       }
 
+      // 评论按从新到旧排列，新评论放在最前
       setComments((prev) => ({
+        ...prev,
         count: prev.count + 1,
-        items: [...prev.items, response.data],
+        items: [response.data, ...prev.items],
       }));
       setMessage('');
       setRating(0); // 清空评分
@@ -452,6 +483,11 @@ export function AlbumView({ album }) {
                 ))}
               </Stack>
             )}
+            {!loading && !error && nextCursor && (
+              <Button fullWidth variant="outlined" onClick={handleLoadMoreComments} disabled={loadingMore} sx={{ mt: 3 }}>
+                {loadingMore ? '加载中...' : '加载更多'}
+              </Button>
+            )}
             <Box
               sx={{
                 gap: 2,